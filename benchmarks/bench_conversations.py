@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Benchmark the conversation store: memory per active session and context retrieval
+
+Compares keeping full transcripts as lists of dicts (what a naive chat
+service does) with ``ConversationStore``'s fixed window of slotted turns
+plus a rolling summary. Memory is measured with tracemalloc after filling
+``--sessions`` sessions with ``--turns`` turns each; latency is the time for
+``context()`` with the default token budget.
+
+Usage: python benchmarks/bench_conversations.py [--sessions 2000] [--turns 60] [--sqlite]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tutor_stack_core.conversations import ConversationStore
+
+WORDS = "the a student asks why how fraction equals denominator numerator solve step".split()
+
+
+def utterance(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 60))) + "."
+
+
+def transcripts(sessions: int, turns: int):
+    rng = random.Random(42)
+    for s in range(sessions):
+        yield f"student-{s}:conv", [
+            ("user" if t % 2 == 0 else "assistant", utterance(rng)) for t in range(turns)
+        ]
+
+
+def naive_memory(sessions: int, turns: int) -> int:
+    tracemalloc.start()
+    store = {}
+    for session, history in transcripts(sessions, turns):
+        store[session] = [{"role": role, "text": text} for role, text in history]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size
+
+
+async def store_memory(sessions: int, turns: int, sqlite_path):
+    # Transcripts are generated while tracing, as in naive_memory; text that leaves
+    # the window is freed and no longer counted
+    tracemalloc.start()
+    store = ConversationStore(max_sessions=sessions, sqlite_path=sqlite_path)
+    for session, history in transcripts(sessions, turns):
+        for role, text in history:
+            await store.append(session, role, text)
+    del history
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, store
+
+
+async def main(args):
+    print(f"{args.sessions} sessions x {args.turns} turns")
+    naive = naive_memory(args.sessions, args.turns)
+    print(f"  full transcripts      {naive / args.sessions / 1024:8.1f} KiB/session")
+
+    with tempfile.TemporaryDirectory() as directory:
+        sqlite_path = os.path.join(directory, "chat.db") if args.sqlite else None
+        size, store = await store_memory(args.sessions, args.turns, sqlite_path)
+        print(f"  ConversationStore     {size / args.sessions / 1024:8.1f} KiB/session")
+
+        sessions = [f"student-{s}:conv" for s in range(args.sessions)]
+        timings = []
+        for session in random.Random(1).choices(sessions, k=args.lookups):
+            start = time.perf_counter()
+            context = await store.context(session)
+            timings.append((time.perf_counter() - start) * 1e6)
+        timings.sort()
+        print(
+            f"  context() p50 {statistics.median(timings):.1f} us,"
+            f" p99 {timings[int(len(timings) * 0.99)]:.1f} us"
+            f" ({len(context.turns)} turns, {context.tokens} tokens)"
+        )
+
+        if args.sqlite:
+            # Cold path: every lookup misses memory and reloads the window from SQLite
+            cold = ConversationStore(max_sessions=1, sqlite_path=sqlite_path)
+            timings = []
+            for session in random.Random(2).choices(sessions, k=min(args.lookups, 2000)):
+                start = time.perf_counter()
+                await cold.context(session)
+                timings.append((time.perf_counter() - start) * 1e6)
+            timings.sort()
+            print(
+                f"  evicted context() p50 {statistics.median(timings):.1f} us,"
+                f" p99 {timings[int(len(timings) * 0.99)]:.1f} us"
+            )
+            cold.close()
+        store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    parser.add_argument("--sqlite", action="store_true", help="Also persist and time reloads")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Benchmark JSON response rendering: stock JSONResponse vs orjson FastJSONResponse
+
+Payloads approximate the large responses the gateway serves: a curriculum
+tree, a page of assessment results and a /users listing. "render" times
+only the response body encoding after jsonable_encoder (what an unmodelled
+route pays); "end to end" starts from the raw Python objects.
+
+Usage: python benchmarks/bench_json_responses.py [--scale 1] [--repeat 20]
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from tutor_stack_core.responses import FastJSONResponse, dumps
+
+
+def curriculum_tree(scale: int):
+    def lesson(i):
+        return {
+            "id": str(uuid.uuid4()),
+            "title": f"Lesson {i}: Équations du premier degré",
+            "objectives": [f"Objective {j}" for j in range(4)],
+            "duration_minutes": random.randint(10, 60),
+            "updated_at": datetime.datetime.now(datetime.timezone.utc),
+        }
+
+    return {
+        "subject": "Mathematics",
+        "units": [
+            {
+                "id": uuid.uuid4(),
+                "title": f"Unit {u}",
+                "chapters": [
+                    {"title": f"Chapter {c}", "lessons": [lesson(n) for n in range(8)]}
+                    for c in range(6)
+                ],
+            }
+            for u in range(10 * scale)
+        ],
+    }
+
+
+def assessment_results(scale: int):
+    return [
+        {
+            "attempt_id": uuid.uuid4(),
+            "student_id": uuid.uuid4(),
+            "submitted_at": datetime.datetime.now(),
+            "score": random.random(),
+            "answers": [{"question": q, "correct": random.random() > 0.3} for q in range(20)],
+        }
+        for _ in range(1000 * scale)
+    ]
+
+
+def user_list(scale: int):
+    return [
+        {
+            "id": uuid.uuid4(),
+            "email": f"student{i}@school.example",
+            "is_active": True,
+            "is_superuser": False,
+            "is_verified": i % 3 == 0,
+        }
+        for i in range(5000 * scale)
+    ]
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    stock = JSONResponse(None)
+    fast = FastJSONResponse(None)
+    for name, build in (
+        ("curriculum tree", curriculum_tree),
+        ("assessment results", assessment_results),
+        ("user list", user_list),
+    ):
+        raw = build(args.scale)
+        encoded = jsonable_encoder(raw)
+        size = len(stock.render(encoded)) / 1024
+        render_stock = best_of(lambda: stock.render(encoded), args.repeat)
+        render_fast = best_of(lambda: fast.render(encoded), args.repeat)
+        full_stock = best_of(lambda: stock.render(jsonable_encoder(raw)), args.repeat)
+        full_fast = best_of(lambda: dumps(raw), args.repeat)
+        print(
+            f"{name:<19} {size:7.0f} KiB  render {render_stock:6.2f} -> {render_fast:5.2f} ms "
+            f"({render_stock / render_fast:4.1f}x)  end to end {full_stock:6.2f} -> "
+            f"{full_fast:5.2f} ms ({full_stock / full_fast:4.1f}x)"
+        )
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Benchmark JWT sign/verify throughput for RS256-4096, RS256-2048, ES256 and EdDSA
+
+Usage: python benchmarks/bench_jwt_algorithms.py [--seconds 1.0]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+from tutor_stack_core.jwt_keys import KeyCache, TokenVerifier
+
+CLAIMS = {"sub": "3b0217c2-5b18-4392-8ede-857dcce6f2e0", "aud": ["fastapi-users:auth"]}
+
+CASES = [
+    ("RS256-4096", "RS256", lambda: rsa.generate_private_key(65537, 4096)),
+    ("RS256-2048", "RS256", lambda: rsa.generate_private_key(65537, 2048)),
+    ("ES256", "ES256", lambda: ec.generate_private_key(ec.SECP256R1())),
+    ("EdDSA", "EdDSA", ed25519.Ed25519PrivateKey.generate),
+]
+
+
+def ops_per_second(fn, seconds: float) -> float:
+    count = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        fn()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def pem(private_key):
+    return private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+
+
+def main(seconds: float) -> None:
+    print(f"{'key':<12}{'sign/s':>12}{'verify/s':>12}{'verify (PEM)/s':>16}")
+    for name, algorithm, generate in CASES:
+        private_key = generate()
+        public_pem = pem(private_key)
+        token = jwt.encode(CLAIMS, private_key, algorithm=algorithm)
+        verifier = TokenVerifier(KeyCache.from_keys([private_key.public_key()]))
+
+        sign = ops_per_second(lambda: jwt.encode(CLAIMS, private_key, algorithm=algorithm), seconds)
+        verify = ops_per_second(lambda: verifier.verify(token), seconds)
+        # What a strategy holding PEM text pays: the key is re-parsed on every decode
+        verify_pem = ops_per_second(
+            lambda: jwt.decode(token, public_pem, algorithms=[algorithm], audience=CLAIMS["aud"]),
+            seconds,
+        )
+        print(f"{name:<12}{sign:>12,.0f}{verify:>12,.0f}{verify_pem:>16,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=1.0, help="time per measurement")
+    main(parser.parse_args().seconds)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Proxy overhead: in-process mount vs ServiceProxy to a uvicorn service pool
+
+Serves the same small JSON route three ways from a gateway in a uvicorn
+subprocess: mounted in-process, proxied over a Unix socket, and proxied over
+localhost TCP to a separate uvicorn service process. Reports client-side
+latency percentiles and throughput for each.
+
+Usage: python benchmarks/bench_proxy_overhead.py [--requests 5000] [--concurrency 32]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+
+from tutor_stack_core.proxy import ServiceProxy
+
+GATEWAY_PORT = 8766
+SERVICE_PORT = 8767
+
+
+def build_service() -> FastAPI:
+    service = FastAPI()
+
+    @service.get("/item")
+    async def item():
+        return {"title": "Fractions", "body": "..." * 50}
+
+    return service
+
+
+def build_gateway(upstream: str) -> FastAPI:
+    gateway = FastAPI()
+    gateway.mount("/content", ServiceProxy(upstream) if upstream else build_service())
+    return gateway
+
+
+def serve(role: str, upstream: str, uds: str) -> None:
+    import uvicorn
+
+    if role == "service":
+        options = {"uds": uds} if uds else {"host": "127.0.0.1", "port": SERVICE_PORT}
+        uvicorn.run(build_service(), log_level="warning", **options)
+    else:
+        uvicorn.run(
+            build_gateway(upstream), host="127.0.0.1", port=GATEWAY_PORT, log_level="warning"
+        )
+
+
+def wait_until_up() -> None:
+    for _ in range(100):
+        try:
+            if httpx.get(f"http://127.0.0.1:{GATEWAY_PORT}/content/item", timeout=1).is_success:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError("gateway did not start")
+
+
+async def drive(requests: int, concurrency: int):
+    latencies = []
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{GATEWAY_PORT}", limits=limits, timeout=30
+    ) as client:
+        remaining = iter(range(requests))
+
+        async def worker():
+            for _ in remaining:
+                start = time.perf_counter()
+                (await client.get("/content/item")).raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return sorted(latencies), elapsed
+
+
+def scenario(label: str, mode: str, requests: int, concurrency: int) -> None:
+    processes = []
+    with tempfile.TemporaryDirectory() as tmp:
+        uds = os.path.join(tmp, "content.sock") if mode == "uds" else ""
+        upstream = {"uds": f"unix:{uds}", "tcp": f"http://127.0.0.1:{SERVICE_PORT}"}.get(mode, "")
+        try:
+            if mode != "inprocess":
+                processes.append(
+                    subprocess.Popen(
+                        [sys.executable, __file__, "--serve", "service", "--uds", uds]
+                    )
+                )
+            processes.append(
+                subprocess.Popen(
+                    [sys.executable, __file__, "--serve", "gateway", "--upstream", upstream]
+                )
+            )
+            wait_until_up()
+            asyncio.run(drive(min(requests, 500), concurrency))  # warm up pools
+            latencies, elapsed = asyncio.run(drive(requests, concurrency))
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000
+    print(f"{label:<22} p50 {p50:6.2f} ms  p99 {p99:6.2f} ms  {requests / elapsed:8.0f} req/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--serve", choices=["gateway", "service"], help=argparse.SUPPRESS)
+    parser.add_argument("--upstream", default="", help=argparse.SUPPRESS)
+    parser.add_argument("--uds", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.upstream, args.uds)
+    else:
+        for label, mode in (
+            ("in-process mount", "inprocess"),
+            ("proxy over unix socket", "uds"),
+            ("proxy over localhost", "tcp"),
+        ):
+            scenario(label, mode, args.requests, args.concurrency)
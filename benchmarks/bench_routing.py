@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Benchmark routing overhead as the route table grows
+
+Builds a FastAPI app shaped like the gateway (auth routes, admin routes, then
+the service mounts) with ``N`` extra admin routes, and times how long the
+router takes to reach a mounted service, an early route and a 404, with
+Starlette's linear matching and with ``PrefixDispatcher`` installed. The
+mounted app and the endpoint respond immediately, so the difference is the
+matching itself.
+
+Usage: python benchmarks/bench_routing.py [--routes 10 50 200 1000] [--requests 5000]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import APIRouter, FastAPI
+from fastapi.responses import PlainTextResponse
+
+from tutor_stack_core.dispatch import PrefixDispatcher
+
+TARGETS = {"mount": "/chat/conversations/1", "early route": "/jwt/login", "404": "/missing/page"}
+
+
+async def service(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def build_app(extra_routes: int, compiled: bool) -> FastAPI:
+    app = FastAPI(openapi_url=None, docs_url=None, redoc_url=None)
+    jwt = APIRouter()
+    jwt.add_api_route("/login", lambda: PlainTextResponse("ok"), methods=["GET"])
+    app.include_router(jwt, prefix="/jwt")
+    admin = APIRouter()
+    for i in range(extra_routes):
+        admin.add_api_route(f"/stats/{i}/{{item}}", lambda item: item, methods=["GET"])
+    app.include_router(admin, prefix="/admin")
+    for name in ("content", "assessment", "notifier", "chat"):
+        app.mount(f"/{name}", service)
+    if compiled:
+        PrefixDispatcher(app.router).install()
+    return app
+
+
+async def time_requests(app, path: str, requests: int) -> float:
+    """Median microseconds per request through the app"""
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "scheme": "http",
+        "server": ("test", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    samples = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(requests):
+            await app(dict(scope), receive, send)
+        samples.append((time.perf_counter() - start) / requests * 1e6)
+    return statistics.median(samples)
+
+
+async def main(args):
+    print(f"{'routes':>7} {'target':>12} {'linear us':>10} {'compiled us':>12} {'speedup':>8}")
+    for extra in args.routes:
+        linear, compiled = build_app(extra, False), build_app(extra, True)
+        for label, path in TARGETS.items():
+            before = await time_requests(linear, path, args.requests)
+            after = await time_requests(compiled, path, args.requests)
+            print(f"{extra:>7} {label:>12} {before:>10.1f} {after:>12.1f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--routes", type=int, nargs="+", default=[10, 50, 200, 1000])
+    parser.add_argument("--requests", type=int, default=5000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Local load scenario: does an overloaded /chat drag /content latency with it?
+
+Runs a gateway-like app in a uvicorn subprocess with a slow /chat route (model
+wait plus a CPU burst per reply) and a fast /content route. Many clients
+flood /chat while a separate process samples /content at a fixed rate, once
+without admission control and once with a per-prefix AdaptiveLimiter.
+
+Usage: python benchmarks/load_admission_isolation.py [--chat-clients 500] [--duration 5]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+
+from tutor_stack_core.admission import AdaptiveLimiter, AdmissionControlMiddleware
+
+PORT = 8765
+
+
+def build_app(admission: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/chat/turn")
+    async def chat_turn():
+        await asyncio.sleep(0.2)  # waiting on the model
+        deadline = time.perf_counter() + 0.002
+        while time.perf_counter() < deadline:  # tokenising / post-processing the reply
+            pass
+        return {"reply": "..."}
+
+    @app.get("/content/item")
+    async def content_item():
+        return {"title": "Fractions", "body": "..."}
+
+    if admission:
+        app.add_middleware(
+            AdmissionControlMiddleware,
+            limiters={
+                "/chat": AdaptiveLimiter(initial_limit=20, max_limit=100, max_queue=20),
+                "/content": AdaptiveLimiter(initial_limit=50, max_queue=100),
+            },
+        )
+    return app
+
+
+def serve(admission: bool) -> None:
+    import uvicorn
+
+    uvicorn.run(build_app(admission), host="127.0.0.1", port=PORT, log_level="warning")
+
+
+def sample_content(duration: float, results) -> None:
+    """Hit /content every 10ms; latency counts from the scheduled send time"""
+    latencies = []
+    with httpx.Client(base_url=f"http://127.0.0.1:{PORT}", timeout=30) as client:
+        scheduled = time.perf_counter()
+        stop = scheduled + duration
+        while scheduled < stop:
+            time.sleep(max(0.0, scheduled - time.perf_counter()))
+            client.get("/content/item")
+            latencies.append(time.perf_counter() - scheduled)
+            scheduled += 0.01
+    results.extend(latencies)
+
+
+async def flood_chat(clients: int, duration: float):
+    statuses = {}
+    limits = httpx.Limits(max_connections=clients)
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{PORT}", limits=limits, timeout=60
+    ) as client:
+        stop = time.perf_counter() + duration
+
+        async def chat_client():
+            while time.perf_counter() < stop:
+                try:
+                    status = (await client.get("/chat/turn")).status_code
+                except httpx.HTTPError:
+                    status = "error"
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 503:
+                    await asyncio.sleep(0.2)  # back off, as a client honouring Retry-After would
+
+        await asyncio.gather(*(chat_client() for _ in range(clients)))
+    return statuses
+
+
+def wait_until_up() -> None:
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{PORT}/content/item", timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def scenario(admission: bool, chat_clients: int, duration: float) -> None:
+    flag = ["--admission"] if admission else []
+    server = subprocess.Popen([sys.executable, __file__, "--serve", *flag])
+    try:
+        wait_until_up()
+        with multiprocessing.Manager() as manager:
+            latencies = manager.list()
+            sampler = multiprocessing.Process(target=sample_content, args=(duration, latencies))
+            sampler.start()
+            statuses = asyncio.run(flood_chat(chat_clients, duration))
+            sampler.join()
+            latencies = sorted(latencies)
+    finally:
+        server.terminate()
+        server.wait()
+
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000
+    label = "with admission control" if admission else "without admission control"
+    print(f"{label:<27} /content p50 {p50:7.1f} ms  p99 {p99:7.1f} ms  /chat {statuses}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chat-clients", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--admission", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.admission)
+    else:
+        for admission in (False, True):
+            scenario(admission, args.chat_clients, args.duration)
@@ -1,15 +1,178 @@
-from fastapi import FastAPI, Request
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+import asyncio
+import jwt
+import logging
+import time
+import uuid
 import uvicorn
 import os
 
+from fastapi_users.password import PasswordHelper
+from pydantic import Field, create_model
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from typing import Optional
+
 from tutor_stack_auth.main import fastapi_users, auth_backend, google_oauth_client
 from tutor_stack_auth.auth import get_jwt_strategy, get_user_db, get_user_manager
+from tutor_stack_auth.database import engine
 from tutor_stack_auth.schemas import UserRead, UserCreate, UserUpdate
 from tutor_stack_auth.models import User, OAuthAccount
 
+from tutor_stack_core.activity import (
+    SCORE_HEADER,
+    ActivityRecorder,
+    SegmentFileSink,
+    SQLActivitySink,
+    classify,
+    parse_score,
+)
+from tutor_stack_core.admission import AdmissionControlMiddleware, limiter_from_env
+from tutor_stack_core.chat_socket import (
+    ASGIChatModel,
+    ChatSocketServer,
+    EchoChatModel,
+    create_chat_socket_router,
+)
+from tutor_stack_core.conversations import ConversationStore
+from tutor_stack_core.dispatch import PrefixDispatcher
+from tutor_stack_core.health import HealthMonitor, asgi_health_probe, database_probe
+from tutor_stack_core.idempotency import IdempotencyMiddleware, IdempotencyStore
+from tutor_stack_core.jwt_keys import (
+    check_edge_key,
+    get_key_cache,
+    get_token_verifier,
+)
+from tutor_stack_core.logs import ACCESS_LOGGER, configure_logging, request_id_var
+from tutor_stack_core.media import MediaStore, create_media_router
+from tutor_stack_core.memory import MemoryMiddleware, MemoryTracker, create_memory_router
+from tutor_stack_core.openapi import serve_cached_openapi
+from tutor_stack_core.profiling import create_profiling_router
+from tutor_stack_core.proxy import ServiceProxy
+from tutor_stack_core.responses import FastJSONResponse
+from tutor_stack_core.revocation import (
+    RevocationChecker,
+    RevocationStore,
+    create_revocation_router,
+)
+from tutor_stack_core.roster import RosterImporter, create_roster_router
+from tutor_stack_core.rollups import RollupEngine, create_progress_router
+from tutor_stack_core.sharding import (
+    HashRing,
+    ShardedUserDatabase,
+    ShardMap,
+    ShardSet,
+    EmailInUse,
+    TenantMigrating,
+    add_tenant_column,
+    tenant_from_request,
+)
+from tutor_stack_core.static import StaticFrontend
+from tutor_stack_core.strategy import get_preparsed_jwt_strategy
+from tutor_stack_core.tasks import get_task_scheduler
+from tutor_stack_core.user_export import UserExporter, create_user_export_router
+
+# Structured JSON logs, written to stdout by a background thread so the event loop never
+# waits on it; records are dropped and counted if the bounded queue fills up
+log_pipeline = configure_logging(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    access_sample_rate=float(os.getenv("ACCESS_LOG_SAMPLE_RATE", 1.0)),
+    queue_size=int(os.getenv("LOG_QUEUE_SIZE", 10_000)),
+)
+logger = logging.getLogger("tutor_stack.gateway")
+access_logger = logging.getLogger(ACCESS_LOGGER)
+
+# Opt-in allocation tracing, started before the services are imported so their
+# allocations are attributed too
+memory_tracker = None
+if os.getenv("MEMORY_PROFILING", "0") == "1":
+    memory_tracker = MemoryTracker(
+        sample_rate=float(os.getenv("MEMORY_SAMPLE_RATE", 0.01)),
+        frames=int(os.getenv("MEMORY_TRACE_FRAMES", 1)),
+    )
+    memory_tracker.start()
+
+# Sign and verify with keys parsed once per process. This has to happen before any
+# router or current_user dependency below is built from the backend.
+auth_backend.get_strategy = get_preparsed_jwt_strategy
+key_cache = get_key_cache()
+token_verifier = get_token_verifier()
+
+# Traefik verifies with the PEM inlined in its dynamic config, not the JWKS. The key cache
+# only signs with that key (re-read on every reload); refuse to start without it
+if key_cache.edge_key is not None:
+    check_edge_key(key_cache, key_cache.edge_key, key_cache.edge_algorithm)
+
 # Import the core auth verification helper
 current_active_user = fastapi_users.current_user(active=True)
+current_superuser = fastapi_users.current_user(active=True, superuser=True)
+
+# Sessions for gateway-level admin operations that talk to the auth database directly
+admin_session_maker = async_sessionmaker(engine, expire_on_commit=False)
+
+# Logout and account revocation, checked per request through a Bloom filter
+revocations = RevocationChecker(
+    RevocationStore(admin_session_maker),
+    capacity=int(os.getenv("REVOCATION_CAPACITY", 100_000)),
+    error_rate=float(os.getenv("REVOCATION_FALSE_POSITIVE_RATE", 0.001)),
+    token_lifetime=get_preparsed_jwt_strategy().lifetime_seconds,
+)
+get_preparsed_jwt_strategy().revocations = revocations
+
+# Optional tenant sharding of the user table: USER_SHARDS="a=<url>,b=<url>" spreads tenants over
+# several databases, with the tenant -> shard map kept in the auth database
+user_shards = None
+shard_map = None
+if os.getenv("USER_SHARDS"):
+    # The auth service's model and schema predate sharding; tables get the column at startup
+    add_tenant_column(User, default=os.getenv("DEFAULT_TENANT", "default"))
+    if "tenant_id" not in UserCreate.model_fields:
+        UserCreate = create_model(
+            "UserCreate",
+            __base__=UserCreate,
+            tenant_id=(Optional[str], Field(default=None, max_length=64)),
+        )
+    user_shards = ShardSet.from_spec(os.environ["USER_SHARDS"])
+    shard_map = ShardMap(
+        admin_session_maker,
+        HashRing(user_shards.names),
+        cache_ttl=float(os.getenv("SHARD_MAP_CACHE_TTL", 30)),
+    )
+
+    async def get_sharded_user_db(request: Request):
+        user_db = ShardedUserDatabase(
+            user_shards,
+            shard_map,
+            User,
+            OAuthAccount,
+            tenant=await tenant_from_request(request),
+            default_tenant=os.getenv("DEFAULT_TENANT", "default"),
+        )
+        try:
+            yield user_db
+        finally:
+            await user_db.close()
+
+# One bounded, prioritized executor for every service's background work (see TASK_* settings);
+# services get it with tutor_stack_core.tasks.get_task_scheduler()
+task_scheduler = get_task_scheduler()
+
+# Learning activity is buffered in memory and written in batches by a background flusher
+activity = None
+if os.getenv("ACTIVITY", "1") != "0":
+    if os.getenv("ACTIVITY_SEGMENT_DIR"):
+        activity_sink = SegmentFileSink(os.environ["ACTIVITY_SEGMENT_DIR"])
+    else:
+        activity_sink = SQLActivitySink(admin_session_maker)
+    activity = ActivityRecorder(
+        activity_sink,
+        capacity=int(os.getenv("ACTIVITY_BUFFER_SIZE", 50_000)),
+        batch_size=int(os.getenv("ACTIVITY_BATCH_SIZE", 500)),
+        flush_interval=float(os.getenv("ACTIVITY_FLUSH_INTERVAL", 1.0)),
+    )
 
 # Import the services (try local first for development, then installed packages)
 content_app = None
@@ -18,73 +181,175 @@ notifier_app = None
 chat_app = None
 auth_app = None
 
-# Import content service
-try:
-    from services.content.tutor_stack_content.main import app as content_app
-    print("✓ Content service imported successfully")
-except ImportError as e:
-    print(f"Warning: Could not import content service: {e}")
+# Out-of-process mode: a service with a <NAME>_SERVICE_URL runs as its own uvicorn pool
+# (unix:/path/to.sock or http://127.0.0.1:port) and the gateway forwards to it
+service_urls = {
+    name: os.getenv(f"{name.upper()}_SERVICE_URL")
+    for name in ("content", "assessment", "notifier", "chat")
+}
+
+# Import content service, or proxy to its own worker pool when CONTENT_SERVICE_URL is set
+if service_urls["content"]:
+    content_app = ServiceProxy(service_urls["content"])
+    logger.info("Content service proxied to %s", service_urls["content"])
+else:
     try:
-        from tutor_stack_content.main import app as content_app
-        print("✓ Content service imported from installed package")
+        from services.content.tutor_stack_content.main import app as content_app
+        logger.info("Content service imported successfully")
     except ImportError as e:
-        print(f"Warning: Could not import content service: {e}")
-        from fastapi import FastAPI as PlaceholderApp
-        content_app = PlaceholderApp()
-
-# Import assessment service
-try:
-    from services.assessment.tutor_stack_assessment.main import app as assessment_app
-    print("✓ Assessment service imported successfully")
-except ImportError as e:
-    print(f"Warning: Could not import assessment service: {e}")
+        logger.warning("Could not import content service: %s", e)
+        try:
+            from tutor_stack_content.main import app as content_app
+            logger.info("Content service imported from installed package")
+        except ImportError as e:
+            logger.warning("Could not import content service: %s", e)
+            from fastapi import FastAPI as PlaceholderApp
+            content_app = PlaceholderApp()
+
+# Import assessment service, or proxy to its own worker pool when ASSESSMENT_SERVICE_URL is set
+if service_urls["assessment"]:
+    assessment_app = ServiceProxy(service_urls["assessment"])
+    logger.info("Assessment service proxied to %s", service_urls["assessment"])
+else:
     try:
-        from tutor_stack_assessment.main import app as assessment_app
-        print("✓ Assessment service imported from installed package")
+        from services.assessment.tutor_stack_assessment.main import app as assessment_app
+        logger.info("Assessment service imported successfully")
     except ImportError as e:
-        print(f"Warning: Could not import assessment service: {e}")
-        from fastapi import FastAPI as PlaceholderApp
-        assessment_app = PlaceholderApp()
-
-# Import notifier service
-try:
-    from services.notifier.tutor_stack_notifier.main import app as notifier_app
-    print("✓ Notifier service imported successfully")
-except ImportError as e:
-    print(f"Warning: Could not import notifier service: {e}")
+        logger.warning("Could not import assessment service: %s", e)
+        try:
+            from tutor_stack_assessment.main import app as assessment_app
+            logger.info("Assessment service imported from installed package")
+        except ImportError as e:
+            logger.warning("Could not import assessment service: %s", e)
+            from fastapi import FastAPI as PlaceholderApp
+            assessment_app = PlaceholderApp()
+
+# Import notifier service, or proxy to its own worker pool when NOTIFIER_SERVICE_URL is set
+if service_urls["notifier"]:
+    notifier_app = ServiceProxy(service_urls["notifier"])
+    logger.info("Notifier service proxied to %s", service_urls["notifier"])
+else:
     try:
-        from tutor_stack_notifier.main import app as notifier_app
-        print("✓ Notifier service imported from installed package")
+        from services.notifier.tutor_stack_notifier.main import app as notifier_app
+        logger.info("Notifier service imported successfully")
     except ImportError as e:
-        print(f"Warning: Could not import notifier service: {e}")
-        from fastapi import FastAPI as PlaceholderApp
-        notifier_app = PlaceholderApp()
-
-# Import chat service
-try:
-    from services.tutor_chat.tutor_stack_chat.main import app as chat_app
-    print("✓ Chat service imported successfully")
-except ImportError as e:
-    print(f"Warning: Could not import chat service: {e}")
+        logger.warning("Could not import notifier service: %s", e)
+        try:
+            from tutor_stack_notifier.main import app as notifier_app
+            logger.info("Notifier service imported from installed package")
+        except ImportError as e:
+            logger.warning("Could not import notifier service: %s", e)
+            from fastapi import FastAPI as PlaceholderApp
+            notifier_app = PlaceholderApp()
+
+# Import chat service, or proxy to its own worker pool when CHAT_SERVICE_URL is set
+if service_urls["chat"]:
+    chat_app = ServiceProxy(service_urls["chat"])
+    logger.info("Chat service proxied to %s", service_urls["chat"])
+else:
     try:
-        from tutor_stack_chat.main import app as chat_app
-        print("✓ Chat service imported from installed package")
+        from services.tutor_chat.tutor_stack_chat.main import app as chat_app
+        logger.info("Chat service imported successfully")
     except ImportError as e:
-        print(f"Warning: Could not import chat service: {e}")
-        from fastapi import FastAPI as PlaceholderApp
-        chat_app = PlaceholderApp()
+        logger.warning("Could not import chat service: %s", e)
+        try:
+            from tutor_stack_chat.main import app as chat_app
+            logger.info("Chat service imported from installed package")
+        except ImportError as e:
+            logger.warning("Could not import chat service: %s", e)
+            from fastapi import FastAPI as PlaceholderApp
+            chat_app = PlaceholderApp()
 
 # Removed the old auth service import logic as it's now directly integrated.
 auth_app = None
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop the gateway's background tasks"""
+    task_scheduler.start()
+    background = []
+    if key_cache.key_dir:
+        # Pick up rotated keys from JWT_KEY_DIR without a restart
+        interval = float(os.getenv("JWT_KEY_RELOAD_INTERVAL", 30))
+        background.append(asyncio.create_task(key_cache.run_reloader(interval)))
+
+    if user_shards is not None:
+        await shard_map.create_table(engine)
+        await user_shards.create_all(User.metadata)
+        await user_shards.add_missing_columns(User)
+
+    await revocations.store.create_table(engine)
+    await revocations.refresh()
+    interval = float(os.getenv("REVOCATION_REFRESH_INTERVAL", 5))
+    background.append(asyncio.create_task(revocations.run_refresher(interval)))
+    interval = float(os.getenv("REVOCATION_PURGE_INTERVAL", 3600))
+    background.append(asyncio.create_task(revocations.run_purger(interval)))
+
+    background.append(asyncio.create_task(health_monitor.run()))
+
+    if activity is not None:
+        if isinstance(activity.sink, SQLActivitySink):
+            await activity.sink.create_table(engine)
+        activity.start()
+    if progress is not None:
+        await progress.create_tables(engine)
+        background.append(
+            asyncio.create_task(
+                progress.run(
+                    interval=float(os.getenv("ROLLUP_REFRESH_INTERVAL", 60)),
+                    rebuild_interval=float(os.getenv("ROLLUP_REBUILD_INTERVAL", 24 * 3600)),
+                )
+            )
+        )
+
+    if memory_tracker is not None:
+        interval = float(os.getenv("MEMORY_SNAPSHOT_INTERVAL", 300))
+        background.append(asyncio.create_task(memory_tracker.run_snapshots(interval)))
+
+    # Build (or load) the schema before the first request instead of during it
+    openapi_cache.document()
+
+    yield
+    for task in background:
+        task.cancel()
+    for service_app in (content_app, assessment_app, notifier_app, chat_app):
+        if isinstance(service_app, ServiceProxy):
+            await service_app.aclose()
+    # Before the stores below close, so jobs still running can finish writing to them
+    await task_scheduler.stop(grace=float(os.getenv("TASK_SHUTDOWN_GRACE", 10)))
+    chat_history.close()
+    if activity is not None:
+        await activity.stop()
+    if user_shards is not None:
+        await user_shards.dispose()
+    # Flush queued log records before the process exits
+    log_pipeline.stop()
+
 # Create the main application
 app = FastAPI(
     title="Tutor Stack API",
     description="API Gateway for Tutor Stack Platform",
     version="1.0.0",
-    debug=True  # Enable debug mode to show detailed error information
+    debug=os.getenv("GATEWAY_DEBUG", "0") == "1",  # Tracebacks in error responses
+    default_response_class=FastJSONResponse,  # orjson; inherited by the included routers
+    lifespan=lifespan
 )
 
+if user_shards is not None:
+    # Every fastapi-users route resolves its user database through this dependency
+    app.dependency_overrides[get_user_db] = get_sharded_user_db
+
+@app.exception_handler(TenantMigrating)
+async def tenant_migrating(request: Request, exc: TenantMigrating):
+    return JSONResponse(
+        {"detail": str(exc)}, status_code=503, headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(EmailInUse)
+async def email_in_use(request: Request, exc: EmailInUse):
+    # Only reached by a race, fastapi-users checks get_by_email first; same answer as that check
+    return JSONResponse({"detail": "REGISTER_USER_ALREADY_EXISTS"}, status_code=400)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -123,26 +388,247 @@ if google_oauth_client:
         tags=["auth"]
     )
 
+# Bulk roster provisioning for onboarding whole schools (superuser only). It writes to the auth
+# database directly, so it is left out when users live on shards.
+if user_shards is None:
+    roster_importer = RosterImporter(
+        admin_session_maker,
+        User,
+        PasswordHelper().hash,
+        batch_size=int(os.getenv("ROSTER_BATCH_SIZE", 500)),
+        # Looked up per import: the scheduler replaces its pool when it is restarted
+        executor=lambda: task_scheduler.threads,
+    )
+    app.include_router(
+        create_roster_router(roster_importer, current_superuser),
+        prefix="/admin",
+        tags=["admin"]
+    )
+else:
+    logger.warning("USER_SHARDS is set: roster import and user export are not mounted")
+app.include_router(
+    # Revoking also deactivates the account; sharded users are not in the revocation database
+    create_revocation_router(
+        revocations, current_superuser, User, get_user_db if user_shards is not None else None
+    ),
+    prefix="/admin",
+    tags=["admin"]
+)
+
+# Reporting exports stream the user table page by page instead of materializing it; like the
+# roster import, they only read the auth database
+if user_shards is None:
+    user_exporter = UserExporter(
+        admin_session_maker, User, page_size=int(os.getenv("USER_EXPORT_PAGE_SIZE", 1000))
+    )
+    app.include_router(
+        create_user_export_router(user_exporter, current_superuser),
+        prefix="/admin",
+        tags=["admin"]
+    )
+
+# Retried POSTs carrying an Idempotency-Key run once; retries replay the stored response.
+# Added before guard so that guard (and its revocation check) still runs first.
+if os.getenv("IDEMPOTENCY", "1") != "0":
+    app.add_middleware(
+        IdempotencyMiddleware,
+        store=IdempotencyStore(
+            max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", 10_000)),
+            ttl=float(os.getenv("IDEMPOTENCY_TTL", 24 * 3600)),
+            sqlite_path=os.getenv("IDEMPOTENCY_SQLITE_PATH"),
+        ),
+    )
+
 # Add JWT verification middleware (defence-in-depth)
 @app.middleware("http")
 async def guard(req: Request, call_next):
     """JWT verification middleware for all requests"""
+    # Correlate every log record of this request, and hand the ID back to the client
+    request_id = req.headers.get("x-request-id", "")[:64] or uuid.uuid4().hex
+    context = request_id_var.set(request_id)
+    start = time.perf_counter()
+    try:
+        response = await verify_token(req, call_next)
+        response.headers["X-Request-ID"] = request_id
+        duration_ms = round((time.perf_counter() - start) * 1000, 2)
+        access_logger.log(
+            logging.WARNING if response.status_code >= 500 else logging.INFO,
+            "%s %s %d",
+            req.method,
+            req.url.path,
+            response.status_code,
+            extra={"duration_ms": duration_ms},
+        )
+        claims = getattr(req.state, "claims", None)
+        if activity is not None and claims and claims.get("sub"):
+            kind = classify(req.method, req.url.path)
+            if kind:
+                activity.record(
+                    claims["sub"],
+                    kind,
+                    req.url.path,
+                    response.status_code,
+                    duration_ms,
+                    parse_score(response.headers.get(SCORE_HEADER)),
+                )
+        return response
+    finally:
+        request_id_var.reset(context)
+
+async def verify_token(req: Request, call_next):
     # If the request path is for auth, let it pass through (Traefik handles auth for these paths)
-    if req.url.path.startswith("/jwt") or req.url.path.startswith("/users") or req.url.path.startswith("/google"):
+    if "public" in dispatcher.lookup(req.scope).tags:
         response = await call_next(req)
         return response
 
-    # Otherwise, attempt to get the current active user
-    try:
-        req.state.user = await fastapi_users.current_user(active=True)(req)
-    except Exception as e:
-        # For paths not directly handled by auth routers, we can let Traefik handle it or raise an error
-        # For now, we'll let Traefik pass it if it's not a protected route
-        pass
+    # Otherwise, verify the bearer token statelessly against the pre-parsed public keys
+    req.state.claims = None
+    scheme, _, token = req.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            req.state.claims = token_verifier.verify(token)
+        except jwt.PyJWTError:
+            # Traefik and the services decide whether the route is protected
+            pass
+        else:
+            # Traefik only checks the signature, so revoked tokens have to stop here
+            if await revocations.is_revoked(req.state.claims):
+                return JSONResponse({"detail": "Token has been revoked"}, status_code=401)
 
     response = await call_next(req)
     return response
 
+# Admission control: each mounted service gets its own adaptive concurrency limit, so
+# overload in one (say, slow model calls on /chat) is shed there instead of spreading
+admission_limiters = {}
+if os.getenv("ADMISSION_CONTROL", "1") != "0":
+    for prefix in ("/content", "/assessment", "/notifier", "/chat"):
+        admission_limiters[prefix] = limiter_from_env(os.environ, prefix.strip("/"))
+    app.add_middleware(AdmissionControlMiddleware, limiters=admission_limiters)
+
+# Outermost, so that guard's and admission control's buffering is attributed as well
+if memory_tracker is not None:
+    app.add_middleware(
+        MemoryMiddleware,
+        tracker=memory_tracker,
+        prefixes=[
+            "/content", "/assessment", "/notifier", "/chat", "/ws",  # services
+            "/jwt", "/users", "/google",  # auth
+            "/admin",
+        ],
+    )
+app.include_router(
+    create_memory_router(current_superuser, memory_tracker),
+    prefix="/admin",
+    tags=["admin"]
+)
+
+@app.get("/admin/admission", tags=["admin"])
+async def admission_stats(user=Depends(current_superuser)):
+    """Current concurrency limit, queue depth and shed counts per service"""
+    return {prefix: limiter.snapshot() for prefix, limiter in admission_limiters.items()}
+
+@app.get("/admin/logging", tags=["admin"])
+async def logging_stats(user=Depends(current_superuser)):
+    """Log queue depth and how many records were dropped because the writer fell behind"""
+    return log_pipeline.stats()
+
+# On-demand sampling profiler for the worker serving the request; off unless asked for
+if os.getenv("PROFILING", "0") == "1":
+    app.include_router(
+        create_profiling_router(current_superuser),
+        prefix="/admin",
+        tags=["admin"]
+    )
+
+# Chat over a single WebSocket: the token is checked once at connect time, not per turn
+async def authenticate_socket(token: str):
+    claims = token_verifier.verify(token)
+    if await revocations.is_revoked(claims):
+        raise PermissionError("Token has been revoked")
+    return claims
+
+def record_chat_turn(claims, conversation):
+    if activity is not None and claims.get("sub"):
+        activity.record(claims["sub"], "chat.turn", "/ws/chat")
+
+if os.getenv("CHAT_WS_MODEL", "service") == "echo":
+    chat_model = EchoChatModel()
+else:
+    chat_model = ASGIChatModel(chat_app, os.getenv("CHAT_WS_UPSTREAM_PATH", "/messages"))
+# Recent turns plus a rolling summary per conversation, sent along with each socket turn
+chat_history = ConversationStore(
+    window_turns=int(os.getenv("CHAT_HISTORY_TURNS", 20)),
+    token_budget=int(os.getenv("CHAT_HISTORY_TOKENS", 2000)),
+    max_sessions=int(os.getenv("CHAT_HISTORY_MAX_SESSIONS", 10_000)),
+    sqlite_path=os.getenv("CHAT_HISTORY_SQLITE_PATH"),
+)
+chat_sockets = ChatSocketServer(
+    chat_model,
+    authenticate_socket,
+    max_inflight=int(os.getenv("CHAT_WS_MAX_INFLIGHT", 4)),
+    send_queue_size=int(os.getenv("CHAT_WS_SEND_QUEUE", 64)),
+    heartbeat_interval=float(os.getenv("CHAT_WS_HEARTBEAT_INTERVAL", 20)),
+    history=chat_history,
+    on_message=record_chat_turn,
+)
+app.include_router(create_chat_socket_router(chat_sockets))
+
+@app.get("/admin/chat-socket", tags=["admin"])
+async def chat_socket_stats(user=Depends(current_superuser)):
+    """Open chat sockets, message and frame counts, and backpressure events"""
+    return {**chat_sockets.snapshot(), "history": chat_history.stats()}
+
+# Dashboard rollups, maintained incrementally from the activity table
+progress = None
+if activity is not None and isinstance(activity.sink, SQLActivitySink):
+    progress = RollupEngine(admin_session_maker)
+    app.include_router(
+        create_progress_router(progress, current_superuser),
+        prefix="/admin",
+        tags=["admin"]
+    )
+
+@app.get("/admin/shards", tags=["admin"])
+async def shard_stats(user=Depends(current_superuser)):
+    """Configured user shards, pinned tenants and shard map cache counters"""
+    if shard_map is None:
+        return {"enabled": False}
+    return {**shard_map.snapshot(), "pins": await shard_map.pins()}
+
+# Lesson attachments: streamed, size-limited uploads into a content-addressed store under
+# MEDIA_DIR, served back with Range support
+media_store = None
+if os.getenv("MEDIA_DIR"):
+    media_store = MediaStore(
+        os.environ["MEDIA_DIR"],
+        max_bytes=int(os.getenv("MEDIA_MAX_BYTES", 2 * 1024 * 1024 * 1024)),
+        quota_bytes=int(os.getenv("MEDIA_USER_QUOTA_BYTES", 10 * 1024 * 1024 * 1024)),
+    )
+    app.include_router(
+        create_media_router(
+            media_store,
+            current_active_user,
+            None if os.getenv("MEDIA_PUBLIC_DOWNLOADS", "0") == "1" else current_active_user,
+        ),
+        tags=["media"]
+    )
+
+@app.get("/admin/media", tags=["admin"])
+async def media_stats(user=Depends(current_superuser)):
+    """Uploads stored, deduplicated and rejected"""
+    return media_store.stats if media_store is not None else {"enabled": False}
+
+@app.get("/admin/tasks", tags=["admin"])
+async def task_stats(user=Depends(current_superuser)):
+    """Background job queue depths, per-service counters and wait/run latencies"""
+    return task_scheduler.snapshot()
+
+@app.get("/admin/activity", tags=["admin"])
+async def activity_stats(user=Depends(current_superuser)):
+    """Buffered, flushed and dropped learning-activity events"""
+    return activity.snapshot() if activity is not None else {"enabled": False}
+
 # Mount the services as sub-applications
 if content_app:
     app.mount("/content", content_app)
@@ -152,12 +638,39 @@ if notifier_app:
     app.mount("/notifier", notifier_app)
 if chat_app:
     app.mount("/chat", chat_app)
+
+# Readiness probes run in the background; /health/ready only reads their cached results
+health_monitor = HealthMonitor(
+    interval=float(os.getenv("HEALTH_PROBE_INTERVAL", 10)),
+    timeout=float(os.getenv("HEALTH_PROBE_TIMEOUT", 2)),
+)
+health_monitor.add_probe("database", database_probe(engine))
+
+async def key_material_probe():
+    key_cache.signing_keys()
+
+health_monitor.add_probe("keys", key_material_probe)
+for name, service_app in (
+    ("content", content_app),
+    ("assessment", assessment_app),
+    ("notifier", notifier_app),
+    ("chat", chat_app),
+):
+    if service_app:
+        health_monitor.add_probe(name, asgi_health_probe(service_app))
 # Removed the auth_app mounting as its routers are now directly included.
 
 # Removed redundant database initialization for auth service, now handled by tutor_stack_auth.
 
+# Optional: serve the built frontend (vite build output) from this process instead of a
+# separate container. It is mounted at "/" below, after every other route.
+frontend = StaticFrontend(os.environ["FRONTEND_DIST_DIR"]) if os.getenv("FRONTEND_DIST_DIR") else None
+
 @app.get("/")
-async def root():
+async def root(request: Request):
+    if frontend and frontend.index and "text/html" in request.headers.get("accept", ""):
+        # Browsers get the app; API clients keep getting the service listing
+        return frontend.response(frontend.index, request.headers)
     return {
         "message": "Tutor Stack Platform",
         "services": {
@@ -169,10 +682,48 @@ async def root():
         }
     }
 
+@app.get("/.well-known/jwks.json", include_in_schema=False)
+async def jwks():
+    """Public signing keys, indexed by kid, for anything verifying our tokens"""
+    return Response(
+        key_cache.jwks_json,
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=300"}
+    )
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {"status": "healthy" if health_monitor.is_ready() else "degraded"}
+
+@app.get("/health/live")
+async def liveness():
+    """Constant-time liveness check: the worker is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Cached dependency probe results; 503 until every probe passes"""
+    report = health_monitor.report()
+    return JSONResponse(report, status_code=200 if report["status"] == "ready" else 503)
+
+# Serve /openapi.json from pre-serialized, precompressed bytes. Set OPENAPI_SCHEMA_PATH to a
+# file written at image build time (python -m tutor_stack_core.openapi main:app <path>) to skip
+# generating it in every worker. This must stay below every route and router.
+openapi_cache = serve_cached_openapi(app, os.getenv("OPENAPI_SCHEMA_PATH"))
+
+if frontend:
+    app.mount("/", frontend)
+
+# Match requests against a prefix trie compiled from the route table above, so a request only
+# tries the routes under its own prefix; the guard classifies requests with the same lookup
+dispatcher = PrefixDispatcher(app.router)
+# /users is not public: its routes all need a token, and the guard's verified claims carry the
+# tenant that picks the user shard
+dispatcher.tag(("/jwt", "/google"), "public")
+if os.getenv("ROUTE_DISPATCH", "1") != "0":
+    dispatcher.install()
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port) 
\ No newline at end of file
+    # Logging is already configured; the guard middleware writes the access log
+    uvicorn.run(app, host="0.0.0.0", port=port, log_config=None, access_log=False) 
\ No newline at end of file
@@ -0,0 +1,136 @@
+"""
+Unit tests for write-behind activity capture
+"""
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from tutor_stack_core.activity import (
+    ActivityRecorder,
+    SegmentFileSink,
+    SQLActivitySink,
+    activity_events,
+    classify,
+    parse_score,
+)
+
+
+class MemorySink:
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.batches = []
+        self.delay = delay
+        self.fail = fail
+
+    async def write(self, events):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("database down")
+        self.batches.append(list(events))
+
+
+@pytest.mark.unit
+class TestActivityRecorder:
+    """Tests for buffering, batched flushing and shutdown"""
+
+    def test_classify(self):
+        """Test requests map to event kinds by prefix and method"""
+        assert classify("GET", "/content/lessons/1") == "content.view"
+        assert classify("POST", "/chat") == "chat.turn"
+        assert classify("GET", "/chat/history") is None
+        assert classify("POST", "/assessments") is None
+
+    def test_parse_score(self):
+        """Test only finite numbers are taken from the score header"""
+        assert parse_score("0.75") == 0.75
+        assert parse_score("88") == 88.0
+        for value in (None, "", "n/a", "nan", "inf"):
+            assert parse_score(value) is None
+
+    @pytest.mark.asyncio
+    async def test_flushes_on_size_and_time(self):
+        """Test a full batch is flushed promptly and a partial one after the interval"""
+        sink = MemorySink()
+        recorder = ActivityRecorder(sink, batch_size=10, flush_interval=0.2)
+        recorder.start()
+        for i in range(10):
+            recorder.record(f"user-{i}", "content.view", "/content/1")
+        await asyncio.sleep(0.05)
+        assert [len(batch) for batch in sink.batches] == [10]
+        for i in range(3):
+            recorder.record(f"user-{i}", "content.view", "/content/2")
+        await asyncio.sleep(0.05)
+        assert len(sink.batches) == 1
+        await asyncio.sleep(0.3)
+        assert [len(batch) for batch in sink.batches] == [10, 3]
+        await recorder.stop()
+
+    @pytest.mark.asyncio
+    async def test_full_buffer_drops_oldest(self):
+        """Test a full buffer overwrites the oldest events and counts them as dropped"""
+        sink = MemorySink()
+        recorder = ActivityRecorder(sink, capacity=5, batch_size=100)
+        for i in range(8):
+            recorder.record(f"user-{i}", "chat.turn", "/chat")
+        assert recorder.snapshot()["dropped"] == 3
+        await recorder.stop()
+        assert [event.user_id for event in sink.batches[0]] == [f"user-{i}" for i in range(3, 8)]
+
+    @pytest.mark.asyncio
+    async def test_stop_waits_for_inflight_write(self):
+        """Test stopping finishes the current write and flushes what is left"""
+        sink = MemorySink(delay=0.1)
+        recorder = ActivityRecorder(sink, batch_size=2, flush_interval=10)
+        recorder.start()
+        for i in range(5):
+            recorder.record(f"user-{i}", "assessment.submit", "/assessment/1")
+        await asyncio.sleep(0.01)
+        await recorder.stop()
+        assert recorder.snapshot()["flushed"] == 5
+        assert recorder.snapshot()["buffered"] == 0
+
+    @pytest.mark.asyncio
+    async def test_failed_write_is_counted(self):
+        """Test a failing sink loses the batch but not the flusher"""
+        recorder = ActivityRecorder(MemorySink(fail=True), batch_size=2)
+        for i in range(3):
+            recorder.record(f"user-{i}", "chat.turn", "/chat")
+        await recorder.flush()
+        assert recorder.snapshot()["failed"] == 3
+
+
+@pytest.mark.unit
+class TestActivitySinks:
+    """Tests for the SQL and segment file sinks"""
+
+    @pytest.mark.asyncio
+    async def test_sql_sink_multi_row_insert(self):
+        """Test batches land in the activity table"""
+        engine = create_async_engine("sqlite+aiosqlite://")
+        sink = SQLActivitySink(async_sessionmaker(engine, expire_on_commit=False))
+        await sink.create_table(engine)
+        recorder = ActivityRecorder(sink, batch_size=4)
+        for i in range(10):
+            recorder.record(f"user-{i % 2}", "content.view", f"/content/{i}", 200, 1.5)
+        await recorder.stop()
+        async with engine.connect() as conn:
+            count = await conn.scalar(select(func.count()).select_from(activity_events))
+        assert count == 10
+        assert recorder.snapshot()["batches"] == 3
+        await engine.dispose()
+
+    @pytest.mark.asyncio
+    async def test_segment_files_roll_over(self, tmp_path):
+        """Test segments roll over at the size limit and are closed on stop"""
+        sink = SegmentFileSink(str(tmp_path), max_bytes=300)
+        recorder = ActivityRecorder(sink, batch_size=2)
+        for i in range(6):
+            recorder.record(f"user-{i}", "chat.turn", "/chat")
+        await recorder.stop()
+        segments = sorted(tmp_path.iterdir())
+        assert len(segments) > 1
+        assert not any(path.name.endswith(".open") for path in segments)
+        lines = [json.loads(line) for path in segments for line in path.read_text().splitlines()]
+        assert [line["user_id"] for line in lines] == [f"user-{i}" for i in range(6)]
@@ -0,0 +1,126 @@
+"""
+Unit tests for adaptive admission control
+"""
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from tutor_stack_core.admission import (
+    AdaptiveLimiter,
+    AdmissionControlMiddleware,
+    limiter_from_env,
+)
+
+
+@pytest.mark.unit
+class TestAdaptiveLimiter:
+    """Tests for slot accounting and limit adaptation"""
+
+    @pytest.mark.asyncio
+    async def test_queue_then_shed(self):
+        """Test requests queue up to max_queue and are shed beyond it"""
+        limiter = AdaptiveLimiter(initial_limit=1, max_queue=1, queue_timeout=1)
+        assert await limiter.acquire()
+
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not await limiter.acquire()
+        assert limiter.stats["rejected"] == 1
+
+        limiter.release(0.01)
+        assert await queued
+        assert limiter.inflight == 1
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout(self):
+        """Test a queued request gives up after queue_timeout"""
+        limiter = AdaptiveLimiter(initial_limit=1, max_queue=5, queue_timeout=0.01)
+        assert await limiter.acquire()
+        assert not await limiter.acquire()
+        assert limiter.stats["queue_timeouts"] == 1
+        assert limiter.snapshot()["queue_depth"] == 0
+
+    def test_limit_shrinks_when_latency_rises(self):
+        """Test the limit drops once latency climbs above the long-term average"""
+        limiter = AdaptiveLimiter(initial_limit=50)
+        limiter.inflight = 51
+        for _ in range(50):
+            limiter.release(0.01)
+            limiter.inflight += 1
+        steady = limiter.limit
+        for _ in range(20):
+            limiter.release(0.5)
+            limiter.inflight += 1
+        assert limiter.limit < steady
+
+    def test_limit_grows_only_when_used(self):
+        """Test flat latency grows the limit only while it is being used"""
+        idle = AdaptiveLimiter(initial_limit=10)
+        for _ in range(20):
+            idle.inflight = 1
+            idle.release(0.01)
+        assert int(idle.limit) == 10
+
+        busy = AdaptiveLimiter(initial_limit=10)
+        for _ in range(20):
+            busy.inflight = 10
+            busy.release(0.01)
+        assert busy.limit > 10
+
+    def test_overload_backs_off(self):
+        """Test downstream overload responses cut the limit multiplicatively"""
+        limiter = AdaptiveLimiter(initial_limit=20, backoff=0.5)
+        limiter.inflight = 1
+        limiter.release(0.01, overloaded=True)
+        assert limiter.limit == 10
+
+    def test_limiter_from_env(self):
+        """Test per-service settings override the shared defaults"""
+        environ = {"ADMISSION_MAX_QUEUE": "7", "ADMISSION_CHAT_MAX_LIMIT": "16"}
+        chat = limiter_from_env(environ, "chat")
+        content = limiter_from_env(environ, "content")
+        assert (chat.max_queue, chat.max_limit) == (7, 16)
+        assert (content.max_queue, content.max_limit) == (7, 200)
+
+
+@pytest.mark.unit
+class TestAdmissionControlMiddleware:
+    """Tests for per-prefix isolation in the middleware"""
+
+    @pytest.mark.asyncio
+    async def test_slow_prefix_is_isolated(self):
+        """Test a saturated /chat sheds with 503 while /content keeps serving"""
+        release = asyncio.Event()
+        app = FastAPI()
+
+        @app.get("/chat/turn")
+        async def chat_turn():
+            await release.wait()
+            return {"ok": True}
+
+        @app.get("/content/item")
+        async def content_item():
+            return {"ok": True}
+
+        limiters = {
+            "/chat": AdaptiveLimiter(initial_limit=2, max_queue=0),
+            "/content": AdaptiveLimiter(initial_limit=2, max_queue=0),
+        }
+        app.add_middleware(AdmissionControlMiddleware, limiters=limiters)
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            slow = [asyncio.create_task(client.get("/chat/turn")) for _ in range(2)]
+            await asyncio.sleep(0.05)
+
+            shed = await client.get("/chat/turn")
+            assert shed.status_code == 503
+            assert shed.headers["retry-after"] == "1"
+            assert (await client.get("/content/item")).status_code == 200
+            assert (await client.get("/")).status_code == 404
+
+            release.set()
+            assert [r.status_code for r in await asyncio.gather(*slow)] == [200, 200]
+        assert limiters["/chat"].inflight == 0
@@ -0,0 +1,147 @@
+"""
+Unit tests for the chat WebSocket
+"""
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from tutor_stack_core.chat_socket import (
+    POLICY_VIOLATION,
+    SUBPROTOCOL,
+    ChatSocketServer,
+    EchoChatModel,
+    create_chat_socket_router,
+)
+from tutor_stack_core.conversations import ConversationStore
+
+
+class BlockingModel:
+    """Never finishes a reply until cancelled"""
+
+    async def stream_reply(self, claims, conversation, text, token, context=None):
+        yield "thinking "
+        await asyncio.Event().wait()
+
+
+async def _authenticate(token: str):
+    if token != "good":
+        raise PermissionError("bad token")
+    return {"sub": "student-1"}
+
+
+def _client(model=None, **kwargs):
+    server = ChatSocketServer(model or EchoChatModel(), _authenticate, **kwargs)
+    app = FastAPI()
+    app.include_router(create_chat_socket_router(server))
+    return TestClient(app), server
+
+
+def _receive(websocket):
+    return json.loads(websocket.receive_bytes())
+
+
+def _collect(websocket, ids):
+    """Read frames until every id in ``ids`` is done, returning text per id"""
+    replies = {message_id: "" for message_id in ids}
+    pending = set(ids)
+    while pending:
+        frame = _receive(websocket)
+        if frame["type"] == "delta":
+            replies[frame["id"]] += frame["text"]
+        elif frame["type"] == "done":
+            pending.discard(frame["id"])
+    return replies
+
+
+@pytest.mark.unit
+class TestChatSocket:
+    """Tests for authentication, multiplexing and flow control on the chat socket"""
+
+    def test_rejects_bad_token_before_accept(self):
+        """Test the handshake is refused when the token does not verify"""
+        client, server = _client()
+        with pytest.raises(WebSocketDisconnect) as exc:
+            with client.websocket_connect("/ws/chat?token=bad"):
+                pass
+        assert exc.value.code == POLICY_VIOLATION
+        assert server.stats["auth_failures"] == 1
+        assert server.stats["connections"] == 0
+
+    def test_token_in_subprotocol(self):
+        """Test a bearer token offered as a subprotocol authenticates the socket"""
+        client, server = _client()
+        with client.websocket_connect(
+            "/ws/chat", subprotocols=[SUBPROTOCOL, "bearer.good"]
+        ) as websocket:
+            assert websocket.accepted_subprotocol == SUBPROTOCOL
+            websocket.send_text(json.dumps({"type": "ping"}))
+            assert _receive(websocket) == {"type": "pong"}
+        assert server.stats["connections"] == 1
+
+    def test_multiplexed_replies(self):
+        """Test two messages stream their replies over one socket, told apart by id"""
+        seen = []
+        client, server = _client(
+            EchoChatModel(delay=0.001), on_message=lambda claims, _: seen.append(claims["sub"])
+        )
+        with client.websocket_connect("/ws/chat", headers={"Authorization": "Bearer good"}) as ws:
+            ws.send_text(json.dumps({"type": "message", "id": "a", "text": "one two three"}))
+            ws.send_text(json.dumps({"type": "message", "id": "b", "text": "four five"}))
+            replies = _collect(ws, ["a", "b"])
+        assert replies == {"a": "one two three ", "b": "four five "}
+        snapshot = server.snapshot()
+        assert snapshot["messages_in"] == 2
+        assert snapshot["replies"] == 2
+        assert snapshot["open_connections"] == 0
+        assert seen == ["student-1", "student-1"]
+
+    def test_inflight_limit_and_cancel(self):
+        """Test messages beyond the in-flight limit are refused and cancel frees a slot"""
+        client, server = _client(BlockingModel(), max_inflight=1)
+        with client.websocket_connect("/ws/chat?token=good") as ws:
+            ws.send_text(json.dumps({"type": "message", "id": "a", "text": "hi"}))
+            assert _receive(ws)["type"] == "delta"
+            ws.send_text(json.dumps({"type": "message", "id": "b", "text": "hi"}))
+            assert _receive(ws) == {"type": "error", "id": "b", "detail": "Too many messages"}
+            ws.send_text(json.dumps({"type": "cancel", "id": "a"}))
+            assert _receive(ws) == {"type": "error", "id": "a", "detail": "Cancelled"}
+        assert server.stats["rejected_busy"] == 1
+
+    def test_malformed_frame(self):
+        """Test a frame that is not JSON gets an error instead of closing the socket"""
+        client, _ = _client()
+        with client.websocket_connect("/ws/chat?token=good") as ws:
+            ws.send_text("not json")
+            assert _receive(ws)["detail"] == "Malformed frame"
+            ws.send_text(json.dumps({"type": "ping"}))
+            assert _receive(ws) == {"type": "pong"}
+
+    def test_history_is_recorded_and_forwarded(self):
+        """Test turns are stored per user and conversation and passed to the model"""
+
+        class RecordingModel(EchoChatModel):
+            contexts = []
+
+            async def stream_reply(self, claims, conversation, text, token, context=None):
+                self.contexts.append(context)
+                async for delta in super().stream_reply(claims, conversation, text, token):
+                    yield delta
+
+        history = ConversationStore()
+        client, _ = _client(RecordingModel(), history=history)
+        with client.websocket_connect("/ws/chat?token=good") as ws:
+            for message_id in ("a", "b"):
+                frame = {"type": "message", "id": message_id, "conversation": "c1", "text": "hi"}
+                ws.send_text(json.dumps(frame))
+                _collect(ws, [message_id])
+        first, second = RecordingModel.contexts
+        assert first.turns == []
+        assert [(turn.role, turn.text) for turn in second.turns] == [
+            ("user", "hi"),
+            ("assistant", "hi "),
+        ]
+        assert "student-1:c1" in history._sessions
@@ -0,0 +1,93 @@
+"""
+Unit tests for the conversation history store
+"""
+import pytest
+
+from tutor_stack_core.conversations import ConversationStore, Turn, extractive_summary
+
+
+@pytest.mark.unit
+class TestConversationStore:
+    """Tests for windowed context retrieval, summaries and eviction"""
+
+    @pytest.mark.asyncio
+    async def test_window_and_summary(self):
+        """Test turns leaving the window are folded into the summary"""
+        store = ConversationStore(window_turns=3)
+        for i in range(5):
+            await store.append("s1", "user", f"Question {i}. More detail here.")
+        context = await store.context("s1")
+        assert [turn.text for turn in context.turns] == [
+            f"Question {i}. More detail here." for i in (2, 3, 4)
+        ]
+        assert context.summary == "user: Question 0.\nuser: Question 1."
+
+    @pytest.mark.asyncio
+    async def test_token_budget_keeps_newest_turns(self):
+        """Test the context stops at the token budget, dropping the oldest turns first"""
+        store = ConversationStore(window_turns=10)
+        for i in range(4):
+            await store.append("s1", "assistant", f"{i}" * 40)  # 10 tokens each
+        context = await store.context("s1", token_budget=25)
+        assert [turn.text[0] for turn in context.turns] == ["2", "3"]
+        assert context.tokens == 20
+        limited = await store.context("s1", max_turns=1)
+        assert [turn.text[0] for turn in limited.turns] == ["3"]
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction_and_reload(self, tmp_path):
+        """Test an evicted session is reloaded from SQLite with its window and summary"""
+        store = ConversationStore(
+            window_turns=2, max_sessions=1, sqlite_path=str(tmp_path / "chat.db")
+        )
+        for i in range(3):
+            await store.append("s1", "user", f"Turn {i}")
+        await store.append("s2", "user", "Other session")
+        assert store.stats()["evictions"] == 1
+
+        context = await store.context("s1")
+        assert [turn.text for turn in context.turns] == ["Turn 1", "Turn 2"]
+        assert context.summary == "user: Turn 0"
+        assert store.loads == 3  # s1 and s2 on first use, then s1 again
+        await store.append("s1", "assistant", "Turn 3")
+        reopened = ConversationStore(window_turns=2, sqlite_path=str(tmp_path / "chat.db"))
+        context = await reopened.context("s1")
+        assert [turn.text for turn in context.turns] == ["Turn 2", "Turn 3"]
+        store.close()
+        reopened.close()
+
+    @pytest.mark.asyncio
+    async def test_workers_sharing_a_database_keep_every_turn(self, tmp_path):
+        """Test two stores on one SQLite file append to a session without overwriting"""
+        path = str(tmp_path / "chat.db")
+        first = ConversationStore(window_turns=10, sqlite_path=path)
+        second = ConversationStore(window_turns=10, sqlite_path=path)
+        await first.context("s1")
+        await second.context("s1")
+        await first.append("s1", "user", "From worker one")
+        await second.append("s1", "user", "From worker two")
+        await first.append("s1", "assistant", "Answer from worker one")
+
+        reopened = ConversationStore(window_turns=10, sqlite_path=path)
+        context = await reopened.context("s1")
+        assert [turn.text for turn in context.turns] == [
+            "From worker one",
+            "From worker two",
+            "Answer from worker one",
+        ]
+        for store in (first, second, reopened):
+            store.close()
+
+    @pytest.mark.asyncio
+    async def test_rejects_unknown_role(self):
+        """Test appending with an unknown role fails"""
+        with pytest.raises(ValueError):
+            await ConversationStore().append("s1", "narrator", "Once upon a time")
+
+    def test_extractive_summary_stays_within_budget(self):
+        """Test the default summarizer drops the oldest lines to fit its budget"""
+        summary = ""
+        for i in range(50):
+            summary = extractive_summary(summary, Turn("user", f"Sentence number {i}."), 20)
+        assert summary.endswith("user: Sentence number 49.")
+        assert len(summary) <= 80
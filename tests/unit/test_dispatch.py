@@ -0,0 +1,134 @@
+"""
+Unit tests for the prefix-trie route dispatcher
+"""
+import httpx
+import pytest
+from fastapi import APIRouter, FastAPI, Request
+
+from tutor_stack_core.dispatch import PrefixDispatcher, literal_segments
+
+
+async def echo_app(scope, receive, send):
+    body = f"{scope['root_path']}|{scope['path']}".encode()
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": body})
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+    users = APIRouter()
+
+    @users.get("/me")
+    async def me():
+        return {"route": "me"}
+
+    @users.get("/{user_id}")
+    async def user(user_id: str):
+        return {"route": "user", "id": user_id}
+
+    app.include_router(users, prefix="/users")
+
+    @app.get("/health/")
+    async def health():
+        return {"route": "health"}
+
+    @app.post("/admin/refresh")
+    async def refresh():
+        return {"route": "refresh"}
+
+    @app.get("/{page}")
+    async def page(page: str, request: Request):
+        return {"route": "page", "url": str(request.url_for("me"))}
+
+    app.mount("/chat", echo_app)
+    return app
+
+
+PATHS = [
+    ("GET", "/users/me"),
+    ("GET", "/users/42"),
+    ("GET", "/health"),
+    ("GET", "/health/"),
+    ("GET", "/admin/refresh"),
+    ("POST", "/admin/refresh"),
+    ("GET", "/about"),
+    ("GET", "/chat/rooms/1"),
+    ("GET", "/missing/deeper"),
+    ("GET", "/openapi.json"),
+]
+
+
+async def responses(app):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return [
+            (r.status_code, r.headers.get("location"), r.content)
+            for r in [await client.request(method, path) for method, path in PATHS]
+        ]
+
+
+@pytest.mark.unit
+class TestPrefixDispatcher:
+    """Tests for compiling and resolving the route table"""
+
+    def test_literal_segments(self):
+        """Test the static prefix stops at the first parameter"""
+        assert literal_segments("/users/{id}/grades") == ["users"]
+        assert literal_segments("/admin/progress/refresh") == ["admin", "progress", "refresh"]
+        assert literal_segments("/") == []
+        assert literal_segments("/{page}") == []
+
+    def test_candidates_are_narrowed(self):
+        """Test a path only keeps the routes under its prefix plus the catch-alls"""
+        app = build_app()
+        dispatcher = PrefixDispatcher(app.router)
+        dispatcher.compile()
+        total = len(app.router.routes)
+        chat = dispatcher.resolve("/chat/rooms/1")
+        assert len(chat.router.routes) < total
+        assert [getattr(route, "path", None) for route in chat.router.routes][-2:] == [
+            "/{page}",
+            "/chat",
+        ]
+        assert dispatcher.resolve("/nowhere").router.routes != app.router.routes
+
+    @pytest.mark.asyncio
+    async def test_matches_stock_routing(self):
+        """Test every response, including 404, 405 and slash redirects, is unchanged"""
+        expected = await responses(build_app())
+        app = build_app()
+        PrefixDispatcher(app.router).install()
+        assert await responses(app) == expected
+
+    @pytest.mark.asyncio
+    async def test_recompiles_for_late_routes(self):
+        """Test routes added after installing are still reachable"""
+        app = build_app()
+        PrefixDispatcher(app.router).install()
+
+        @app.get("/admin/late")
+        async def late():
+            return {"route": "late"}
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            assert (await client.get("/admin/late")).json() == {"route": "late"}
+
+    def test_tags_follow_segments(self):
+        """Test tags cover whole segments under their prefix only"""
+        app = build_app()
+        dispatcher = PrefixDispatcher(app.router)
+        dispatcher.tag(("/users", "/jwt"), "public")
+        assert "public" in dispatcher.resolve("/users/me").tags
+        assert "public" in dispatcher.resolve("/jwt/login").tags
+        assert "public" not in dispatcher.resolve("/usersettings").tags
+        assert "public" not in dispatcher.resolve("/chat").tags
+
+    def test_lookup_is_cached_per_dispatcher(self):
+        """Test a scope is resolved once per dispatcher"""
+        app = build_app()
+        outer, inner = PrefixDispatcher(app.router), PrefixDispatcher(build_app().router)
+        scope = {"type": "http", "path": "/users/me", "root_path": ""}
+        node = outer.lookup(scope)
+        assert outer.lookup(scope) is node
+        assert inner.lookup(scope) is not node
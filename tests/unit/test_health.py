@@ -0,0 +1,80 @@
+"""
+Unit tests for cached liveness/readiness probes
+"""
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from tutor_stack_core.health import HealthMonitor, asgi_health_probe, call_asgi, database_probe
+
+
+def _service(healthy: bool = True) -> FastAPI:
+    service = FastAPI()
+
+    @service.get("/health")
+    async def health():
+        if not healthy:
+            raise HTTPException(status_code=500)
+        return {"status": "healthy"}
+
+    return service
+
+
+@pytest.mark.unit
+class TestHealthMonitor:
+    """Tests for probe caching and readiness aggregation"""
+
+    @pytest.mark.asyncio
+    async def test_not_ready_before_first_check(self):
+        """Test readiness is false until every probe has run"""
+        monitor = HealthMonitor()
+        monitor.add_probe("service", asgi_health_probe(_service()))
+        assert not monitor.is_ready()
+        await monitor.check()
+        assert monitor.is_ready()
+        assert monitor.report()["checks"]["service"]["ok"] is True
+
+    @pytest.mark.asyncio
+    async def test_failing_and_slow_probes(self):
+        """Test errors and timeouts are recorded per probe"""
+        async def slow():
+            await asyncio.sleep(1)
+
+        monitor = HealthMonitor(timeout=0.05)
+        monitor.add_probe("broken", asgi_health_probe(_service(healthy=False)))
+        monitor.add_probe("slow", slow)
+        monitor.add_probe("healthy", asgi_health_probe(_service()))
+        await monitor.check()
+
+        report = monitor.report()
+        assert report["status"] == "not_ready"
+        assert report["checks"]["broken"]["error"] == "/health returned 500"
+        assert report["checks"]["slow"]["ok"] is False
+        assert report["checks"]["healthy"]["ok"] is True
+
+    @pytest.mark.asyncio
+    async def test_stale_results_are_not_ready(self):
+        """Test a monitor whose probes stopped running reports not ready"""
+        monitor = HealthMonitor(interval=1, timeout=1)
+        monitor.add_probe("service", asgi_health_probe(_service()))
+        await monitor.check()
+        assert monitor.is_ready()
+        assert not monitor.is_ready(now=time.time() + 60)
+
+    @pytest.mark.asyncio
+    async def test_database_probe(self):
+        """Test the database probe runs against a pooled connection"""
+        engine = create_async_engine("sqlite+aiosqlite://")
+        monitor = HealthMonitor()
+        monitor.add_probe("database", database_probe(engine))
+        await monitor.check()
+        await engine.dispose()
+        assert monitor.is_ready()
+
+    @pytest.mark.asyncio
+    async def test_call_asgi_missing_route(self):
+        """Test calling a sub-app without a health route reports its status"""
+        assert await call_asgi(FastAPI(), "/health") == 404
@@ -0,0 +1,185 @@
+"""
+Unit tests for Idempotency-Key handling
+"""
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from tutor_stack_core.idempotency import IdempotencyMiddleware, IdempotencyStore
+
+
+def _app(store: IdempotencyStore, delay: float = 0.0, fail_first: bool = False):
+    app = FastAPI()
+    app.state.calls = 0
+
+    @app.post("/notify/")
+    async def notify(request: Request):
+        app.state.calls += 1
+        await asyncio.sleep(delay)
+        if fail_first and app.state.calls == 1:
+            return JSONResponse({"detail": "busy"}, status_code=503)
+        return {"sent": app.state.calls, "to": (await request.json())["to"]}
+
+    @app.post("/export/")
+    async def export():
+        app.state.calls += 1
+
+        async def rows():
+            for row in range(3):
+                await asyncio.sleep(0.01)
+                yield f"row {row}\n".encode()
+
+        return StreamingResponse(rows(), media_type="text/plain")
+
+    @app.post("/upload/")
+    async def upload(request: Request):
+        app.state.calls += 1
+        return {"size": len(await request.body())}
+
+    app.add_middleware(IdempotencyMiddleware, store=store, max_body=1024, wait_timeout=5)
+    return app
+
+
+def _client(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+@pytest.mark.unit
+class TestIdempotencyMiddleware:
+    """Tests for replaying and coalescing retried POSTs"""
+
+    @pytest.mark.asyncio
+    async def test_retry_is_replayed(self):
+        """Test a retried POST returns the stored response without running again"""
+        app = _app(IdempotencyStore())
+        headers = {"Idempotency-Key": "k1"}
+        async with _client(app) as client:
+            first = await client.post("/notify/", json={"to": "ana"}, headers=headers)
+            retry = await client.post("/notify/", json={"to": "ana"}, headers=headers)
+            other = await client.post("/notify/", json={"to": "ana"})
+        assert first.json() == retry.json() == {"sent": 1, "to": "ana"}
+        assert retry.headers["idempotent-replayed"] == "true"
+        assert other.json()["sent"] == 2
+        assert app.state.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_concurrent_duplicates_wait(self):
+        """Test duplicates arriving mid-flight wait for the first execution"""
+        app = _app(IdempotencyStore(), delay=0.05)
+        headers = {"Idempotency-Key": "k2"}
+        async with _client(app) as client:
+            responses = await asyncio.gather(
+                *(client.post("/notify/", json={"to": "ben"}, headers=headers) for _ in range(5))
+            )
+        assert app.state.calls == 1
+        assert {r.json()["sent"] for r in responses} == {1}
+
+    @pytest.mark.asyncio
+    async def test_mismatched_body_and_transient_failure(self):
+        """Test key reuse with another body is rejected and 5xx responses are not stored"""
+        app = _app(IdempotencyStore(), fail_first=True)
+        headers = {"Idempotency-Key": "k3"}
+        async with _client(app) as client:
+            failed = await client.post("/notify/", json={"to": "cy"}, headers=headers)
+            retried = await client.post("/notify/", json={"to": "cy"}, headers=headers)
+            reused = await client.post("/notify/", json={"to": "dee"}, headers=headers)
+        assert failed.status_code == 503
+        assert retried.json() == {"sent": 2, "to": "cy"}
+        assert reused.status_code == 422
+
+    @pytest.mark.asyncio
+    async def test_sqlite_store_survives_restart(self, tmp_path):
+        """Test responses stored in SQLite replay from a fresh process-local store"""
+        path = str(tmp_path / "idempotency.sqlite")
+        headers = {"Idempotency-Key": "k4"}
+        async with _client(_app(IdempotencyStore(sqlite_path=path))) as client:
+            first = await client.post("/notify/", json={"to": "eve"}, headers=headers)
+
+        restarted = _app(IdempotencyStore(sqlite_path=path))
+        async with _client(restarted) as client:
+            retry = await client.post("/notify/", json={"to": "eve"}, headers=headers)
+        assert retry.json() == first.json()
+        assert restarted.state.calls == 0
+
+    @pytest.mark.asyncio
+    async def test_store_is_bounded(self):
+        """Test the in-memory map evicts the oldest keys past max_entries"""
+        store = IdempotencyStore(max_entries=2)
+        for key in ("a", "b", "c"):
+            assert await store.claim(key, "fp")
+        assert await store.get("a") is None
+        assert await store.get("c") is not None
+
+    @pytest.mark.asyncio
+    async def test_streaming_response_is_stored_whole(self):
+        """Test a keyed streaming response reaches the client in full and replays the same"""
+        app = _app(IdempotencyStore())
+        headers = {"Idempotency-Key": "stream"}
+        async with _client(app) as client:
+            first = await client.post("/export/", content=b"{}", headers=headers)
+            retry = await client.post("/export/", content=b"{}", headers=headers)
+        assert first.text == retry.text == "row 0\nrow 1\nrow 2\n"
+        assert retry.headers["idempotent-replayed"] == "true"
+        assert app.state.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_oversize_body_passes_through(self):
+        """Test a keyed body over max_body runs unbuffered, once per attempt, and is marked"""
+        app = _app(IdempotencyStore())
+        headers = {"Idempotency-Key": "big"}
+
+        async def chunks():
+            for _ in range(4):
+                yield b"x" * 512
+
+        async with _client(app) as client:
+            first = await client.post("/upload/", content=chunks(), headers=headers)
+            retry = await client.post("/upload/", content=b"x" * 2048, headers=headers)
+        assert first.json() == retry.json() == {"size": 2048}
+        assert first.headers["idempotency-skipped"] == "body-too-large"
+        assert "idempotent-replayed" not in retry.headers
+        assert app.state.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_disconnect_mid_body_runs_nothing(self):
+        """Test a body cut short by a disconnect neither runs the handler nor claims the key"""
+        app = _app(IdempotencyStore())
+        messages = [
+            {"type": "http.request", "body": b'{"to": ', "more_body": True},
+            {"type": "http.disconnect"},
+        ]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/notify/",
+            "raw_path": b"/notify/",
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"idempotency-key", b"cut"), (b"content-type", b"application/json")],
+            "server": ("test", 80),
+            "client": ("test", 1234),
+        }
+        await app(scope, receive, send)
+        assert sent == []
+        assert app.state.calls == 0
+
+        async with _client(app) as client:
+            retry = await client.post(
+                "/notify/", json={"to": "ana"}, headers={"Idempotency-Key": "cut"}
+            )
+        assert retry.json() == {"sent": 1, "to": "ana"}
+        assert "idempotent-replayed" not in retry.headers
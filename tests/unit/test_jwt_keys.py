@@ -0,0 +1,239 @@
+"""
+Unit tests for pre-parsed JWT signing and verification keys
+"""
+import os
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+from tutor_stack_core.jwt_keys import (
+    KeyCache,
+    SigningKeys,
+    TokenVerifier,
+    check_edge_key,
+    get_signing_keys,
+    key_algorithm,
+    key_id,
+    load_edge_public_key,
+    load_public_key,
+)
+
+AUDIENCE = ["fastapi-users:auth"]
+
+
+def _generate(algorithm: str):
+    if algorithm == "RS256":
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    if algorithm == "ES256":
+        return ec.generate_private_key(ec.SECP256R1())
+    return ed25519.Ed25519PrivateKey.generate()
+
+
+def _write_pair(tmp_path, private_key, name: str):
+    private_path = tmp_path / f"{name}.key"
+    public_path = tmp_path / f"{name}.key.pub"
+    private_path.write_bytes(
+        private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    public_path.write_bytes(
+        private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+    )
+    return private_path, public_path
+
+
+@pytest.mark.unit
+@pytest.mark.auth
+class TestJWTKeys:
+    """Tests for key loading and multi-algorithm verification"""
+
+    @pytest.mark.parametrize("algorithm", ["RS256", "ES256", "EdDSA"])
+    def test_sign_and_verify(self, algorithm: str):
+        """Test each supported algorithm round-trips with parsed key objects"""
+        private_key = _generate(algorithm)
+        assert key_algorithm(private_key.public_key()) == algorithm
+
+        token = jwt.encode({"sub": "user-1", "aud": AUDIENCE}, private_key, algorithm=algorithm)
+        claims = TokenVerifier(KeyCache.from_keys([private_key.public_key()])).verify(token)
+        assert claims["sub"] == "user-1"
+
+    def test_migration_accepts_old_and_new_algorithms(self):
+        """Test a verifier with two keys accepts tokens from either"""
+        old_key, new_key = _generate("RS256"), _generate("EdDSA")
+        verifier = TokenVerifier(KeyCache.from_keys([new_key.public_key(), old_key.public_key()]))
+
+        for key, algorithm in ((old_key, "RS256"), (new_key, "EdDSA")):
+            token = jwt.encode({"sub": "u", "aud": AUDIENCE}, key, algorithm=algorithm)
+            assert verifier.verify(token)["sub"] == "u"
+
+    def test_rejects_unregistered_algorithm(self):
+        """Test tokens signed with an algorithm that has no registered key are rejected"""
+        verifier = TokenVerifier(KeyCache.from_keys([_generate("EdDSA").public_key()]))
+        token = jwt.encode({"sub": "u", "aud": AUDIENCE}, "hmac-secret", algorithm="HS256")
+        with pytest.raises(jwt.InvalidAlgorithmError):
+            verifier.verify(token)
+
+    def test_rejects_p384_curve(self):
+        """Test ES256 is restricted to P-256 keys"""
+        with pytest.raises(ValueError):
+            key_algorithm(ec.generate_private_key(ec.SECP384R1()).public_key())
+
+    def test_get_signing_keys_from_env(self, tmp_path, monkeypatch):
+        """Test the configured key pair is parsed and validated against JWT_ALG"""
+        private_path, public_path = _write_pair(tmp_path, _generate("ES256"), "jwtES256")
+        monkeypatch.setenv("SECRET_PRIVATE_KEY_PATH", str(private_path))
+        monkeypatch.setenv("SECRET_PUBLIC_KEY_PATH", str(public_path))
+        monkeypatch.setenv("JWT_ALG", "ES256")
+        get_signing_keys.cache_clear()
+        try:
+            keys = get_signing_keys()
+            assert keys.algorithm == "ES256"
+            assert get_signing_keys() is keys
+
+            monkeypatch.setenv("JWT_ALG", "RS256")
+            get_signing_keys.cache_clear()
+            with pytest.raises(RuntimeError):
+                get_signing_keys()
+        finally:
+            get_signing_keys.cache_clear()
+
+
+@pytest.mark.unit
+@pytest.mark.auth
+class TestKeyCache:
+    """Tests for the kid-indexed key cache and directory rotation"""
+
+    def _sign(self, keys, sub: str = "u") -> str:
+        return jwt.encode(
+            {"sub": sub, "aud": AUDIENCE},
+            keys.private_key,
+            algorithm=keys.algorithm,
+            headers={"kid": keys.kid},
+        )
+
+    def test_kid_is_rfc7638_thumbprint(self):
+        """Test the kid matches the RFC 7638 example thumbprint"""
+        jwk = {
+            "kty": "RSA",
+            "e": "AQAB",
+            "n": (
+                "0vx7agoebGcQSuuPiLJXZptN9nndrQmbXEps2aiAFbWhM78LhWx4cbbfAAtVT86zwu1RK7aPFFxuhDR1"
+                "L6tSoc_BJECPebWKRXjBZCiFV4n3oknjhMstn64tZ_2W-5JsGY4Hc5n9yBXArwl93lqt7_RN5w6Cf0h4"
+                "QyQ5v-65YGjQR0_FDW2QvzqY368QQMicAtaSqzs8KJZgnYb9c7d0zgdAZHzu6qMQvRL5hajrn1n91CbO"
+                "pbISD08qNLyrdkt-bFTWhAI4vMQFh6WeZu0fM4lFd2NcRwr3XPksINHaQ-G_xBniIqbw0Ls1jF44-csF"
+                "Cur-kEgU8awapJzKnqDKgw"
+            ),
+        }
+        public_key = jwt.algorithms.RSAAlgorithm.from_jwk(jwk)
+        assert key_id(public_key) == "NzbLsXh8uDCcd-6MNwXF4W_7noWXFZAfHkxZsRGC9Xs"
+
+    def test_jwks_lists_every_key(self):
+        """Test the JWKS document carries kid, alg and use for each key"""
+        keys = [_generate("RS256").public_key(), _generate("EdDSA").public_key()]
+        cache = KeyCache.from_keys(keys)
+
+        published = {jwk["kid"]: jwk for jwk in cache.jwks["keys"]}
+        assert set(published) == {key_id(key) for key in keys}
+        assert {jwk["alg"] for jwk in published.values()} == {"RS256", "EdDSA"}
+        assert all(jwk["use"] == "sig" for jwk in published.values())
+
+    def test_unknown_kid_is_rejected(self):
+        """Test a token naming a kid that is not cached fails verification"""
+        cache = KeyCache.from_keys([_generate("EdDSA").public_key()])
+        other = _generate("EdDSA")
+        token = jwt.encode(
+            {"sub": "u", "aud": AUDIENCE}, other, algorithm="EdDSA", headers={"kid": "nope"}
+        )
+        with pytest.raises(jwt.InvalidKeyError):
+            TokenVerifier(cache).verify(token)
+
+    def test_rotation_from_key_directory(self, tmp_path):
+        """Test new keys hot-reload and old and new tokens validate during the overlap"""
+        old_private, _ = _write_pair(tmp_path, _generate("RS256"), "old")
+        now = time.time()
+        os.utime(old_private, (now - 100, now - 100))
+        cache = KeyCache(key_dir=str(tmp_path), activation_delay=0)
+        verifier = TokenVerifier(cache)
+        old = cache.signing_keys()
+        old_token = self._sign(old)
+        assert cache.reload() is False
+
+        new_private, _ = _write_pair(tmp_path, _generate("EdDSA"), "new")
+        os.utime(new_private, (now - 50, now - 50))
+        assert cache.reload() is True
+
+        new = cache.signing_keys()
+        assert new.kid != old.kid
+        assert new.algorithm == "EdDSA"
+        assert verifier.verify(old_token)["sub"] == "u"
+        assert verifier.verify(self._sign(new))["sub"] == "u"
+
+        # Retiring the old pair stops its tokens validating
+        (tmp_path / "old.key").unlink()
+        (tmp_path / "old.key.pub").unlink()
+        cache.reload()
+        with pytest.raises(jwt.InvalidKeyError):
+            verifier.verify(old_token)
+
+    def test_new_key_waits_for_activation_delay(self, tmp_path):
+        """Test signing keeps the fallback key until a new key has been out long enough"""
+        fallback = _generate("ES256")
+        static = SigningKeys("ES256", fallback, fallback.public_key(), key_id(fallback.public_key()))
+        _write_pair(tmp_path, _generate("EdDSA"), "fresh")
+
+        cache = KeyCache(signing_keys=static, key_dir=str(tmp_path), activation_delay=3600)
+        assert cache.signing_keys() is static
+        assert len(cache.by_kid) == 2
+
+    def test_edge_key_must_match_active_key(self, tmp_path):
+        """Test startup is refused when the edge's inlined PEM or algorithm differs"""
+        signer = _generate("RS256")
+        _, public_path = _write_pair(tmp_path, signer, "edge")
+        pem = public_path.read_text().strip().replace("\n", "\n            ")
+        config = tmp_path / "traefik-dynamic.yml"
+        config.write_text(f"jwt:\n  secret: |\n            {pem}\n  headerName: Authorization\n")
+        edge_key = load_edge_public_key(str(config))
+        assert key_id(edge_key) == key_id(signer.public_key())
+
+        public_key = signer.public_key()
+        cache = KeyCache(signing_keys=SigningKeys("RS256", signer, public_key, key_id(public_key)))
+        check_edge_key(cache, edge_key)
+        with pytest.raises(RuntimeError):
+            check_edge_key(cache, edge_key, "ES256")
+        other = _generate("RS256").public_key()
+        with pytest.raises(RuntimeError):
+            check_edge_key(cache, other)
+
+    def test_rotation_waits_for_the_edge(self, tmp_path):
+        """Test a rotated key only signs once the edge config carries it, across reloads"""
+        key_dir = tmp_path / "keys"
+        key_dir.mkdir()
+        old_private, old_public = _write_pair(key_dir, _generate("RS256"), "old")
+        now = time.time()
+        os.utime(old_private, (now - 100, now - 100))
+        config = tmp_path / "traefik-dynamic.yml"
+        config.write_text(f"jwt:\n  secret: |\n{old_public.read_text()}")
+        cache = KeyCache(key_dir=str(key_dir), activation_delay=0, edge_key_path=str(config))
+        old = cache.signing_keys()
+
+        _, new_public = _write_pair(key_dir, _generate("RS256"), "new")
+        assert cache.reload() is True
+        assert cache.signing_keys().kid == old.kid
+        assert len(cache.by_kid) == 2
+
+        config.write_text(f"jwt:\n  secret: |\n{new_public.read_text()}")
+        os.utime(config, (now + 10, now + 10))
+        assert cache.reload() is True
+        assert cache.signing_keys().kid == key_id(load_public_key(str(new_public)))
+
+        wrong = KeyCache(key_dir=str(key_dir), edge_key_path=str(config), edge_algorithm="ES256")
+        with pytest.raises(RuntimeError):
+            check_edge_key(wrong, wrong.edge_key, wrong.edge_algorithm)
@@ -0,0 +1,82 @@
+"""
+Unit tests for the structured, non-blocking logging pipeline
+"""
+import io
+import json
+import logging
+
+import pytest
+
+from tutor_stack_core.logs import (
+    ACCESS_LOGGER,
+    DroppingQueueHandler,
+    JSONFormatter,
+    SamplingFilter,
+    configure_logging,
+    request_id_var,
+)
+
+
+@pytest.fixture
+def restore_logging():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+    logging.getLogger(ACCESS_LOGGER).filters.clear()
+
+
+def _record(level=logging.INFO, msg="hello %s", args=("world",), **extra):
+    record = logging.LogRecord("tutor_stack.test", level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+@pytest.mark.unit
+class TestLogPipeline:
+    """Tests for JSON records, dropping and sampling"""
+
+    def test_json_formatter(self):
+        """Test records become one JSON object with extra fields at the top level"""
+        line = JSONFormatter().format(_record(request_id="abc", duration_ms=1.5))
+        entry = json.loads(line)
+        assert entry["msg"] == "hello world"
+        assert entry["level"] == "INFO"
+        assert entry["request_id"] == "abc"
+        assert entry["duration_ms"] == 1.5
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        """Test records past the queue bound are counted and discarded"""
+        handler = DroppingQueueHandler(maxsize=2)
+        for _ in range(5):
+            handler.handle(_record())
+        assert handler.queue.qsize() == 2
+        assert handler.dropped == 3
+
+    def test_sampling_keeps_warnings(self):
+        """Test sampled-out levels still pass warnings and errors"""
+        sampler = SamplingFilter(0.0)
+        assert not sampler.filter(_record(logging.INFO))
+        assert sampler.filter(_record(logging.ERROR))
+
+    def test_pipeline_writes_with_request_id(self, restore_logging):
+        """Test records go through the writer thread tagged with the request ID"""
+        stream = io.StringIO()
+        pipeline = configure_logging(access_sample_rate=0.0, stream=stream)
+        context = request_id_var.set("req-1")
+        try:
+            logging.getLogger("tutor_stack.test").info("graded %d answers", 3, extra={"n": 3})
+            logging.getLogger(ACCESS_LOGGER).info("GET / 200")
+            logging.getLogger(ACCESS_LOGGER).warning("GET /boom 500")
+        finally:
+            request_id_var.reset(context)
+        pipeline.stop()
+
+        entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert [entry["msg"] for entry in entries] == ["graded 3 answers", "GET /boom 500"]
+        assert {entry["request_id"] for entry in entries} == {"req-1"}
+        assert pipeline.stats()["dropped"] == 0
@@ -0,0 +1,173 @@
+"""
+Unit tests for streaming media upload and Range serving
+"""
+import asyncio
+import hashlib
+import os
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from tutor_stack_core.media import MediaStore, create_media_router
+
+VIDEO = bytes(range(256)) * 8192  # 2 MiB, so uploads span several write buffers
+
+
+def build(tmp_path, max_bytes=4 * 1024 * 1024, quota_bytes=None):
+    store = MediaStore(str(tmp_path), max_bytes=max_bytes, quota_bytes=quota_bytes)
+    app = FastAPI()
+    app.include_router(create_media_router(store, lambda: SimpleNamespace(id="teacher")))
+    transport = httpx.ASGITransport(app=app)
+    return store, httpx.AsyncClient(transport=transport, base_url="http://test")
+
+
+async def chunked(data, size=65536):
+    for offset in range(0, len(data), size):
+        yield data[offset:offset + size]
+
+
+@pytest.mark.unit
+class TestMediaUpload:
+    """Tests for streamed, hashed, size-limited and deduplicated uploads"""
+
+    @pytest.mark.asyncio
+    async def test_upload_is_content_addressed_and_deduplicated(self, tmp_path):
+        """Test the ID is the SHA-256 and a second identical upload is stored once"""
+        store, client = build(tmp_path)
+        async with client:
+            headers = {"content-type": "video/mp4"}
+            first = await client.post("/media", content=chunked(VIDEO), headers=headers)
+            second = await client.post("/media", content=VIDEO, headers=headers)
+        assert first.status_code == 201
+        assert second.status_code == 200
+        digest = hashlib.sha256(VIDEO).hexdigest()
+        assert first.json()["id"] == second.json()["id"] == digest
+        assert second.json()["deduplicated"] is True
+        assert first.json()["url"] == f"/media/{digest}"
+        assert store.stats["bytes_stored"] == len(VIDEO)
+        assert os.listdir(store.incoming) == []
+
+    @pytest.mark.asyncio
+    async def test_oversize_and_wrong_type_are_rejected(self, tmp_path):
+        """Test a streamed body over the limit stops with 413 and leaves nothing behind"""
+        store, client = build(tmp_path, max_bytes=1024 * 1024)
+        async with client:
+            streamed = await client.post(
+                "/media", content=chunked(VIDEO), headers={"content-type": "video/mp4"}
+            )
+            declared = await client.post(
+                "/media", content=VIDEO, headers={"content-type": "video/mp4"}
+            )
+            wrong_type = await client.post(
+                "/media", content=b"<html>", headers={"content-type": "text/html"}
+            )
+        assert streamed.status_code == 413
+        assert declared.status_code == 413
+        assert wrong_type.status_code == 415
+        assert os.listdir(store.incoming) == []
+        assert os.listdir(store.objects) == []
+        assert store.stats["rejected"] == 3
+
+    @pytest.mark.asyncio
+    async def test_scriptable_types_are_rejected(self, tmp_path):
+        """Test SVG, HTML and XML are refused even though they look like images or documents"""
+        _, client = build(tmp_path)
+        async with client:
+            for media_type in ("image/svg+xml", "text/html", "application/xml", "image/"):
+                response = await client.post(
+                    "/media", content=b"<svg onload=alert(1)>", headers={"content-type": media_type}
+                )
+                assert response.status_code == 415
+
+    @pytest.mark.asyncio
+    async def test_quota_per_uploader(self, tmp_path):
+        """Test an uploader past their quota is refused and the usage survives a restart"""
+        store, client = build(tmp_path, quota_bytes=len(VIDEO) + 1024)
+        async with client:
+            headers = {"content-type": "video/mp4"}
+            first = await client.post("/media", content=VIDEO, headers=headers)
+            streamed = await client.post("/media", content=chunked(VIDEO[::-1]), headers=headers)
+            declared = await client.post("/media", content=VIDEO[::-1], headers=headers)
+        assert first.status_code == 201
+        assert streamed.status_code == declared.status_code == 413
+        assert "quota" in streamed.json()["detail"]
+        assert store.usage == {"teacher": len(VIDEO)}
+        assert os.listdir(store.incoming) == []
+        assert MediaStore(str(tmp_path)).usage == {"teacher": len(VIDEO)}
+
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_uploads_create_once(self, tmp_path):
+        """Test of two identical uploads racing in two workers, exactly one creates the object"""
+        workers = [MediaStore(str(tmp_path)) for _ in range(2)]
+        results = await asyncio.gather(
+            *(
+                worker.save(chunked(VIDEO), "video/mp4", owner=owner)
+                for worker, owner in zip(workers, ("ana", "ben"))
+            )
+        )
+        assert sorted(created for _, created in results) == [False, True]
+        assert results[0][0].digest == results[1][0].digest == hashlib.sha256(VIDEO).hexdigest()
+        assert sum(sum(worker.usage.values()) for worker in workers) == len(VIDEO)
+        objects = os.path.dirname(results[0][0].path)
+        assert sorted(os.listdir(objects)) == [results[0][0].digest, results[0][0].digest + ".json"]
+        assert os.listdir(workers[0].incoming) == []
+
+
+@pytest.mark.unit
+class TestMediaDownload:
+    """Tests for Range, If-Range and conditional downloads"""
+
+    @pytest.mark.asyncio
+    async def test_range_requests(self, tmp_path):
+        """Test single ranges, If-Range and If-None-Match against the digest ETag"""
+        _, client = build(tmp_path)
+        async with client:
+            uploaded = await client.post(
+                "/media", content=VIDEO, headers={"content-type": "video/mp4"}
+            )
+            url = uploaded.json()["url"]
+            etag = f'"{uploaded.json()["id"]}"'
+
+            full = await client.get(url)
+            assert full.content == VIDEO
+            assert full.headers["etag"] == etag
+            assert full.headers["accept-ranges"] == "bytes"
+            assert "immutable" in full.headers["cache-control"]
+            assert full.headers["x-content-type-options"] == "nosniff"
+            assert "content-disposition" not in full.headers
+
+            partial = await client.get(url, headers={"range": "bytes=1000-1999"})
+            assert partial.status_code == 206
+            assert partial.content == VIDEO[1000:2000]
+            assert partial.headers["content-range"] == f"bytes 1000-1999/{len(VIDEO)}"
+
+            matching = await client.get(url, headers={"range": "bytes=-10", "if-range": etag})
+            assert matching.status_code == 206
+            assert matching.content == VIDEO[-10:]
+
+            stale = await client.get(url, headers={"range": "bytes=0-9", "if-range": '"old"'})
+            assert stale.status_code == 200
+            assert len(stale.content) == len(VIDEO)
+
+            unsatisfiable = await client.get(url, headers={"range": f"bytes={len(VIDEO)}-"})
+            assert unsatisfiable.status_code == 416
+
+            cached = await client.get(url, headers={"if-none-match": etag})
+            assert cached.status_code == 304
+
+            assert (await client.get("/media/" + "0" * 64)).status_code == 404
+            assert (await client.get("/media/..%2F..%2Fetc")).status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_images_download_as_attachments(self, tmp_path):
+        """Test types a browser would not play inline are sent as downloads"""
+        _, client = build(tmp_path)
+        async with client:
+            uploaded = await client.post(
+                "/media", content=b"\x89PNG\r\n", headers={"content-type": "image/png"}
+            )
+            response = await client.get(uploaded.json()["url"])
+        assert response.headers["content-disposition"] == "attachment"
+        assert response.headers["x-content-type-options"] == "nosniff"
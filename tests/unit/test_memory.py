@@ -0,0 +1,94 @@
+"""
+Unit tests for memory instrumentation
+"""
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from tutor_stack_core.memory import (
+    MemoryMiddleware,
+    MemoryTracker,
+    create_memory_router,
+    process_stats,
+)
+
+_leak = []
+
+
+def _app(tracker):
+    app = FastAPI()
+
+    @app.get("/chat/leaky")
+    async def leaky():
+        _leak.append(bytearray(64 * 1024))
+        return {"ok": True}
+
+    @app.get("/content/fine")
+    async def fine():
+        return {"ok": True}
+
+    app.include_router(create_memory_router(lambda: {"id": "admin"}, tracker), prefix="/admin")
+    app.add_middleware(MemoryMiddleware, tracker=tracker, prefixes=["/chat", "/content"])
+    return app
+
+
+@pytest.fixture
+def tracker():
+    tracker = MemoryTracker(sample_rate=1.0)
+    tracker.start()
+    yield tracker
+    tracker.stop()
+    _leak.clear()
+
+
+@pytest.mark.unit
+class TestMemoryInstrumentation:
+    """Tests for per-prefix deltas, growth diffs and process stats"""
+
+    @pytest.mark.asyncio
+    async def test_leaking_prefix_stands_out(self, tracker):
+        """Test allocations retained by a handler are attributed to its prefix and site"""
+        transport = httpx.ASGITransport(app=_app(tracker))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            for _ in range(5):
+                await client.get("/chat/leaky")
+                await client.get("/content/fine")
+            growth = (await client.post("/admin/memory/snapshot")).json()
+            report = (await client.get("/admin/memory")).json()
+
+        prefixes = report["prefixes"]
+        assert prefixes["/chat"]["samples"] == 5
+        assert prefixes["/chat"]["mean_delta_kib"] >= 64
+        assert prefixes["/content"]["mean_delta_kib"] < 64
+        assert any(
+            "test_memory.py" in site["site"] and site["size_diff_kib"] >= 320
+            for site in growth["since_start"]
+        )
+        assert report["process"]["gc"]["enabled"] is True
+
+    @pytest.mark.asyncio
+    async def test_snapshot_requires_tracing(self):
+        """Test the snapshot endpoint refuses when instrumentation is off"""
+        transport = httpx.ASGITransport(app=_app(MemoryTracker()))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            assert (await client.post("/admin/memory/snapshot")).status_code == 409
+            report = (await client.get("/admin/memory")).json()
+        assert report["tracing"] is False
+        assert "rss_kib" in report["process"] or "peak_rss_kib" in report["process"]
+
+    @pytest.mark.asyncio
+    async def test_snapshot_loop_survives_failures(self, caplog):
+        """Test a failing periodic snapshot is logged and the loop keeps running"""
+        task = asyncio.create_task(MemoryTracker().run_snapshots(0.01))
+        await asyncio.sleep(0.05)
+        assert not task.done()
+        task.cancel()
+        assert "Memory snapshot failed" in caplog.text
+
+    def test_process_stats(self):
+        """Test process stats report RSS and per-generation GC counters"""
+        stats = process_stats()
+        assert stats.get("rss_kib", stats.get("peak_rss_kib")) > 0
+        assert len(stats["gc"]["generations"]) == 3
@@ -0,0 +1,77 @@
+"""
+Unit tests for the cached OpenAPI schema
+"""
+import gzip
+import json
+import sys
+import types
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from tutor_stack_core.openapi import OpenAPIDocument, build, serve_cached_openapi
+
+
+def _app() -> FastAPI:
+    app = FastAPI(title="Cached")
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    return app
+
+
+@pytest.mark.unit
+class TestCachedOpenAPI:
+    """Tests for serving the pre-serialized schema"""
+
+    @pytest.mark.asyncio
+    async def test_served_once_with_etag_and_gzip(self):
+        """Test the schema is generated once and revalidates with 304"""
+        app = _app()
+        calls = []
+        generate = app.openapi
+        app.openapi = lambda: calls.append(1) or generate()
+        serve_cached_openapi(app)
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            plain = await client.get("/openapi.json", headers={"Accept-Encoding": "identity"})
+            zipped = await client.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+            cached = await client.get(
+                "/openapi.json",
+                headers={"Accept-Encoding": "identity", "If-None-Match": plain.headers["etag"]},
+            )
+        assert calls == [1]
+        assert "/items/{item_id}" in plain.json()["paths"]
+        assert "content-encoding" not in plain.headers
+        assert plain.headers["cache-control"] == "public, max-age=300"
+        assert zipped.headers["content-encoding"] == "gzip"
+        assert zipped.headers["etag"] != plain.headers["etag"]
+        assert zipped.json() == plain.json()
+        assert cached.status_code == 304
+        assert [r.path for r in app.routes].count("/openapi.json") == 1
+
+    def test_negotiation_respects_zero_quality(self):
+        """Test q=0 excludes an encoding"""
+        document = OpenAPIDocument(b"{}")
+        assert document.negotiate("gzip;q=0, identity") == "identity"
+        assert document.negotiate("deflate, gzip;q=0.5") == "gzip"
+        assert document.negotiate("") == "identity"
+
+    @pytest.mark.asyncio
+    async def test_loads_prebuilt_file(self, tmp_path, monkeypatch):
+        """Test a schema written ahead of time is served without generating one"""
+        path = tmp_path / "openapi.json"
+        module = types.ModuleType("prebuilt_app")
+        module.app = _app()
+        monkeypatch.setitem(sys.modules, "prebuilt_app", module)
+        build("prebuilt_app:app", str(path))
+
+        app = _app()
+        app.openapi = lambda: pytest.fail("schema should come from the file")
+        cache = serve_cached_openapi(app, str(path))
+        assert json.loads(cache.document().body)["info"]["title"] == "Cached"
+        assert gzip.decompress(cache.document().variants["gzip"]) == path.read_bytes()
@@ -0,0 +1,69 @@
+"""
+Unit tests for the on-demand sampling profiler
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from tutor_stack_core.profiling import SamplingProfiler, create_profiling_router
+
+
+def busy_handler(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+async def _block_loop():
+    await asyncio.sleep(0.05)
+    busy_handler(0.2)
+
+
+@pytest.mark.unit
+class TestSamplingProfiler:
+    """Tests for stack sampling, loop lag and output formats"""
+
+    @pytest.mark.asyncio
+    async def test_blocking_code_shows_up(self):
+        """Test a callback blocking the loop is sampled, delays the loop and is reported slow"""
+        profiler = SamplingProfiler()
+        blocker = asyncio.create_task(_block_loop())
+        profile = await profiler.profile(0.4, interval=0.002, slow_callback_threshold=0.1)
+        await blocker
+
+        assert profile.samples > 0
+        assert "busy_handler (test_profiling.py:" in profile.collapsed()
+        assert profile.lag.summary()["max_ms"] > 100
+        assert profile.slow_callbacks and profile.slow_callbacks[0]["duration_ms"] >= 100
+        assert not asyncio.get_running_loop().get_debug()
+
+    @pytest.mark.asyncio
+    async def test_speedscope_document(self):
+        """Test speedscope output references shared frames and weighs samples in seconds"""
+        profile = await SamplingProfiler().profile(0.05, interval=0.002)
+        document = profile.speedscope()
+        sampled = document["profiles"][0]
+        frame_count = len(document["shared"]["frames"])
+        assert sampled["type"] == "sampled"
+        assert len(sampled["samples"]) == len(sampled["weights"]) == len(profile.stacks)
+        assert all(0 <= i < frame_count for sample in sampled["samples"] for i in sample)
+
+    @pytest.mark.asyncio
+    async def test_one_profile_at_a_time(self):
+        """Test the endpoint refuses a second concurrent profile with 409"""
+        app = FastAPI()
+        app.include_router(create_profiling_router(lambda: {"id": "admin"}), prefix="/admin")
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = asyncio.create_task(client.post("/admin/profile?seconds=0.3"))
+            await asyncio.sleep(0.1)
+            second = await client.post("/admin/profile?seconds=0.1&format=collapsed")
+            assert second.status_code == 409
+            response = await first
+            assert response.status_code == 200
+            assert response.json()["samples"] > 0
+            bad = await client.post("/admin/profile?format=svg")
+            assert bad.status_code == 400
@@ -0,0 +1,91 @@
+"""
+Unit tests for the out-of-process service proxy
+"""
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from tutor_stack_core.proxy import ServiceProxy
+
+
+def _upstream() -> FastAPI:
+    service = FastAPI()
+
+    @service.get("/items/{item_id}")
+    async def item(item_id: int, request: Request):
+        return {
+            "id": item_id,
+            "query": request.url.query,
+            "prefix": request.headers.get("x-forwarded-prefix"),
+            "proxy_auth": request.headers.get("proxy-authorization"),
+        }
+
+    @service.post("/echo")
+    async def echo(request: Request):
+        return {"size": len(await request.body())}
+
+    @service.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(3):
+                yield f"chunk{i}\n".encode()
+
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    return service
+
+
+def _gateway(upstream_transport: httpx.AsyncBaseTransport) -> FastAPI:
+    client = httpx.AsyncClient(transport=upstream_transport, base_url="http://service")
+    gateway = FastAPI()
+    gateway.mount("/content", ServiceProxy("http://service", client=client))
+    return gateway
+
+
+@pytest.mark.unit
+class TestServiceProxy:
+    """Tests for request forwarding through a mounted proxy"""
+
+    @pytest.mark.asyncio
+    async def test_strips_mount_prefix_and_forwards_query(self):
+        """Test the upstream sees the path relative to the mount plus forwarding headers"""
+        gateway = _gateway(httpx.ASGITransport(app=_upstream()))
+        transport = httpx.ASGITransport(app=gateway)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get(
+                "/content/items/7?lang=en", headers={"Proxy-Authorization": "Basic Zm9vOmJhcg=="}
+            )
+        assert response.status_code == 200
+        assert response.json() == {
+            "id": 7,
+            "query": "lang=en",
+            "prefix": "/content",
+            "proxy_auth": None,
+        }
+
+    @pytest.mark.asyncio
+    async def test_streams_bodies_both_ways(self):
+        """Test request bodies reach the upstream and streamed responses come back whole"""
+        gateway = _gateway(httpx.ASGITransport(app=_upstream()))
+        transport = httpx.ASGITransport(app=gateway)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            echoed = await client.post("/content/echo", content=b"x" * 100_000)
+            streamed = await client.get("/content/stream")
+        assert echoed.json() == {"size": 100_000}
+        assert streamed.text == "chunk0\nchunk1\nchunk2\n"
+
+    @pytest.mark.asyncio
+    async def test_upstream_failures(self):
+        """Test connection errors map to 502 and timeouts to 504"""
+
+        def fail(exc):
+            def handler(request):
+                raise exc("upstream", request=request)
+
+            return httpx.MockTransport(handler)
+
+        for exc, status in ((httpx.ConnectError, 502), (httpx.ReadTimeout, 504)):
+            transport = httpx.ASGITransport(app=_gateway(fail(exc)))
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                assert (await client.get("/content/items/1")).status_code == status
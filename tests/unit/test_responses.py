@@ -0,0 +1,89 @@
+"""
+Unit tests for the orjson-backed response class
+"""
+import datetime
+import decimal
+import enum
+import uuid
+
+import httpx
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from tutor_stack_core.responses import FastJSONResponse, dumps
+
+
+class Level(enum.Enum):
+    BEGINNER = "beginner"
+
+
+class Attempt(BaseModel):
+    id: uuid.UUID
+    submitted_at: datetime.datetime
+    score: float
+
+
+def _payload():
+    ist = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+    return {
+        "naive": datetime.datetime(2024, 3, 1, 9, 30),
+        "aware": datetime.datetime(2024, 3, 1, 9, 30, 0, 125, tzinfo=ist),
+        "day": datetime.date(2024, 3, 1),
+        "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+        "level": Level.BEGINNER,
+        "score": decimal.Decimal("7.5"),
+        "tags": {"algebra"},
+        "title": "Brüche   分数",
+        "by_week": {1: 0.5, 2: 0.75},
+        "attempt": Attempt(
+            id=uuid.UUID(int=1), submitted_at=datetime.datetime(2024, 3, 1), score=0.9
+        ),
+        "huge": 2**70,
+    }
+
+
+@pytest.mark.unit
+class TestFastJSONResponse:
+    """Tests for output parity with the stock JSONResponse"""
+
+    def test_matches_stdlib_bytes(self):
+        """Test datetimes, UUIDs, enums, models and int keys serialize byte for byte"""
+        payload = _payload()
+        assert dumps(payload) == JSONResponse(jsonable_encoder(payload)).body
+
+    def test_unserializable_still_raises(self):
+        """Test types neither encoder understands raise instead of emitting garbage"""
+        with pytest.raises((TypeError, ValueError)):
+            dumps({"value": object()})
+
+    @pytest.mark.asyncio
+    async def test_default_response_class_reaches_included_routers(self):
+        """Test routers included into the app inherit the orjson response class"""
+        router = APIRouter()
+
+        @router.get("/attempts", response_model=list[Attempt])
+        async def attempts():
+            return [_payload()["attempt"]]
+
+        app = FastAPI(default_response_class=FastJSONResponse)
+        app.include_router(router, prefix="/users")
+
+        @app.get("/raw")
+        async def raw():
+            return _payload()
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            listed = await client.get("/users/attempts")
+            raw = await client.get("/raw")
+        assert listed.json() == [
+            {
+                "id": "00000000-0000-0000-0000-000000000001",
+                "submitted_at": "2024-03-01T00:00:00",
+                "score": 0.9,
+            }
+        ]
+        assert raw.content == JSONResponse(jsonable_encoder(_payload())).body
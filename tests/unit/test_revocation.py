@@ -0,0 +1,213 @@
+"""
+Unit tests for Bloom-filter backed token revocation
+"""
+import asyncio
+import time
+import uuid
+
+import httpx
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from sqlalchemy import Boolean, String, Uuid, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+from tutor_stack_core.revocation import (
+    BloomFilter,
+    RevocationChecker,
+    RevocationStore,
+    create_revocation_router,
+)
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Account(Base):
+    __tablename__ = "user"
+
+    id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, default=uuid.uuid4)
+    email: Mapped[str] = mapped_column(String(320))
+    is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+
+
+@pytest_asyncio.fixture
+async def store():
+    """Revocation store on an in-memory SQLite database, next to a user table"""
+    engine = create_async_engine("sqlite+aiosqlite://")
+    store = RevocationStore(async_sessionmaker(engine, expire_on_commit=False))
+    await store.create_table(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield store
+    await engine.dispose()
+
+
+@pytest.mark.unit
+class TestBloomFilter:
+    """Tests for the Bloom filter itself"""
+
+    def test_no_false_negatives(self):
+        """Test every added item is reported as present"""
+        bloom = BloomFilter(1000, 0.01)
+        items = [f"jti:{i}" for i in range(1000)]
+        for item in items:
+            bloom.add(item)
+        assert all(item in bloom for item in items)
+        assert len(bloom) == 1000
+
+    def test_false_positive_rate_is_near_target(self):
+        """Test the observed false-positive rate stays close to the configured one"""
+        bloom = BloomFilter(5000, 0.01)
+        for i in range(5000):
+            bloom.add(f"user:{i}")
+        false_positives = sum(f"other:{i}" in bloom for i in range(20000))
+        assert false_positives / 20000 < 0.02
+
+    def test_rejects_invalid_error_rate(self):
+        """Test the error rate must be a probability"""
+        with pytest.raises(ValueError):
+            BloomFilter(10, 1.5)
+
+
+@pytest.mark.unit
+@pytest.mark.auth
+class TestRevocationChecker:
+    """Tests for revocation checks against the store"""
+
+    @pytest.mark.asyncio
+    async def test_unrevoked_token_skips_the_store(self, store):
+        """Test a filter negative answers without touching the database"""
+        checker = RevocationChecker(store, capacity=100)
+        assert not await checker.is_revoked({"sub": "u1", "jti": "a", "iat": 1})
+        assert checker.stats["positives"] == 0
+
+    @pytest.mark.asyncio
+    async def test_revoked_jti(self, store):
+        """Test a revoked jti is rejected and a different jti is not"""
+        checker = RevocationChecker(store, capacity=100)
+        await checker.revoke_token("abc", expires_at=time.time() + 60)
+
+        assert await checker.is_revoked({"sub": "u1", "jti": "abc", "iat": 1})
+        assert not await checker.is_revoked({"sub": "u1", "jti": "def", "iat": 1})
+
+    @pytest.mark.asyncio
+    async def test_other_workers_see_revocations_after_refresh(self, store):
+        """Test incremental refresh folds in entries written by another worker"""
+        worker_a = RevocationChecker(store, capacity=100)
+        worker_b = RevocationChecker(store, capacity=100)
+        await worker_a.revoke_token("abc")
+
+        claims = {"sub": "u1", "jti": "abc", "iat": 1}
+        assert not await worker_b.is_revoked(claims)
+        assert await worker_b.refresh() == 1
+        assert await worker_b.is_revoked(claims)
+        assert await worker_b.refresh() == 0
+
+    @pytest.mark.asyncio
+    async def test_revoked_user_only_affects_older_tokens(self, store):
+        """Test account revocation rejects tokens issued before it, not after"""
+        checker = RevocationChecker(store, capacity=100)
+        await checker.revoke_user("u1")
+
+        assert await checker.is_revoked({"sub": "u1", "jti": "x", "iat": int(time.time()) - 10})
+        assert not await checker.is_revoked({"sub": "u1", "jti": "y", "iat": int(time.time()) + 10})
+
+    @pytest.mark.asyncio
+    async def test_revoked_user_boundary_second(self, store):
+        """Test a token issued in the revocation's own second is kept, one second older is not"""
+        checker = RevocationChecker(store, capacity=100)
+        await checker.revoke_user("u1")
+        second = int(await store.lookup("user", "u1"))
+
+        assert not await checker.is_revoked({"sub": "u1", "jti": "x", "iat": second})
+        assert await checker.is_revoked({"sub": "u1", "jti": "y", "iat": second - 1})
+
+    @pytest.mark.asyncio
+    async def test_rebuilds_when_over_capacity(self, store):
+        """Test the filter is rebuilt at a larger size once it overflows"""
+        checker = RevocationChecker(store, capacity=2)
+        for jti in ("a", "b", "c"):
+            await checker.revoke_token(jti)
+
+        await checker.refresh()
+        assert checker.filter.capacity == 4
+        assert len(checker.filter) == 3
+        assert await checker.is_revoked({"sub": "u", "jti": "c", "iat": 1})
+
+    @pytest.mark.asyncio
+    async def test_revocations_during_a_rebuild_survive_it(self, store):
+        """Test a rebuild keeps local revocations it read past and a refresh waits for it"""
+        checker = RevocationChecker(store, capacity=100)
+        await checker.revoke_token("early")
+        since = store.since
+        loading = asyncio.Event()
+        resume = asyncio.Event()
+
+        async def slow_since(last_id, limit):
+            rows = await since(last_id, limit)
+            loading.set()
+            await resume.wait()
+            return rows
+
+        store.since = slow_since
+        rebuild = asyncio.create_task(checker.rebuild(200))
+        await loading.wait()
+        await checker.revoke_token("late")
+        refresh = asyncio.create_task(checker.refresh())
+        resume.set()
+        assert await rebuild == 1
+        assert await refresh == 1
+        assert checker.filter.capacity == 200
+        assert await checker.is_revoked({"sub": "u", "jti": "late", "iat": 1})
+        assert await checker.is_revoked({"sub": "u", "jti": "early", "iat": 1})
+        assert checker.last_id == 2
+
+    @pytest.mark.asyncio
+    async def test_purge_expired(self, store):
+        """Test expired token revocations are purged and account revocations kept"""
+        await store.add("jti", "old", expires_at=time.time() - 1)
+        await store.add("user", "u1")
+        assert await store.purge_expired() == 1
+        assert await store.lookup("user", "u1") is not None
+
+    @pytest.mark.asyncio
+    async def test_account_revocation_expires_with_the_last_token(self, store):
+        """Test a user entry lasts one token lifetime, then the purger drops it from the filter"""
+        checker = RevocationChecker(store, capacity=100, token_lifetime=60)
+        await checker.revoke_user("u1")
+        assert await store.purge_expired() == 0
+        assert await store.purge_expired(now=time.time() + 61) == 1
+        await checker.rebuild(checker.filter.capacity)
+        assert "user:u1" not in checker.filter
+
+
+@pytest.mark.unit
+@pytest.mark.auth
+class TestRevocationRouter:
+    """Tests for the superuser revoke endpoint"""
+
+    @pytest.mark.asyncio
+    async def test_revoke_deactivates_the_account(self, store):
+        """Test revoking records the revocation and sets is_active=False together"""
+        async with store.session_maker() as session:
+            account = Account(email="ana@example.com")
+            session.add(account)
+            await session.commit()
+        checker = RevocationChecker(store, capacity=100)
+        app = FastAPI()
+        app.include_router(create_revocation_router(checker, lambda: {"sub": "admin"}, Account))
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            revoked = await client.post(f"/users/{account.id}/revoke")
+            unknown = await client.post(f"/users/{uuid.uuid4()}/revoke")
+            invalid = await client.post("/users/not-a-uuid/revoke")
+        assert revoked.status_code == 204
+        assert unknown.status_code == invalid.status_code == 404
+        async with store.session_maker() as session:
+            assert await session.scalar(select(Account.is_active)) is False
+        assert await store.lookup("user", str(account.id)) is not None
+        assert await checker.is_revoked({"sub": str(account.id), "iat": 1})
+        assert len(await store.since(0)) == 1
@@ -0,0 +1,177 @@
+"""
+Unit tests for progress rollups
+"""
+import httpx
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from sqlalchemy import delete, insert, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from tutor_stack_core.activity import activity_events
+from tutor_stack_core.rollups import RollupEngine, class_progress, create_progress_router
+
+
+def _event(user_id, kind, ts, status=200, duration_ms=10.0, score=None):
+    return {
+        "user_id": user_id,
+        "kind": kind,
+        "path": "/x",
+        "ts": ts,
+        "status": status,
+        "duration_ms": duration_ms,
+        "score": score,
+    }
+
+
+@pytest_asyncio.fixture
+async def database():
+    """In-memory SQLite database with the activity and rollup tables"""
+    engine = create_async_engine("sqlite+aiosqlite://")
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    rollups = RollupEngine(session_maker, batch_size=2)
+    await rollups.create_tables(engine)
+    yield engine, rollups
+    await engine.dispose()
+
+
+async def _add(engine, *events):
+    async with engine.begin() as conn:
+        await conn.execute(insert(activity_events), list(events))
+
+
+@pytest.mark.unit
+class TestRollupEngine:
+    """Tests for incremental folding, rebuilds and class aggregates"""
+
+    @pytest.mark.asyncio
+    async def test_incremental_refresh_matches_rebuild(self, database):
+        """Test folding events in several passes gives the same rows as a rebuild"""
+        engine, rollups = database
+        await _add(engine, _event("s1", "content.view", 1), _event("s2", "chat.turn", 2))
+        assert await rollups.refresh() == 2
+        await _add(
+            engine,
+            _event("s1", "content.view", 3),
+            _event("s1", "assessment.submit", 4, status=422),
+            _event("s3", "chat.turn", 5),
+        )
+        assert await rollups.refresh() == 3
+        assert await rollups.refresh() == 0
+
+        incremental = await rollups.student("s1")
+        assert incremental["content_views"] == 2
+        assert incremental["assessment_submissions"] == 1
+        assert incremental["failed_requests"] == 1
+        assert (incremental["first_seen"], incremental["last_seen"]) == (1, 4)
+        assert incremental["active_ms"] == 30
+
+        assert await rollups.refresh(rebuild=True) == 5
+        assert await rollups.student("s1") == incremental
+        assert rollups.stats["rebuilds"] == 2  # First refresh builds from scratch
+
+    @pytest.mark.asyncio
+    async def test_truncated_events_trigger_rebuild(self, database):
+        """Test a watermark past the newest event forces a full rebuild"""
+        engine, rollups = database
+        await _add(engine, *[_event("s1", "chat.turn", t) for t in range(3)])
+        await rollups.refresh()
+        async with engine.begin() as conn:
+            await conn.execute(delete(activity_events))
+        await _add(engine, _event("s2", "chat.turn", 10))
+        await rollups.refresh()
+        assert await rollups.student("s1") is None
+        assert (await rollups.student("s2"))["chat_turns"] == 1
+
+    @pytest.mark.asyncio
+    async def test_workers_share_the_watermark(self, database):
+        """Test a second worker's refresh does not fold the same events in again"""
+        engine, rollups = database
+        await _add(engine, _event("s1", "chat.turn", 1))
+        await rollups.refresh()
+        await _add(engine, _event("s1", "chat.turn", 2))
+        other = RollupEngine(rollups.session_maker)
+        await other.refresh()
+        assert (await rollups.student("s1"))["chat_turns"] == 2
+        await rollups.refresh()
+        assert (await rollups.student("s1"))["chat_turns"] == 2
+
+    @pytest.mark.asyncio
+    async def test_score_averages(self, database):
+        """Test scored submissions average per student and per class, across refreshes"""
+        engine, rollups = database
+        await rollups.set_members("7b", ["s1", "s2"])
+        await _add(
+            engine,
+            _event("s1", "assessment.submit", 1, score=0.5),
+            _event("s2", "assessment.submit", 2, score=1.0),
+        )
+        await rollups.refresh()
+        await _add(
+            engine,
+            _event("s1", "assessment.submit", 3, score=1.0),
+            _event("s1", "assessment.submit", 4, status=422),
+        )
+        await rollups.refresh()
+
+        student = await rollups.student("s1")
+        assert student["assessment_submissions"] == 3
+        assert student["scored_submissions"] == 2
+        assert student["average_score"] == 0.75
+        summary = await rollups.class_summary("7b")
+        assert summary["scored_submissions"] == 3
+        assert summary["average_score"] == 2.5 / 3
+        assert (await rollups.student("s2"))["average_score"] == 1.0
+        await rollups.refresh(rebuild=True)
+        assert await rollups.student("s1") == student
+
+    @pytest.mark.asyncio
+    async def test_refresh_recomputes_only_touched_classes(self, database):
+        """Test a refresh rewrites the classes of students with new events and no others"""
+        engine, rollups = database
+        await rollups.set_members("7a", ["s1"])
+        await rollups.set_members("7b", ["s2"])
+        await _add(engine, _event("s1", "chat.turn", 1), _event("s2", "chat.turn", 2))
+        await rollups.refresh()
+        async with engine.begin() as conn:
+            stale = update(class_progress).where(class_progress.c.class_id == "7b")
+            await conn.execute(stale.values(chat_turns=99))
+
+        await _add(engine, _event("s1", "chat.turn", 3))
+        await rollups.refresh()
+        assert (await rollups.class_summary("7a"))["chat_turns"] == 2
+        assert (await rollups.class_summary("7b"))["chat_turns"] == 99
+        await rollups.refresh(rebuild=True)
+        assert (await rollups.class_summary("7b"))["chat_turns"] == 1
+
+    @pytest.mark.asyncio
+    async def test_class_endpoints(self, database):
+        """Test class totals follow membership and the read endpoints serve them"""
+        engine, rollups = database
+        await _add(
+            engine,
+            _event("s1", "content.view", 1),
+            _event("s2", "content.view", 2),
+            _event("s2", "chat.turn", 3),
+        )
+        app = FastAPI()
+        app.include_router(create_progress_router(rollups, lambda: {"id": "admin"}))
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.put(
+                "/progress/classes/7b/members", json={"user_ids": ["s1", "s2", "s9"]}
+            )
+            assert response.status_code == 204
+            # Membership takes effect at once; activity once it is folded in
+            before = (await client.get("/progress/classes/7b")).json()
+            assert (before["students"], before["content_views"]) == (3, 0)
+            assert (await client.get("/progress/classes/8a")).status_code == 404
+            await client.post("/progress/refresh")
+            summary = (await client.get("/progress/classes/7b?students=true")).json()
+            assert (await client.get("/progress/students/s9")).status_code == 404
+
+        assert summary["students"] == 3
+        assert summary["content_views"] == 2
+        assert summary["chat_turns"] == 1
+        assert summary["last_seen"] == 3
+        assert [member["user_id"] for member in summary["members"]] == ["s1", "s2"]
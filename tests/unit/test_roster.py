@@ -0,0 +1,117 @@
+"""
+Unit tests for bulk roster provisioning
+"""
+import io
+import uuid
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import Boolean, String, Uuid
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+from tutor_stack_core.roster import RosterImporter, parse_roster, roster_format
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class RosterUser(Base):
+    __tablename__ = "user"
+
+    id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True)
+    email: Mapped[str] = mapped_column(String(320), unique=True)
+    hashed_password: Mapped[str] = mapped_column(String(1024))
+    is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+    is_superuser: Mapped[bool] = mapped_column(Boolean, default=False)
+    is_verified: Mapped[bool] = mapped_column(Boolean, default=False)
+
+
+@pytest_asyncio.fixture
+async def session_maker():
+    """In-memory SQLite database with the user table created"""
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+async def _collect(importer, data: bytes, fmt: str):
+    return [result async for result in importer.import_rows(parse_roster(io.BytesIO(data), fmt))]
+
+
+@pytest.mark.unit
+class TestRosterParsing:
+    """Tests for roster format detection and parsing"""
+
+    def test_roster_format(self):
+        """Test Content-Type mapping"""
+        assert roster_format("text/csv; charset=utf-8") == "csv"
+        assert roster_format("application/x-ndjson") == "ndjson"
+        assert roster_format("application/json") is None
+        assert roster_format(None) is None
+
+    def test_parse_csv_with_bom(self):
+        """Test CSV parsing strips the BOM and normalises headers"""
+        data = "\ufeffEmail,Password\na@example.com,secret123\n\nb@example.com,secret456\n"
+        rows = list(parse_roster(io.BytesIO(data.encode("utf-8")), "csv"))
+        assert rows == [
+            {"email": "a@example.com", "password": "secret123"},
+            {"email": "b@example.com", "password": "secret456"},
+        ]
+
+    def test_parse_ndjson_reports_bad_lines(self):
+        """Test unparseable NDJSON lines are yielded as None"""
+        data = b'{"email": "a@example.com", "password": "x"}\nnot json\n'
+        assert list(parse_roster(io.BytesIO(data), "ndjson")) == [
+            {"email": "a@example.com", "password": "x"},
+            None,
+        ]
+
+
+@pytest.mark.unit
+class TestRosterImporter:
+    """Tests for batched roster imports"""
+
+    @pytest.mark.asyncio
+    async def test_import_creates_users_in_batches(self, session_maker):
+        """Test every valid row is created and reported in order"""
+        importer = RosterImporter(session_maker, RosterUser, lambda pw: f"hashed:{pw}", batch_size=2)
+        data = "".join(f'{{"email": "s{i}@example.com", "password": "pw{i}"}}\n' for i in range(5))
+
+        results = await _collect(importer, data.encode(), "ndjson")
+
+        assert [r["row"] for r in results] == [1, 2, 3, 4, 5]
+        assert all(r["status"] == "created" for r in results)
+        async with session_maker() as session:
+            user = await session.get(RosterUser, uuid.UUID(results[0]["id"]))
+            assert user.email == "s0@example.com"
+            assert user.hashed_password == "hashed:pw0"
+            assert user.is_superuser is False
+
+    @pytest.mark.asyncio
+    async def test_import_detects_duplicates_and_invalid_rows(self, session_maker):
+        """Test duplicates within the roster and against the database are skipped"""
+        importer = RosterImporter(session_maker, RosterUser, lambda pw: pw, batch_size=10)
+        await _collect(importer, b"email,password\nexisting@example.com,pw\n", "csv")
+
+        data = (
+            "email,password\n"
+            "Existing@example.com,pw\n"
+            "new@example.com,pw\n"
+            "NEW@example.com,pw\n"
+            "not-an-email,pw\n"
+            "nopass@example.com,\n"
+        )
+        results = await _collect(importer, data.encode(), "csv")
+
+        assert [r["status"] for r in results] == [
+            "duplicate",
+            "created",
+            "duplicate",
+            "invalid",
+            "invalid",
+        ]
+        assert results[4]["error"] == "missing password"
@@ -0,0 +1,382 @@
+"""
+Unit tests for tenant-sharded user storage
+"""
+import asyncio
+import uuid
+from collections import Counter
+
+import orjson
+import pytest
+import pytest_asyncio
+from sqlalchemy import Boolean, String, Uuid, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from starlette.requests import Request
+
+from tutor_stack_core.sharding import (
+    EmailInUse,
+    HashRing,
+    ShardedUserDatabase,
+    ShardMap,
+    ShardRebalancer,
+    ShardSet,
+    TenantMigrating,
+    add_tenant_column,
+    tenant_from_request,
+)
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class ShardUser(Base):
+    __tablename__ = "user"
+
+    id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, default=uuid.uuid4)
+    email: Mapped[str] = mapped_column(String(320))
+    hashed_password: Mapped[str] = mapped_column(String(1024))
+    is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+    tenant_id: Mapped[str] = mapped_column(String(64), index=True)
+
+
+@pytest_asyncio.fixture
+async def cluster(tmp_path):
+    """Three SQLite files as shards, a fourth as the directory holding the shard map"""
+    shards = ShardSet(
+        {name: f"sqlite+aiosqlite:///{tmp_path / name}.db" for name in ("a", "b", "c")}
+    )
+    await shards.create_all(Base.metadata)
+    directory = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'directory'}.db")
+    shard_map = ShardMap(
+        async_sessionmaker(directory, expire_on_commit=False), HashRing(["a", "b"]), cache_ttl=60
+    )
+    await shard_map.create_table(directory)
+    yield shards, shard_map
+    await shards.dispose()
+    await directory.dispose()
+
+
+async def create_user(shards, shard_map, tenant, email):
+    user_db = ShardedUserDatabase(shards, shard_map, ShardUser, tenant=tenant)
+    try:
+        return await user_db.create({"email": email, "hashed_password": "hash"})
+    finally:
+        await user_db.close()
+
+
+async def count(shards, shard):
+    async with shards.session_makers[shard]() as session:
+        return await session.scalar(select(func.count()).select_from(ShardUser))
+
+
+@pytest.mark.unit
+class TestHashRing:
+    """Tests for consistent hashing"""
+
+    def test_adding_a_shard_moves_a_fraction(self):
+        """Test a third shard takes about a third of the keys and moves nothing else"""
+        tenants = [f"school-{i}" for i in range(3000)]
+        before, after = HashRing(["a", "b"]), HashRing(["a", "b", "c"])
+        moved = [t for t in tenants if before.shard_for(t) != after.shard_for(t)]
+        assert all(after.shard_for(t) == "c" for t in moved)
+        assert 0.25 < len(moved) / len(tenants) < 0.42
+        spread = Counter(after.shard_for(t) for t in tenants)
+        assert min(spread.values()) > 800
+
+    def test_parse_spec(self):
+        """Test USER_SHARDS style specs are parsed and validated"""
+        with pytest.raises(ValueError):
+            ShardSet.from_spec("a=sqlite+aiosqlite://,broken")
+
+    @pytest.mark.asyncio
+    async def test_tenant_column_is_added_to_existing_tables(self, tmp_path):
+        """Test a user model and table from before sharding get a defaulted tenant_id"""
+
+        class LegacyBase(DeclarativeBase):
+            pass
+
+        class LegacyUser(LegacyBase):
+            __tablename__ = "user"
+
+            id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, default=uuid.uuid4)
+            email: Mapped[str] = mapped_column(String(320))
+
+        shards = ShardSet({"a": f"sqlite+aiosqlite:///{tmp_path / 'a'}.db"})
+        await shards.create_all(LegacyBase.metadata)
+        async with shards.session_makers["a"]() as session:
+            session.add(LegacyUser(email="old@example.com"))
+            await session.commit()
+
+        add_tenant_column(LegacyUser, default="legacy")
+        await shards.add_missing_columns(LegacyUser)
+        await shards.add_missing_columns(LegacyUser)
+        async with shards.session_makers["a"]() as session:
+            session.add(LegacyUser(email="new@example.com", tenant_id="north"))
+            await session.commit()
+            rows = await session.execute(select(LegacyUser.email, LegacyUser.tenant_id))
+            assert sorted(rows) == [("new@example.com", "north"), ("old@example.com", "legacy")]
+        await shards.dispose()
+
+
+def request(path="/register", headers=None, claims=None, body=None, verified=True):
+    """A request as the guard leaves it: ``claims`` set on every path it verifies"""
+    headers = dict(headers or {})
+    payload = b""
+    if body is not None:
+        payload = orjson.dumps(body)
+        headers["content-type"] = "application/json"
+
+    async def receive():
+        return {"type": "http.request", "body": payload, "more_body": False}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "query_string": b"",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+    }
+    incoming = Request(scope, receive)
+    if verified:
+        incoming.state.claims = claims
+    return incoming
+
+
+@pytest.mark.unit
+class TestTenantFromRequest:
+    """Tests for where a request's tenant may come from"""
+
+    @pytest.mark.asyncio
+    async def test_verified_claim_wins_over_header(self):
+        """Test a token's tenant claim is used and an X-Tenant-ID header cannot override it"""
+        spoofed = {"x-tenant-id": "south", "authorization": "Bearer token"}
+        assert await tenant_from_request(
+            request("/users/me", spoofed, claims={"tenant": "north"})
+        ) == "north"
+        assert await tenant_from_request(request("/register", spoofed, claims={})) is None
+        # Public paths are not verified by the guard, so an unverified token counts for nothing
+        assert await tenant_from_request(request("/jwt/login", spoofed, verified=False)) is None
+
+    @pytest.mark.asyncio
+    async def test_only_registration_names_a_tenant(self):
+        """Test an unauthenticated registration may use the header or its payload, nothing else"""
+        assert await tenant_from_request(request(headers={"x-tenant-id": "north"})) == "north"
+        assert await tenant_from_request(request(body={"tenant_id": "east"})) == "east"
+        assert await tenant_from_request(
+            request("/jwt/login", {"x-tenant-id": "north"}, verified=False)
+        ) is None
+
+
+@pytest.mark.unit
+class TestShardedUsers:
+    """Tests for routing, the shard map and rebalancing"""
+
+    @pytest.mark.asyncio
+    async def test_users_land_on_their_tenant_shard(self, cluster):
+        """Test writes go to the tenant's shard and reads find them with or without a tenant"""
+        shards, shard_map = cluster
+        users = {
+            tenant: await create_user(shards, shard_map, tenant, f"{tenant}@example.com")
+            for tenant in ("north", "south", "east", "west")
+        }
+        for tenant, user in users.items():
+            shard = shard_map.ring.shard_for(tenant)
+            async with shards.session_makers[shard]() as session:
+                assert await session.get(ShardUser, user.id) is not None
+
+        scoped = ShardedUserDatabase(shards, shard_map, ShardUser, tenant="north")
+        assert (await scoped.get_by_email("NORTH@example.com")).id == users["north"].id
+        # Addresses are global, so another tenant's user is still found (and blocks a duplicate)
+        assert (await scoped.get_by_email("south@example.com")).tenant_id == "south"
+        assert (await scoped.get(users["east"].id)).tenant_id == "east"
+        await scoped.close()
+
+        unscoped = ShardedUserDatabase(shards, shard_map, ShardUser)
+        found = await unscoped.get(users["west"].id)
+        assert found.email == "west@example.com"
+        updated = await unscoped.update(found, {"is_active": False})
+        assert updated.is_active is False
+        assert (await unscoped.get_by_email("south@example.com")).tenant_id == "south"
+        await unscoped.close()
+
+    @pytest.mark.asyncio
+    async def test_shard_map_caches_and_pins(self, cluster):
+        """Test lookups are cached, pins override the ring and block writes while migrating"""
+        shards, shard_map = cluster
+        tenant = "district-9"
+        ring_shard = shard_map.ring.shard_for(tenant)
+        assert await shard_map.shard_for(tenant) == ring_shard
+        assert await shard_map.shard_for(tenant) == ring_shard
+        assert shard_map.stats == {"hits": 1, "misses": 1}
+
+        await shard_map.pin(tenant, "c")
+        assert await shard_map.shard_for(tenant) == "c"
+        await shard_map.pin(tenant, "c", "migrating")
+        assert await shard_map.shard_for(tenant) == "c"
+        with pytest.raises(TenantMigrating):
+            await create_user(shards, shard_map, tenant, "new@example.com")
+
+    @pytest.mark.asyncio
+    async def test_rebalance_after_adding_a_shard(self, cluster):
+        """Test growing the ring moves only the remapped tenants, with every user intact"""
+        shards, shard_map = cluster
+        tenants = [f"school-{i}" for i in range(12)]
+        for tenant in tenants:
+            for n in range(3):
+                await create_user(shards, shard_map, tenant, f"{n}@{tenant}.example.com")
+        assert await count(shards, "c") == 0
+
+        old_ring = shard_map.ring
+        shard_map.ring = HashRing(["a", "b", "c"])
+        shard_map._cache.clear()
+        rebalancer = ShardRebalancer(shards, shard_map, ShardUser, batch_size=2, settle=0)
+        moves = await rebalancer.plan()
+        assert moves
+        assert all(target == "c" for _, _, target in moves)
+
+        # Until the rebalancer runs, pinned tenants stay where their users are
+        moving = moves[0][0]
+        user_db = ShardedUserDatabase(shards, shard_map, ShardUser, tenant=moving)
+        assert await user_db.get_by_email(f"0@{moving}.example.com") is not None
+        await user_db.close()
+        await create_user(shards, shard_map, moving, f"late@{moving}.example.com")
+        assert await count(shards, "c") == 0
+        # A new tenant is placed by the new ring and needs no move
+        fresh = next(
+            tenant for tenant in (f"new-{i}" for i in range(50))
+            if shard_map.ring.shard_for(tenant) == "c" != old_ring.shard_for(tenant)
+        )
+        await create_user(shards, shard_map, fresh, f"0@{fresh}.example.com")
+        assert await rebalancer.plan() == moves
+
+        await rebalancer.rebalance()
+        assert await rebalancer.plan() == []
+        assert await count(shards, "c") == 3 * len(moves) + 2
+        assert sum([await count(shards, shard) for shard in ("a", "b", "c")]) == 38
+        for tenant in tenants:
+            user_db = ShardedUserDatabase(shards, shard_map, ShardUser, tenant=tenant)
+            assert await user_db.get_by_email(f"2@{tenant}.example.com") is not None
+            await user_db.close()
+        user_db = ShardedUserDatabase(shards, shard_map, ShardUser, tenant=moving)
+        assert (await user_db.get_by_email(f"late@{moving}.example.com")).tenant_id == moving
+        await user_db.close()
+        pins = await shard_map.pins()
+        assert set(pins) == set(tenants) | {fresh}
+        assert all(pin == (shard_map.ring.shard_for(t), "active") for t, pin in pins.items())
+
+    @pytest.mark.asyncio
+    async def test_move_keeps_rows_already_on_the_target(self, cluster):
+        """Test a move merges into the target instead of deleting what it did not copy"""
+        shards, shard_map = cluster
+        user = await create_user(shards, shard_map, "merging", "0@merging.example.com")
+        source = shard_map.ring.shard_for("merging")
+        target = "b" if source == "a" else "a"
+        async with shards.session_makers[target]() as session:
+            # A stale copy from an interrupted attempt, and a user only the target has
+            row = {"hashed_password": "hash", "tenant_id": "merging"}
+            session.add(ShardUser(id=user.id, email="stale", **row))
+            session.add(ShardUser(email="1@merging.example.com", **row))
+            await session.commit()
+
+        rebalancer = ShardRebalancer(shards, shard_map, ShardUser, settle=0)
+        assert await rebalancer.move("merging", source, target) == 1
+        assert await count(shards, source) == 0
+        async with shards.session_makers[target]() as session:
+            rows = await session.execute(select(ShardUser.email).order_by(ShardUser.email))
+            assert rows.scalars().all() == ["0@merging.example.com", "1@merging.example.com"]
+
+    @pytest.mark.asyncio
+    async def test_pin_existing_tenants(self, cluster):
+        """Test tenants created before pins are pinned where their rows are"""
+        shards, shard_map = cluster
+        async with shards.session_makers["c"]() as session:
+            session.add(ShardUser(email="old@example.com", hashed_password="hash", tenant_id="old"))
+            await session.commit()
+        rebalancer = ShardRebalancer(shards, shard_map, ShardUser, settle=0)
+        assert await rebalancer.pin_existing() == {"old": "c"}
+        assert await shard_map.shard_for("old") == "c"
+        # Still placed by the ring, so the rebalancer moves it where the ring says
+        assert await rebalancer.plan() == [("old", "c", shard_map.ring.shard_for("old"))]
+        assert await rebalancer.pin_existing() == {}
+
+    @pytest.mark.asyncio
+    async def test_move_to_dedicated_shard(self, cluster):
+        """Test a tenant can be moved off the ring onto a shard of its own"""
+        shards, shard_map = cluster
+        for n in range(5):
+            await create_user(shards, shard_map, "big-district", f"{n}@big.example.com")
+        source = shard_map.ring.shard_for("big-district")
+        rebalancer = ShardRebalancer(shards, shard_map, ShardUser, settle=0)
+        assert await rebalancer.move("big-district", source, "c") == 5
+        assert await count(shards, source) == 0
+        assert await shard_map.shard_for("big-district", write=True) == "c"
+
+    @pytest.mark.asyncio
+    async def test_stale_workers_find_users_during_a_move(self, cluster):
+        """Test source rows outlive every cached entry that still points at them"""
+        shards, shard_map = cluster
+        for n in range(3):
+            await create_user(shards, shard_map, "moving", f"{n}@moving.example.com")
+        source = shard_map.ring.shard_for("moving")
+        # Another worker, caching entries for as long as the rebalancer waits
+        worker = ShardMap(shard_map.session_maker, shard_map.ring, cache_ttl=0.1)
+        rebalancer = ShardRebalancer(shards, shard_map, ShardUser, settle=0.15)
+        move = asyncio.create_task(rebalancer.move("moving", source, "c"))
+        finished = False
+        while not finished:
+            finished = move.done()
+            user_db = ShardedUserDatabase(shards, worker, ShardUser, tenant="moving")
+            assert await user_db.get_by_email("1@moving.example.com") is not None
+            await user_db.close()
+            await asyncio.sleep(0.01)
+        assert await move == 3
+        assert await count(shards, source) == 0
+
+    @pytest.mark.asyncio
+    async def test_emails_are_unique_across_shards(self, cluster):
+        """Test the email index rejects duplicates, routes logins and follows changes"""
+        shards, shard_map = cluster
+        home = shard_map.ring.shard_for("north")
+        other = next(
+            tenant for tenant in (f"school-{i}" for i in range(20))
+            if shard_map.ring.shard_for(tenant) != home
+        )
+        user = await create_user(shards, shard_map, "north", "ana@example.com")
+        with pytest.raises(EmailInUse):
+            await create_user(shards, shard_map, other, "ANA@example.com")
+        assert await count(shards, shard_map.ring.shard_for(other)) == 0
+
+        login = ShardedUserDatabase(shards, shard_map, ShardUser)
+        assert (await login.get_by_email("Ana@example.com")).id == user.id
+        assert list(login._sessions) == [home]
+        renamed = await login.update(user, {"email": "ana.b@example.com"})
+        assert await login.get_by_email("ana@example.com") is None
+        assert (await login.get_by_email("ana.b@example.com")).id == renamed.id
+        await login.delete(renamed)
+        assert await login.get_by_email("ana.b@example.com") is None
+        await login.close()
+        assert (await create_user(shards, shard_map, other, "ana.b@example.com")).tenant_id == other
+
+    @pytest.mark.asyncio
+    async def test_index_emails_backfills_existing_users(self, cluster):
+        """Test users created before the index are indexed and cross-tenant duplicates listed"""
+        shards, shard_map = cluster
+        for shard, tenant, email in (
+            ("a", "north", "old@example.com"),
+            ("b", "south", "Old@example.com"),
+            ("b", "south", "solo@example.com"),
+        ):
+            async with shards.session_makers[shard]() as session:
+                session.add(ShardUser(email=email, hashed_password="hash", tenant_id=tenant))
+                await session.commit()
+        await shard_map.pin("north", "a")
+        await shard_map.pin("south", "b")
+
+        rebalancer = ShardRebalancer(shards, shard_map, ShardUser, batch_size=2)
+        assert await rebalancer.index_emails() == [("old@example.com", "north", "south")]
+        assert await rebalancer.index_emails() == [("old@example.com", "north", "south")]
+        user_db = ShardedUserDatabase(shards, shard_map, ShardUser)
+        assert (await user_db.get_by_email("solo@example.com")).tenant_id == "south"
+        assert (await user_db.get_by_email("old@example.com")).tenant_id == "north"
+        await user_db.close()
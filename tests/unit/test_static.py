@@ -0,0 +1,93 @@
+"""
+Unit tests for serving the built frontend
+"""
+import gzip
+
+import httpx
+import pytest
+
+from tutor_stack_core.static import IMMUTABLE, REVALIDATE, StaticFrontend, is_immutable
+
+
+@pytest.fixture
+def dist(tmp_path):
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "index.html").write_text("<!doctype html><div id=root></div>")
+    bundle = b"console.log('tutor');" * 1000
+    (tmp_path / "assets" / "index-4f1b2c3d.js").write_bytes(bundle)
+    (tmp_path / "assets" / "index-4f1b2c3d.js.gz").write_bytes(gzip.compress(bundle))
+    (tmp_path / "favicon.ico").write_bytes(b"\x00" * 16)
+    return tmp_path
+
+
+def _client(directory):
+    transport = httpx.ASGITransport(app=StaticFrontend(str(directory)))
+    return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+
+@pytest.mark.unit
+class TestStaticFrontend:
+    """Tests for indexed, precompressed static serving"""
+
+    @pytest.mark.asyncio
+    async def test_hashed_assets_are_immutable_and_precompressed(self, dist):
+        """Test hashed bundles get long-lived caching and the prebuilt gzip variant"""
+        async with _client(dist) as client:
+            zipped = await client.get("/assets/index-4f1b2c3d.js")
+            plain = await client.get(
+                "/assets/index-4f1b2c3d.js", headers={"Accept-Encoding": "identity"}
+            )
+        assert zipped.headers["cache-control"] == IMMUTABLE
+        assert zipped.headers["content-encoding"] == "gzip"
+        assert zipped.headers["vary"] == "Accept-Encoding"
+        assert zipped.content == plain.content
+        assert "content-encoding" not in plain.headers
+        assert plain.headers["content-type"].startswith("text/javascript")
+        assert int(plain.headers["content-length"]) == len(plain.content)
+
+    @pytest.mark.asyncio
+    async def test_spa_fallback(self, dist):
+        """Test client-side routes get index.html while missing assets 404"""
+        async with _client(dist) as client:
+            route = await client.get("/lessons/42", headers={"Accept": "text/html"})
+            missing = await client.get("/assets/missing-12345678.js")
+        assert route.status_code == 200
+        assert route.headers["cache-control"] == REVALIDATE
+        assert "id=root" in route.text
+        assert missing.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_conditional_and_range_requests(self, dist):
+        """Test ETag revalidation and byte ranges work off the startup index"""
+        async with _client(dist) as client:
+            first = await client.get("/favicon.ico")
+            cached = await client.get(
+                "/favicon.ico", headers={"If-None-Match": first.headers["etag"]}
+            )
+            partial = await client.get("/favicon.ico", headers={"Range": "bytes=0-3"})
+            posted = await client.post("/favicon.ico")
+        assert cached.status_code == 304
+        assert partial.status_code == 206
+        assert partial.content == b"\x00" * 4
+        assert posted.status_code == 405
+
+    def test_index_is_built_once(self, dist):
+        """Test files added after startup are not picked up per request"""
+        frontend = StaticFrontend(str(dist))
+        (dist / "late.txt").write_text("late")
+        assert frontend.resolve("/late.txt") is None
+        assert frontend.resolve("/assets/index-4f1b2c3d.js").variants.keys() == {"gzip"}
+
+    def test_only_hashed_assets_are_immutable(self):
+        """Test hyphenated names and files outside assets/ revalidate"""
+        assert is_immutable("/assets/index-4f1b2c3d.js")
+        assert is_immutable("/assets/vendor-Bx3kQ_9a.css")
+        for url in (
+            "/apple-touch-icon.png",
+            "/og-image-large.png",
+            "/sw-register.js",
+            "/assets/og-image-large.png",
+            "/assets/sw-register.js",
+            "/index-4f1b2c3d.js",
+        ):
+            assert not is_immutable(url), url
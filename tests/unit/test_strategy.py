@@ -0,0 +1,130 @@
+"""
+Unit tests for the fastapi-users JWT strategy backed by pre-parsed keys
+"""
+import uuid
+from types import SimpleNamespace
+
+import jwt
+import pytest
+import pytest_asyncio
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+pytest.importorskip("fastapi_users")
+
+from fastapi_users import exceptions  # noqa: E402
+from fastapi_users.authentication.strategy import StrategyDestroyNotSupportedError  # noqa: E402
+
+from tutor_stack_core.jwt_keys import KeyCache, SigningKeys, TokenVerifier, key_id  # noqa: E402
+from tutor_stack_core.revocation import RevocationChecker, RevocationStore  # noqa: E402
+from tutor_stack_core.strategy import PreparsedJWTStrategy  # noqa: E402
+
+
+def _signing(private_key, algorithm):
+    public_key = private_key.public_key()
+    return SigningKeys(algorithm, private_key, public_key, key_id(public_key))
+
+
+class UserManager:
+    """Just enough of a fastapi-users user manager for ``read_token``"""
+
+    def __init__(self, *users):
+        self.users = {user.id: user for user in users}
+
+    def parse_id(self, value):
+        try:
+            return uuid.UUID(value)
+        except ValueError as e:
+            raise exceptions.InvalidID() from e
+
+    async def get(self, id):
+        if id not in self.users:
+            raise exceptions.UserNotExists()
+        return self.users[id]
+
+
+@pytest_asyncio.fixture
+async def revocations():
+    """Revocation checker on an in-memory SQLite database"""
+    engine = create_async_engine("sqlite+aiosqlite://")
+    store = RevocationStore(async_sessionmaker(engine, expire_on_commit=False))
+    await store.create_table(engine)
+    yield RevocationChecker(store, capacity=100)
+    await engine.dispose()
+
+
+def build(signing, *trusted, lifetime_seconds=60):
+    cache = KeyCache(static_keys=trusted, signing_keys=signing)
+    return PreparsedJWTStrategy(cache, TokenVerifier(cache), lifetime_seconds=lifetime_seconds)
+
+
+@pytest.mark.unit
+@pytest.mark.auth
+class TestPreparsedJWTStrategy:
+    """Tests for writing, reading and destroying tokens"""
+
+    @pytest.mark.asyncio
+    async def test_write_token_stamps_kid_and_claims(self):
+        """Test tokens carry the signing kid, a jti, an expiry and the user's tenant"""
+        signing = _signing(rsa.generate_private_key(public_exponent=65537, key_size=2048), "RS256")
+        strategy = build(signing)
+        user = SimpleNamespace(id=uuid.uuid4(), tenant_id="north")
+
+        token = await strategy.write_token(user)
+        assert jwt.get_unverified_header(token)["kid"] == signing.kid
+        claims = strategy.verifier.verify(token)
+        assert claims["sub"] == str(user.id)
+        assert claims["tenant"] == "north"
+        assert claims["exp"] - claims["iat"] == 60
+        assert claims["jti"]
+        assert await strategy.read_token(token, UserManager(user)) is user
+        assert await strategy.read_token(None, UserManager(user)) is None
+
+    @pytest.mark.asyncio
+    async def test_read_token_looks_up_the_kid(self):
+        """Test tokens of a rotated-out key still verify and tokens of unknown keys do not"""
+        old = _signing(ec.generate_private_key(ec.SECP256R1()), "ES256")
+        new = _signing(rsa.generate_private_key(public_exponent=65537, key_size=2048), "RS256")
+        user = SimpleNamespace(id=uuid.uuid4())
+        old_token = await build(old).write_token(user)
+
+        rotated = build(new, old.public_key)
+        assert await rotated.read_token(old_token, UserManager(user)) is user
+        assert await build(new).read_token(old_token, UserManager(user)) is None
+        # An unknown kid is rejected even when a key of the same algorithm is trusted
+        forged = jwt.encode(
+            {"sub": str(user.id), "aud": ["fastapi-users:auth"]},
+            new.private_key,
+            algorithm="RS256",
+            headers={"kid": "unknown"},
+        )
+        assert await rotated.read_token(forged, UserManager(user)) is None
+        unknown_user = await rotated.write_token(SimpleNamespace(id=uuid.uuid4()))
+        assert await rotated.read_token(unknown_user, UserManager(user)) is None
+
+    @pytest.mark.asyncio
+    async def test_expired_token_is_rejected(self):
+        """Test a token past its exp reads as no user"""
+        signing = _signing(rsa.generate_private_key(public_exponent=65537, key_size=2048), "RS256")
+        strategy = build(signing, lifetime_seconds=-10)
+        user = SimpleNamespace(id=uuid.uuid4())
+        token = await strategy.write_token(user)
+        assert await strategy.read_token(token, UserManager(user)) is None
+
+    @pytest.mark.asyncio
+    async def test_destroy_token_revokes_it(self, revocations):
+        """Test logout revokes the token's jti and leaves the user's other tokens valid"""
+        signing = _signing(rsa.generate_private_key(public_exponent=65537, key_size=2048), "RS256")
+        strategy = build(signing)
+        user = SimpleNamespace(id=uuid.uuid4())
+        with pytest.raises(StrategyDestroyNotSupportedError):
+            await strategy.destroy_token(await strategy.write_token(user), user)
+
+        strategy.revocations = revocations
+        token = await strategy.write_token(user)
+        other = await strategy.write_token(user)
+        await strategy.destroy_token(token, user)
+        assert await strategy.read_token(token, UserManager(user)) is None
+        assert await strategy.read_token(other, UserManager(user)) is user
+        # Destroying a token that does not verify is a no-op
+        await strategy.destroy_token("not-a-token", user)
@@ -0,0 +1,172 @@
+"""
+Unit tests for the shared background-task scheduler
+"""
+import asyncio
+import threading
+
+import pytest
+
+from tutor_stack_core.tasks import Priority, TaskQueueFull, TaskScheduler
+
+
+def blocking_add(a, b):
+    return a + b
+
+
+@pytest.mark.unit
+class TestTaskScheduler:
+    """Tests for priorities, quotas, executors and shutdown"""
+
+    @pytest.mark.asyncio
+    async def test_runs_async_thread_and_process_jobs(self):
+        """Test every mode resolves its future with the job's result"""
+        scheduler = TaskScheduler(threads=2, processes=1)
+        scheduler.start()
+
+        async def double(value):
+            await asyncio.sleep(0)
+            return value * 2
+
+        results = await asyncio.gather(
+            scheduler.submit("content", double, 21),
+            scheduler.submit("assessment", blocking_add, 40, 2, mode="thread"),
+            scheduler.submit("assessment", blocking_add, 2, 40, mode="process"),
+        )
+        assert results == [42, 42, 42]
+        snapshot = scheduler.snapshot()
+        assert snapshot["services"]["assessment"]["completed"] == 2
+        assert snapshot["wait"]["normal"]["max_ms"] >= 0
+        await scheduler.stop()
+
+    @pytest.mark.asyncio
+    async def test_restart_gets_fresh_pools(self):
+        """Test thread jobs run again after a stop and start, as across two lifespans"""
+        scheduler = TaskScheduler(threads=1)
+        scheduler.start()
+        first_pool = scheduler.threads
+        assert await scheduler.submit("roster", blocking_add, 1, 2, mode="thread") == 3
+        await scheduler.stop()
+
+        scheduler.start()
+        assert await scheduler.submit("roster", blocking_add, 2, 3, mode="thread") == 5
+        assert scheduler.threads is not first_pool
+        await scheduler.stop()
+
+    @pytest.mark.asyncio
+    async def test_priority_order_and_service_quota(self):
+        """Test queued jobs start highest priority first"""
+        scheduler = TaskScheduler(max_running=1, quotas={"notifier": 1})
+        scheduler.start()
+        gate = asyncio.Event()
+        order = []
+
+        async def job(name):
+            order.append(name)
+            await gate.wait()
+
+        first = scheduler.submit("notifier", job, "first")
+        await asyncio.sleep(0.01)
+        futures = [
+            scheduler.submit("chat", job, "low", priority=Priority.LOW),
+            scheduler.submit("chat", job, "normal"),
+            scheduler.submit("content", job, "high", priority=Priority.HIGH),
+        ]
+        gate.set()
+        await asyncio.gather(first, *futures)
+        assert order == ["first", "high", "normal", "low"]
+        await scheduler.stop()
+
+    @pytest.mark.asyncio
+    async def test_busy_service_does_not_starve_others(self):
+        """Test a service at its quota leaves slots for the others"""
+        scheduler = TaskScheduler(max_running=4, default_quota=2)
+        scheduler.start()
+        gate = asyncio.Event()
+        running = {"grading": 0, "max": 0}
+
+        async def grade():
+            running["grading"] += 1
+            running["max"] = max(running["max"], running["grading"])
+            await gate.wait()
+            running["grading"] -= 1
+
+        async def notify():
+            return "sent"
+
+        grading = [scheduler.submit("assessment", grade) for _ in range(10)]
+        assert await asyncio.wait_for(scheduler.submit("notifier", notify), 1) == "sent"
+        gate.set()
+        await asyncio.gather(*grading)
+        assert running["max"] == 2
+        await scheduler.stop()
+
+    @pytest.mark.asyncio
+    async def test_full_queue_rejects(self):
+        """Test a service over its queue bound gets TaskQueueFull"""
+        scheduler = TaskScheduler(max_running=1, default_quota=1, max_queued=2)
+        scheduler.start()
+        gate = asyncio.Event()
+
+        async def wait():
+            await gate.wait()
+
+        futures = [scheduler.submit("content", wait)]
+        await asyncio.sleep(0.01)
+        futures += [scheduler.submit("content", wait) for _ in range(2)]
+        with pytest.raises(TaskQueueFull):
+            scheduler.submit("content", wait)
+        assert scheduler.snapshot()["services"]["content"]["rejected"] == 1
+        gate.set()
+        await asyncio.gather(*futures)
+        await scheduler.stop()
+
+    @pytest.mark.asyncio
+    async def test_many_cancelled_jobs_are_skipped(self):
+        """Test thousands of cancelled queued jobs are dropped and a new job still runs"""
+        scheduler = TaskScheduler(max_running=1, default_quota=1, max_queued=10_000)
+        scheduler.start()
+        gate = asyncio.Event()
+
+        async def wait():
+            await gate.wait()
+
+        async def ping():
+            return "pong"
+
+        blocker = scheduler.submit("content", wait)
+        await asyncio.sleep(0.01)
+        queued = [scheduler.submit("content", wait) for _ in range(5000)]
+        for future in queued:
+            future.cancel()
+        gate.set()
+        await blocker
+        assert await asyncio.wait_for(scheduler.submit("content", ping), 1) == "pong"
+        assert scheduler.snapshot()["services"]["content"]["cancelled"] == 5000
+        assert scheduler.snapshot()["queued"] == 0
+        await scheduler.stop()
+
+    @pytest.mark.asyncio
+    async def test_stop_cancels_queued_and_overdue_jobs(self):
+        """Test shutdown drops queued jobs, cancels overdue ones and signals blocking ones"""
+        scheduler = TaskScheduler(max_running=2, default_quota=2)
+        scheduler.start()
+        seen_stop = threading.Event()
+
+        async def forever():
+            await asyncio.sleep(3600)
+
+        def cooperative():
+            if scheduler.stopping.wait(5):
+                seen_stop.set()
+
+        running = scheduler.submit("chat", forever)
+        blocking = scheduler.submit("notifier", cooperative, mode="thread")
+        queued = scheduler.submit("chat", forever)
+        queued_too = scheduler.submit("chat", forever)
+        await asyncio.sleep(0.01)
+        await scheduler.stop(grace=0.1)
+        assert running.cancelled() and queued.cancelled() and queued_too.cancelled()
+        await blocking
+        assert seen_stop.is_set()
+        with pytest.raises(RuntimeError):
+            scheduler.submit("chat", forever)
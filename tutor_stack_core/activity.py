@@ -0,0 +1,217 @@
+"""Write-behind capture of per-student learning activity
+
+Recording an event is a synchronous append to a bounded in-memory ring
+buffer, with no I/O on the request path. A background flusher drains the
+buffer in batches, whenever ``batch_size`` events are waiting or
+``flush_interval`` has passed, into a sink: one multi-row INSERT per batch,
+or append-only NDJSON segment files. If the sink falls behind and the buffer
+fills, the oldest events are overwritten and counted as dropped rather than
+slowing requests down. On shutdown, everything still buffered is flushed.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Protocol, Tuple
+
+import orjson
+from sqlalchemy import Column, Float, Index, Integer, MetaData, String, Table, insert
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+activity_events = Table(
+    "activity_events",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("ts", Float, nullable=False),
+    Column("user_id", String(64), nullable=False),
+    Column("kind", String(32), nullable=False),
+    Column("path", String(512), nullable=False),
+    Column("status", Integer, nullable=False),
+    Column("duration_ms", Float, nullable=False),
+    # Reported by the assessment service for graded submissions, null otherwise
+    Column("score", Float, nullable=True),
+    Index("ix_activity_events_user_ts", "user_id", "ts"),
+)
+
+# (mount prefix, method) -> event kind; requests matching none are not recorded
+DEFAULT_RULES: Dict[Tuple[str, str], str] = {
+    ("/content", "GET"): "content.view",
+    ("/chat", "POST"): "chat.turn",
+    ("/assessment", "POST"): "assessment.submit",
+}
+
+# Response header the assessment service puts the submission's score in
+SCORE_HEADER = "x-assessment-score"
+
+
+class ActivityEvent(NamedTuple):
+    ts: float
+    user_id: str
+    kind: str
+    path: str
+    status: int
+    duration_ms: float
+    score: Optional[float] = None
+
+    def as_dict(self) -> Dict[str, object]:
+        return self._asdict()
+
+
+def classify(
+    method: str, path: str, rules: Dict[Tuple[str, str], str] = DEFAULT_RULES
+) -> Optional[str]:
+    """Event kind for a request, or None if it is not learning activity"""
+    for (prefix, rule_method), kind in rules.items():
+        if method == rule_method and (path == prefix or path.startswith(prefix + "/")):
+            return kind
+    return None
+
+
+def parse_score(value: Optional[str]) -> Optional[float]:
+    """Score from a ``SCORE_HEADER`` value, or None when it is missing or not a number"""
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return None
+    return score if math.isfinite(score) else None
+
+
+class ActivitySink(Protocol):
+    async def write(self, events: List[ActivityEvent]) -> None:
+        """Persist one batch"""
+
+
+class SQLActivitySink:
+    """Writes each batch with a single multi-row INSERT"""
+
+    def __init__(self, session_maker):
+        self.session_maker = session_maker
+
+    async def create_table(self, engine) -> None:
+        async with engine.begin() as conn:
+            await conn.run_sync(metadata.create_all)
+
+    async def write(self, events: List[ActivityEvent]) -> None:
+        async with self.session_maker() as session:
+            await session.execute(insert(activity_events), [event.as_dict() for event in events])
+            await session.commit()
+
+
+class SegmentFileSink:
+    """Appends batches as NDJSON to timestamped segment files, rolling over at ``max_bytes``
+
+    Closed segments are never written again, so they can be shipped or loaded
+    elsewhere; the open one has a ``.open`` suffix until it rolls over.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._segment: Optional[str] = None
+        self._size = 0
+
+    async def write(self, events: List[ActivityEvent]) -> None:
+        data = b"".join(orjson.dumps(event.as_dict()) + b"\n" for event in events)
+        await asyncio.to_thread(self._append, data)
+
+    def close(self) -> None:
+        if self._segment is not None:
+            os.replace(self._segment + ".open", self._segment)
+            self._segment = None
+
+    def _append(self, data: bytes) -> None:
+        if self._segment is not None and self._size + len(data) > self.max_bytes:
+            self.close()
+        if self._segment is None:
+            name = f"activity-{time.time_ns()}-{os.getpid()}.ndjson"
+            self._segment = os.path.join(self.directory, name)
+            self._size = 0
+        with open(self._segment + ".open", "ab") as segment:
+            segment.write(data)
+        self._size += len(data)
+
+
+class ActivityRecorder:
+    """Ring buffer of pending events and the background task that flushes it"""
+
+    def __init__(
+        self,
+        sink: ActivitySink,
+        capacity: int = 50_000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+    ):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer: deque = deque(maxlen=capacity)
+        self.stats = {"recorded": 0, "dropped": 0, "flushed": 0, "batches": 0, "failed": 0}
+        self._ready = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    def record(
+        self,
+        user_id: str,
+        kind: str,
+        path: str,
+        status: int = 200,
+        duration_ms: float = 0.0,
+        score: Optional[float] = None,
+    ) -> None:
+        """Queue an event; never blocks and never raises for a full buffer"""
+        if len(self.buffer) == self.buffer.maxlen:
+            self.stats["dropped"] += 1
+        self.buffer.append(
+            ActivityEvent(time.time(), user_id, kind, path, status, duration_ms, score)
+        )
+        self.stats["recorded"] += 1
+        if len(self.buffer) >= self.batch_size:
+            self._ready.set()
+
+    def snapshot(self) -> Dict[str, int]:
+        return {"buffered": len(self.buffer), "capacity": self.buffer.maxlen, **self.stats}
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._ready.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write everything buffered, ``batch_size`` events per write"""
+        while self.buffer:
+            batch = [self.buffer.popleft() for _ in range(min(self.batch_size, len(self.buffer)))]
+            try:
+                await self.sink.write(batch)
+            except Exception:
+                # The buffer keeps filling meanwhile; losing one batch beats blocking requests
+                self.stats["failed"] += len(batch)
+                logger.exception("Failed to write %d activity events", len(batch))
+            else:
+                self.stats["flushed"] += len(batch)
+                self.stats["batches"] += 1
+
+    async def stop(self) -> None:
+        """Let the flusher finish its current write, then flush everything still buffered"""
+        self._stopping = True
+        self._ready.set()
+        if self._task is not None:
+            await self._task
+        await self.flush()
+        close = getattr(self.sink, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,190 @@
+"""Adaptive admission control and load shedding per mount prefix
+
+Each mount prefix gets its own ``AdaptiveLimiter``. A request is admitted
+while the prefix is under its concurrency limit, otherwise it waits in a
+short bounded queue, and past that it gets an immediate 503. The limit
+follows a gradient rule: it shrinks when recent latency rises above the
+long-term average and grows while latency stays flat and the limit is
+actually being used. A slow ``/chat`` backend therefore sheds its own load
+instead of occupying the event loop that ``/content`` needs.
+"""
+
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+
+class AdaptiveLimiter:
+    """Gradient-style adaptive concurrency limit with a bounded wait queue"""
+
+    def __init__(
+        self,
+        initial_limit: int = 20,
+        min_limit: int = 1,
+        max_limit: int = 200,
+        max_queue: int = 50,
+        queue_timeout: float = 0.5,
+        tolerance: float = 1.5,
+        smoothing: float = 0.2,
+        backoff: float = 0.9,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.backoff = backoff
+        self.inflight = 0
+        self.short_rtt: Optional[float] = None
+        self.long_rtt: Optional[float] = None
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "queue_timeouts": 0}
+
+    async def acquire(self) -> bool:
+        """Take a slot, waiting briefly in the queue; False means shed the request"""
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            self.stats["admitted"] += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.stats["rejected"] += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.stats["queued"] += 1
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self.inflight -= 1
+                self._wake()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            self.stats["queue_timeouts"] += 1
+            self.stats["rejected"] += 1
+            return False
+        self.stats["admitted"] += 1
+        return True
+
+    def release(self, latency: float, overloaded: bool = False) -> None:
+        """Return a slot and feed the request's latency into the limit"""
+        self._update_limit(latency, overloaded)
+        self.inflight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(None)
+
+    def _update_limit(self, latency: float, overloaded: bool) -> None:
+        latency = max(latency, 1e-6)
+        self.short_rtt = latency if self.short_rtt is None else 0.5 * self.short_rtt + 0.5 * latency
+        self.long_rtt = latency if self.long_rtt is None else 0.95 * self.long_rtt + 0.05 * latency
+        if self.long_rtt > 2 * self.short_rtt:
+            # Recover quickly after a latency spike has passed
+            self.long_rtt *= 0.9
+
+        if overloaded:
+            limit = self.limit * self.backoff
+        else:
+            gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / self.short_rtt))
+            # Only grow when the current limit is actually being used
+            headroom = math.sqrt(self.limit) if self.inflight >= self.limit / 2 else 0.0
+            target = self.limit * gradient + headroom
+            limit = self.limit * (1 - self.smoothing) + target * self.smoothing
+        self.limit = max(float(self.min_limit), min(float(self.max_limit), limit))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "inflight": self.inflight,
+            "queue_depth": len(self._waiters),
+            "short_rtt_ms": round((self.short_rtt or 0) * 1000, 2),
+            "long_rtt_ms": round((self.long_rtt or 0) * 1000, 2),
+            **self.stats,
+        }
+
+
+class AdmissionControlMiddleware:
+    """ASGI middleware applying a separate ``AdaptiveLimiter`` per path prefix"""
+
+    def __init__(self, app, limiters: Dict[str, AdaptiveLimiter], retry_after: int = 1):
+        self.app = app
+        # Longest prefix first so nested mounts win over their parents
+        self.limiters = sorted(limiters.items(), key=lambda item: len(item[0]), reverse=True)
+        self.retry_after = retry_after
+        self._rejection = json.dumps({"detail": "Service overloaded, retry shortly"}).encode()
+
+    def _limiter_for(self, path: str) -> Optional[AdaptiveLimiter]:
+        for prefix, limiter in self.limiters:
+            if path == prefix or path.startswith(prefix + "/"):
+                return limiter
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limiter = self._limiter_for(scope["path"])
+        if limiter is None:
+            return await self.app(scope, receive, send)
+
+        if not await limiter.acquire():
+            return await self._reject(send)
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Downstream 503/504s mean the service itself is overloaded
+            limiter.release(time.perf_counter() - start, overloaded=status in (503, 504))
+
+    async def _reject(self, send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(self._rejection)).encode()),
+                    (b"retry-after", str(self.retry_after).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": self._rejection})
+
+
+def limiter_from_env(environ: Dict[str, str], name: str) -> AdaptiveLimiter:
+    """Build a limiter from ``ADMISSION_<NAME>_*`` settings, falling back to defaults"""
+
+    def setting(key: str, default, cast):
+        prefix = f"ADMISSION_{name.upper()}_{key}"
+        return cast(environ.get(prefix, environ.get(f"ADMISSION_{key}", default)))
+
+    return AdaptiveLimiter(
+        initial_limit=setting("INITIAL_LIMIT", 20, int),
+        min_limit=setting("MIN_LIMIT", 1, int),
+        max_limit=setting("MAX_LIMIT", 200, int),
+        max_queue=setting("MAX_QUEUE", 50, int),
+        queue_timeout=setting("QUEUE_TIMEOUT", 0.5, float),
+    )
@@ -0,0 +1,413 @@
+"""WebSocket channel for tutor chat, authenticated once per connection
+
+Over HTTP every chat turn pays for its own request: CORS, the gateway's JWT
+check and the service's user lookup. Here the token is verified once at
+connect time and then any number of turns share the socket. Frames are JSON:
+
+client -> server::
+
+    {"type": "message", "id": "m1", "conversation": "c1", "text": "..."}
+    {"type": "cancel", "id": "m1"}
+    {"type": "ping"} / {"type": "pong"}
+
+server -> client::
+
+    {"type": "delta", "id": "m1", "text": "..."}   (streamed reply chunks)
+    {"type": "done", "id": "m1"}
+    {"type": "error", "id": "m1", "detail": "..."}
+    {"type": "ping"} / {"type": "pong"}
+
+Several messages may be in flight at once; their replies are interleaved
+and told apart by ``id``. Outgoing frames go through a bounded per-connection
+queue, so a slow client slows its own reply streams down instead of
+buffering without limit, and is disconnected if it stops reading entirely.
+"""
+
+import asyncio
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Protocol
+
+import orjson
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+from tutor_stack_core.conversations import ConversationContext, ConversationStore
+
+SUBPROTOCOL = "tutor-chat.v1"
+TOKEN_SUBPROTOCOL_PREFIX = "bearer."
+
+# RFC 6455 close codes
+POLICY_VIOLATION = 1008
+GOING_AWAY = 1001
+TRY_AGAIN_LATER = 1013
+
+
+class ChatModel(Protocol):
+    def stream_reply(
+        self,
+        claims: Dict[str, Any],
+        conversation: Optional[str],
+        text: str,
+        token: str,
+        context: Optional[ConversationContext] = None,
+    ) -> AsyncIterator[str]:
+        """Yield the reply to ``text`` in chunks, on behalf of the token's user
+
+        ``context`` holds the conversation's earlier turns when the server keeps history.
+        """
+
+
+class EchoChatModel:
+    """Local stand-in for the tutor model: streams the prompt back word by word"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+
+    async def stream_reply(
+        self, claims, conversation, text, token, context=None
+    ) -> AsyncIterator[str]:
+        for word in text.split():
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield word + " "
+
+
+class ASGIChatModel:
+    """Streams replies from the chat service app (mounted in-process or a ``ServiceProxy``)
+
+    Each turn is POSTed to ``path`` as ``{"message", "conversation_id"}``, plus
+    ``history`` (summary and recent turns) when the server keeps it, with the
+    connection's token, and the response body is relayed chunk by chunk.
+    """
+
+    def __init__(self, app, path: str = "/messages"):
+        self.app = app
+        self.path = path
+
+    async def stream_reply(
+        self, claims, conversation, text, token, context=None
+    ) -> AsyncIterator[str]:
+        payload = {"message": text, "conversation_id": conversation}
+        if context is not None:
+            payload["history"] = context.as_dict()
+        body = orjson.dumps(payload)
+        headers = [
+            (b"content-type", b"application/json"),
+            (b"authorization", b"Bearer " + token.encode()),
+        ]
+        status, chunks = await _stream_asgi(self.app, self.path, headers, body)
+        async for chunk in chunks:
+            if status >= 400:
+                raise RuntimeError(f"chat service returned {status}")
+            yield chunk.decode("utf-8", errors="replace")
+
+
+async def _stream_asgi(app, path: str, headers, body: bytes):
+    """Call an ASGI app in-process and return its status plus an iterator over body chunks"""
+    chunks: asyncio.Queue = asyncio.Queue()
+    started = asyncio.get_running_loop().create_future()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"chat-socket"), *headers],
+        "client": ("127.0.0.1", 0),
+        "server": ("chat-socket", 80),
+    }
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start" and not started.done():
+            started.set_result(message["status"])
+        elif message["type"] == "http.response.body":
+            if message.get("body"):
+                await chunks.put(message["body"])
+            if not message.get("more_body", False):
+                await chunks.put(None)
+
+    async def run():
+        try:
+            await app(scope, receive, send)
+        except Exception as e:
+            if not started.done():
+                started.set_exception(e)
+            await chunks.put(e)
+
+    task = asyncio.create_task(run())
+    status = await started
+
+    async def iterate():
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    return
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            task.cancel()
+
+    return status, iterate()
+
+
+class ChatSocketServer:
+    """Accepts chat WebSockets and multiplexes streamed replies over each one"""
+
+    def __init__(
+        self,
+        model: ChatModel,
+        authenticate: Callable[[str], Awaitable[Dict[str, Any]]],
+        max_inflight: int = 4,
+        send_queue_size: int = 64,
+        send_timeout: float = 10.0,
+        heartbeat_interval: float = 20.0,
+        heartbeat_timeout: float = 60.0,
+        history: Optional[ConversationStore] = None,
+        on_message: Optional[Callable[[Dict[str, Any], Optional[str]], None]] = None,
+    ):
+        self.model = model
+        self.authenticate = authenticate
+        self.max_inflight = max_inflight
+        self.send_queue_size = send_queue_size
+        self.send_timeout = send_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.history = history
+        self.on_message = on_message
+        self.open_connections = 0
+        self.stats = {
+            "connections": 0,
+            "auth_failures": 0,
+            "messages_in": 0,
+            "frames_out": 0,
+            "replies": 0,
+            "reply_errors": 0,
+            "rejected_busy": 0,
+            "backpressure_waits": 0,
+            "slow_consumer_disconnects": 0,
+            "heartbeat_timeouts": 0,
+        }
+        self._first_delta_ms: Optional[float] = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "open_connections": self.open_connections,
+            "first_delta_ms": round(self._first_delta_ms or 0, 2),
+            **self.stats,
+        }
+
+    async def serve(self, websocket: WebSocket) -> None:
+        token, offered = _token_from(websocket)
+        try:
+            if not token:
+                raise PermissionError("missing token")
+            claims = await self.authenticate(token)
+        except Exception:
+            self.stats["auth_failures"] += 1
+            # Closing before accept rejects the handshake itself
+            await websocket.close(code=POLICY_VIOLATION)
+            return
+
+        await websocket.accept(subprotocol=SUBPROTOCOL if SUBPROTOCOL in offered else None)
+        connection = _Connection(self, websocket, claims, token)
+        self.open_connections += 1
+        self.stats["connections"] += 1
+        try:
+            await connection.run()
+        finally:
+            self.open_connections -= 1
+
+
+class _Connection:
+    def __init__(self, server: ChatSocketServer, websocket: WebSocket, claims, token: str):
+        self.server = server
+        self.websocket = websocket
+        self.claims = claims
+        self.token = token
+        self.outgoing: asyncio.Queue = asyncio.Queue(server.send_queue_size)
+        self.replies: Dict[str, asyncio.Task] = {}
+        self.last_seen = time.monotonic()
+        self.closing: Optional[int] = None
+        self._closed = asyncio.Event()
+
+    def close(self, code: int) -> None:
+        if self.closing is None:
+            self.closing = code
+        self._closed.set()
+
+    async def run(self) -> None:
+        tasks = {
+            asyncio.create_task(self._write()),
+            asyncio.create_task(self._heartbeat()),
+            asyncio.create_task(self._read()),
+            asyncio.create_task(self._closed.wait()),
+        }
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (*tasks, *self.replies.values()):
+                task.cancel()
+            if self.closing is not None:
+                try:
+                    # A client that stopped reading may not take the close frame either
+                    await asyncio.wait_for(self.websocket.close(code=self.closing), 5)
+                except (RuntimeError, asyncio.TimeoutError):
+                    pass
+
+    async def send(self, frame: Dict[str, Any]) -> None:
+        """Queue a frame, waiting while the client is slow to read"""
+        stats = self.server.stats
+        if self.outgoing.full():
+            stats["backpressure_waits"] += 1
+        try:
+            await asyncio.wait_for(self.outgoing.put(frame), self.server.send_timeout)
+        except asyncio.TimeoutError:
+            stats["slow_consumer_disconnects"] += 1
+            self.close(TRY_AGAIN_LATER)
+            raise
+
+    async def _write(self) -> None:
+        while True:
+            frame = await self.outgoing.get()
+            await self.websocket.send_bytes(orjson.dumps(frame))
+            self.server.stats["frames_out"] += 1
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.server.heartbeat_interval)
+            if time.monotonic() - self.last_seen > self.server.heartbeat_timeout:
+                self.server.stats["heartbeat_timeouts"] += 1
+                self.close(GOING_AWAY)
+                return
+            expires = self.claims.get("exp")
+            if expires and expires < time.time():
+                self._try_send({"type": "error", "detail": "Token expired"})
+                await asyncio.sleep(0)
+                self.close(POLICY_VIOLATION)
+                return
+            await self.send({"type": "ping"})
+
+    async def _read(self) -> None:
+        try:
+            while True:
+                raw = await self.websocket.receive_text()
+                self.last_seen = time.monotonic()
+                try:
+                    frame = orjson.loads(raw)
+                    kind = frame["type"]
+                except (orjson.JSONDecodeError, KeyError, TypeError):
+                    await self.send({"type": "error", "detail": "Malformed frame"})
+                    continue
+                if kind == "message":
+                    await self._start_reply(frame)
+                elif kind == "cancel":
+                    task = self.replies.get(str(frame.get("id")))
+                    if task is not None:
+                        task.cancel()
+                elif kind == "ping":
+                    await self.send({"type": "pong"})
+        except WebSocketDisconnect:
+            return
+
+    async def _start_reply(self, frame: Dict[str, Any]) -> None:
+        server = self.server
+        server.stats["messages_in"] += 1
+        message_id = str(frame.get("id", ""))
+        text = frame.get("text")
+        if not message_id or not isinstance(text, str) or message_id in self.replies:
+            await self.send({"type": "error", "id": message_id, "detail": "Invalid message"})
+            return
+        if len(self.replies) >= server.max_inflight:
+            server.stats["rejected_busy"] += 1
+            await self.send({"type": "error", "id": message_id, "detail": "Too many messages"})
+            return
+        if server.on_message is not None:
+            server.on_message(self.claims, frame.get("conversation"))
+        task = asyncio.create_task(self._reply(message_id, frame.get("conversation"), text))
+        self.replies[message_id] = task
+        task.add_done_callback(lambda _: self.replies.pop(message_id, None))
+
+    async def _reply(self, message_id: str, conversation: Optional[str], text: str) -> None:
+        server = self.server
+        start = time.perf_counter()
+        first = True
+        session = context = None
+        reply: List[str] = []
+        try:
+            if server.history is not None and conversation:
+                # Scoped to the user, so a guessed conversation ID reveals nothing
+                session = f"{self.claims.get('sub')}:{conversation}"
+                context = await server.history.context(session)
+                await server.history.append(session, "user", text)
+            replies = server.model.stream_reply(
+                self.claims, conversation, text, self.token, context=context
+            )
+            async for delta in replies:
+                reply.append(delta)
+                if first:
+                    elapsed = (time.perf_counter() - start) * 1000
+                    previous = server._first_delta_ms
+                    server._first_delta_ms = (
+                        elapsed if previous is None else 0.9 * previous + 0.1 * elapsed
+                    )
+                    first = False
+                await self.send({"type": "delta", "id": message_id, "text": delta})
+            await self.send({"type": "done", "id": message_id})
+            server.stats["replies"] += 1
+            if session is not None:
+                await server.history.append(session, "assistant", "".join(reply))
+        except asyncio.CancelledError:
+            if self.closing is None:
+                self._try_send({"type": "error", "id": message_id, "detail": "Cancelled"})
+            raise
+        except asyncio.TimeoutError:
+            pass  # Slow consumer; the connection is being closed
+        except Exception:
+            server.stats["reply_errors"] += 1
+            await self.send({"type": "error", "id": message_id, "detail": "Reply failed"})
+
+    def _try_send(self, frame: Dict[str, Any]) -> None:
+        try:
+            self.outgoing.put_nowait(frame)
+        except asyncio.QueueFull:
+            pass
+
+
+def _token_from(websocket: WebSocket):
+    """Bearer token from the subprotocol list, the Authorization header or ``?token=``"""
+    offered = [
+        protocol.strip()
+        for protocol in websocket.headers.get("sec-websocket-protocol", "").split(",")
+        if protocol.strip()
+    ]
+    for protocol in offered:
+        if protocol.startswith(TOKEN_SUBPROTOCOL_PREFIX):
+            return protocol[len(TOKEN_SUBPROTOCOL_PREFIX):], offered
+    scheme, _, token = websocket.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return token, offered
+    return websocket.query_params.get("token"), offered
+
+
+def create_chat_socket_router(server: ChatSocketServer, path: str = "/ws/chat") -> APIRouter:
+    """Router exposing the chat WebSocket"""
+    router = APIRouter()
+
+    @router.websocket(path)
+    async def chat_socket(websocket: WebSocket):
+        await server.serve(websocket)
+
+    return router
@@ -0,0 +1,209 @@
+"""Compact conversation history with windowed context retrieval
+
+Each prompt only needs the last few turns plus a summary of what came
+before, so that is all that is kept in memory: a fixed window of slotted
+``Turn`` records per session, and a rolling summary that older turns are
+folded into as they leave the window. Idle sessions are evicted LRU. With a
+SQLite path, every turn is also appended to disk, so an evicted (or
+restarted) session is reloaded from its last window and summary.
+"""
+
+import asyncio
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+ROLES = ("user", "assistant", "system")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English prose)"""
+    return (len(text) + 3) // 4
+
+
+class Turn:
+    __slots__ = ("role", "text", "tokens")
+
+    def __init__(self, role: str, text: str, tokens: Optional[int] = None):
+        self.role = sys.intern(role)
+        self.text = text
+        self.tokens = estimate_tokens(text) if tokens is None else tokens
+
+    def as_dict(self) -> Dict[str, str]:
+        return {"role": self.role, "text": self.text}
+
+    def __repr__(self) -> str:
+        return f"Turn({self.role!r}, {self.text[:40]!r})"
+
+
+def extractive_summary(summary: str, turn: Turn, max_tokens: int = 200) -> str:
+    """Fold ``turn`` into ``summary`` as its first sentence, dropping the oldest lines to fit"""
+    sentence = turn.text.strip().split("\n", 1)[0]
+    for end in (". ", "? ", "! "):
+        if end in sentence:
+            sentence = sentence.split(end, 1)[0] + end.strip()
+    lines = summary.split("\n") if summary else []
+    lines.append(f"{turn.role}: {sentence}")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+@dataclass
+class ConversationContext:
+    """What a prompt gets: the summary of older turns and the most recent ones, oldest first"""
+
+    summary: str
+    turns: List[Turn]
+    tokens: int
+
+    def as_dict(self) -> Dict[str, object]:
+        return {"summary": self.summary, "turns": [turn.as_dict() for turn in self.turns]}
+
+
+class _Session:
+    __slots__ = ("turns", "summary", "summary_tokens")
+
+    def __init__(self, window: int, turns=(), summary: str = ""):
+        self.turns = deque(turns, maxlen=window)
+        self.summary = summary
+        self.summary_tokens = estimate_tokens(summary)
+
+
+class ConversationStore:
+    """Per-session turn windows with rolling summaries, LRU-bounded, optionally on SQLite"""
+
+    def __init__(
+        self,
+        window_turns: int = 20,
+        token_budget: int = 2000,
+        max_sessions: int = 10_000,
+        summary_tokens: int = 200,
+        summarize: Optional[Callable[[str, Turn], str]] = None,
+        sqlite_path: Optional[str] = None,
+    ):
+        self.window_turns = window_turns
+        self.token_budget = token_budget
+        self.max_sessions = max_sessions
+        self.summarize = summarize or (
+            lambda summary, turn: extractive_summary(summary, turn, summary_tokens)
+        )
+        self.evictions = 0
+        self.loads = 0
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS conversation_turns ("
+                " session TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL,"
+                " text TEXT NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (session, seq))"
+                " WITHOUT ROWID"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS conversation_summaries ("
+                " session TEXT PRIMARY KEY, summary TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    async def append(self, session: str, role: str, text: str) -> None:
+        if role not in ROLES:
+            raise ValueError(f"Unknown role {role!r}")
+        state = await self._session(session)
+        turn = Turn(role, text)
+        summary = None
+        if len(state.turns) == state.turns.maxlen:
+            state.summary = summary = self.summarize(state.summary, state.turns[0])
+            state.summary_tokens = estimate_tokens(summary)
+        state.turns.append(turn)
+        if self._db is not None:
+            await asyncio.to_thread(self._db_append, session, turn, summary)
+
+    async def context(
+        self,
+        session: str,
+        token_budget: Optional[int] = None,
+        max_turns: Optional[int] = None,
+    ) -> ConversationContext:
+        """The summary plus as many recent turns as fit in ``token_budget``"""
+        state = await self._session(session)
+        budget = self.token_budget if token_budget is None else token_budget
+        summary = state.summary if state.summary_tokens <= budget else ""
+        used = estimate_tokens(summary)
+        turns: List[Turn] = []
+        for turn in reversed(state.turns):
+            if (max_turns is not None and len(turns) >= max_turns) or used + turn.tokens > budget:
+                break
+            turns.append(turn)
+            used += turn.tokens
+        turns.reverse()
+        return ConversationContext(summary, turns, used)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "turns_in_memory": sum(len(state.turns) for state in self._sessions.values()),
+            "evictions": self.evictions,
+            "loads": self.loads,
+        }
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+
+    async def _session(self, session: str) -> _Session:
+        state = self._sessions.get(session)
+        if state is not None:
+            self._sessions.move_to_end(session)
+            return state
+        if self._db is not None:
+            loaded = await asyncio.to_thread(self._db_load, session)
+            self.loads += 1
+            # Another task may have loaded (and appended to) it meanwhile
+            state = self._sessions.get(session) or loaded
+        else:
+            state = _Session(self.window_turns)
+        self._sessions[session] = state
+        self._sessions.move_to_end(session)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+        return state
+
+    def _db_append(self, session: str, turn: Turn, summary: Optional[str]) -> None:
+        with self._db_lock, self._db:
+            # The database numbers the turn: workers sharing the file each keep their own
+            # window, so none of them knows the session's last seq. One statement holds the
+            # write lock from reading MAX(seq) to inserting.
+            self._db.execute(
+                "INSERT INTO conversation_turns"
+                " SELECT ?, COALESCE(MAX(seq) + 1, 0), ?, ?, ? FROM conversation_turns"
+                " WHERE session = ?",
+                (session, turn.role, turn.text, time.time(), session),
+            )
+            if summary is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO conversation_summaries VALUES (?, ?)",
+                    (session, summary),
+                )
+
+    def _db_load(self, session: str) -> _Session:
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT role, text FROM conversation_turns WHERE session = ?"
+                " ORDER BY seq DESC LIMIT ?",
+                (session, self.window_turns),
+            ).fetchall()
+            row = self._db.execute(
+                "SELECT summary FROM conversation_summaries WHERE session = ?", (session,)
+            ).fetchone()
+        turns = [Turn(role, text) for role, text in reversed(rows)]
+        return _Session(self.window_turns, turns, row[0] if row else "")
@@ -0,0 +1,147 @@
+"""Prefix-trie dispatch in front of the app's route table
+
+Starlette tries every route's regex in order until one matches, so a request
+for a mount near the end of the table (``/chat``, ``/content``, ...) pays
+for every auth and admin route before it. ``PrefixDispatcher`` compiles the
+table once into a trie keyed by path segment, holding each route at the node
+for its literal prefix (the segments before its first ``{param}``).
+Resolving a path walks the trie once and yields only the routes that could
+match it. The router's own matching loop then runs over that short list, in
+the original order, so precedence, 405 handling, slash redirects and
+low-priority routes behave exactly as before.
+
+Nodes can also carry tags (e.g. ``"public"``), so middleware such as the
+gateway's ``guard`` classifies a request with the same walk. The result is
+cached in the scope and reused by the router.
+"""
+
+import copy
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+from starlette.routing import Host, Router, get_route_path
+
+SCOPE_KEY = "tutor_stack.dispatch"
+
+
+def literal_segments(path: str) -> List[str]:
+    """Whole path segments before the first one containing a parameter"""
+    segments = []
+    for segment in path.strip("/").split("/"):
+        if not segment or "{" in segment:
+            break
+        segments.append(segment)
+    return segments
+
+
+def route_prefix(route) -> Optional[str]:
+    """The literal path every request this route can match starts with, if known"""
+    if isinstance(route, Host):
+        return None
+    path = getattr(route, "path", None)
+    if path is None:
+        # FastAPI's included routers keep their routes behind an include prefix
+        context = getattr(route, "include_context", None)
+        path = getattr(context, "prefix", None)
+    return path
+
+
+class DispatchNode:
+    """A trie node: the candidate routes and tags for paths reaching it"""
+
+    __slots__ = ("children", "indices", "tags", "router", "prefix")
+
+    def __init__(self, prefix: str):
+        self.children: Dict[str, "DispatchNode"] = {}
+        self.indices: List[int] = []
+        self.tags: FrozenSet[str] = frozenset()
+        self.router: Optional[Router] = None
+        self.prefix = prefix
+
+
+class PrefixDispatcher:
+    """Compiled view of ``router.routes``; ``install()`` puts it in front of the router"""
+
+    def __init__(self, router: Router):
+        self.router = router
+        self._tags: Dict[str, Set[str]] = {}
+        self._root = DispatchNode("/")
+        self._compiled_version: Optional[tuple] = None
+
+    def tag(self, prefixes: Iterable[str], tag: str) -> None:
+        """Attach ``tag`` to every path under each of ``prefixes`` (whole segments)"""
+        for prefix in prefixes:
+            self._tags.setdefault(prefix, set()).add(tag)
+        self._compiled_version = None
+
+    def compile(self) -> None:
+        routes = self.router.routes
+        root = DispatchNode("/")
+        for index, route in enumerate(routes):
+            path = route_prefix(route)
+            node = root
+            for segment in literal_segments(path) if path is not None else []:
+                node = node.children.setdefault(
+                    segment, DispatchNode(node.prefix.rstrip("/") + "/" + segment)
+                )
+            node.indices.append(index)
+        for prefix, tags in self._tags.items():
+            node = root
+            for segment in literal_segments(prefix):
+                node = node.children.setdefault(
+                    segment, DispatchNode(node.prefix.rstrip("/") + "/" + segment)
+                )
+            node.tags = node.tags | tags
+        self._finish(root, [], frozenset())
+        self._root = root
+        self._compiled_version = self._version()
+
+    def _finish(self, node: DispatchNode, inherited: List[int], tags: FrozenSet[str]) -> None:
+        """Give each node the routes and tags of its ancestors, plus a router over them"""
+        indices = sorted(inherited + node.indices)
+        node.tags = tags | node.tags
+        router = copy.copy(self.router)
+        router.routes = [self.router.routes[index] for index in indices]
+        node.router = router
+        node.indices = indices
+        for child in node.children.values():
+            self._finish(child, indices, node.tags)
+
+    def _version(self) -> tuple:
+        routes = self.router.routes
+        return (len(routes), id(routes[-1]) if routes else None)
+
+    def resolve(self, path: str) -> DispatchNode:
+        """The deepest node along ``path``, recompiling first if routes were added since"""
+        if self._compiled_version != self._version():
+            self.compile()
+        node = self._root
+        for segment in path.split("/"):
+            if not segment:
+                continue
+            child = node.children.get(segment)
+            if child is None:
+                break
+            node = child
+        return node
+
+    def lookup(self, scope) -> DispatchNode:
+        """Resolve a request once; later calls for the same scope reuse the result"""
+        cached = scope.get(SCOPE_KEY)
+        if cached is not None and cached[0] is self:
+            return cached[1]
+        # Keyed by dispatcher: mounted apps share the scope dict and may have their own
+        node = self.resolve(get_route_path(scope))
+        scope[SCOPE_KEY] = (self, node)
+        return node
+
+    def install(self) -> None:
+        """Dispatch the router's requests through the trie (it has no middleware of its own)"""
+        self.compile()
+        self.router.middleware_stack = self
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.router.app(scope, receive, send)
+        node = self.lookup(scope)
+        scope.setdefault("router", self.router)
+        await node.router.app(scope, receive, send)
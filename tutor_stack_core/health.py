@@ -0,0 +1,138 @@
+"""Liveness and readiness checks with cached, background dependency probes
+
+Probes run on an interval in a background task and their last results are
+cached, so readiness polling by an orchestrator never triggers database
+queries or sub-app calls of its own.
+"""
+
+import asyncio
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import text
+
+Probe = Callable[[], Awaitable[Any]]
+
+
+@dataclass
+class ProbeResult:
+    """Outcome of the latest run of one probe"""
+
+    ok: bool
+    latency_ms: float
+    checked_at: float
+    error: Optional[str] = None
+
+
+class HealthMonitor:
+    """Runs registered probes periodically and caches their results"""
+
+    def __init__(self, interval: float = 10.0, timeout: float = 2.0):
+        self.interval = interval
+        self.timeout = timeout
+        self.probes: Dict[str, Probe] = {}
+        self.results: Dict[str, ProbeResult] = {}
+
+    def add_probe(self, name: str, probe: Probe) -> None:
+        """Register an async callable that raises (or times out) when unhealthy"""
+        self.probes[name] = probe
+
+    async def _run_probe(self, name: str, probe: Probe) -> None:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(probe(), self.timeout)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            self.results[name] = ProbeResult(False, _elapsed_ms(start), time.time(), error)
+        else:
+            self.results[name] = ProbeResult(True, _elapsed_ms(start), time.time())
+
+    async def check(self) -> None:
+        """Run every probe once, concurrently"""
+        await asyncio.gather(*(self._run_probe(name, p) for name, p in self.probes.items()))
+
+    async def run(self) -> None:
+        """Probe forever until cancelled"""
+        while True:
+            await self.check()
+            await asyncio.sleep(self.interval)
+
+    def is_ready(self, now: Optional[float] = None) -> bool:
+        """Ready when every probe has passed recently; stale results count as failures"""
+        now = now or time.time()
+        stale_after = 3 * self.interval + self.timeout
+        return all(
+            name in self.results
+            and self.results[name].ok
+            and now - self.results[name].checked_at <= stale_after
+            for name in self.probes
+        )
+
+    def report(self) -> Dict[str, Any]:
+        """Readiness status plus the cached result of each probe"""
+        return {
+            "status": "ready" if self.is_ready() else "not_ready",
+            "checks": {name: asdict(result) for name, result in self.results.items()},
+        }
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def database_probe(engine) -> Probe:
+    """Probe that checks a pooled connection can run ``SELECT 1``"""
+
+    async def probe() -> None:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    return probe
+
+
+def asgi_health_probe(app, path: str = "/health") -> Probe:
+    """Probe that calls a mounted sub-app's health route in-process"""
+
+    async def probe() -> None:
+        status = await call_asgi(app, path)
+        if status != 200:
+            raise RuntimeError(f"{path} returned {status}")
+
+    return probe
+
+
+async def call_asgi(app, path: str, method: str = "GET") -> int:
+    """Send a bodiless request straight to an ASGI app and return the status code"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"health-probe")],
+        "client": ("127.0.0.1", 0),
+        "server": ("health-probe", 80),
+    }
+    status = 500
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Nothing else will arrive; park like a client that keeps the connection open
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
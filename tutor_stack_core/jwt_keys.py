@@ -0,0 +1,360 @@
+"""JWT key material parsed once per process
+
+PyJWT re-parses PEM strings on every ``encode``/``decode`` call, which for a
+4096-bit RSA key costs more than the signature check itself. Everything here
+hands PyJWT ready-made ``cryptography`` key objects instead.
+
+Public keys live in a ``KeyCache`` indexed by ``kid`` (the RFC 7638 JWK
+thumbprint), which can hot-reload a key directory so keys rotate without a
+restart. Verification is one dict lookup plus the signature check.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from jwt.algorithms import ECAlgorithm, OKPAlgorithm, RSAAlgorithm
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_ALGORITHMS = ("RS256", "ES256", "EdDSA")
+DEFAULT_AUDIENCE = ["fastapi-users:auth"]
+
+_JWK_CONVERTERS = {"RS256": RSAAlgorithm, "ES256": ECAlgorithm, "EdDSA": OKPAlgorithm}
+_THUMBPRINT_MEMBERS = {
+    "RSA": ("e", "kty", "n"),
+    "EC": ("crv", "kty", "x", "y"),
+    "OKP": ("crv", "kty", "x"),
+}
+
+
+@dataclass(frozen=True)
+class SigningKeys:
+    """A parsed key pair together with the algorithm it signs with"""
+
+    algorithm: str
+    private_key: Optional[Any]
+    public_key: Any
+    kid: Optional[str] = None
+
+
+def load_private_key(path: str) -> Any:
+    """Parse a PEM private key file"""
+    with open(path, "rb") as f:
+        return serialization.load_pem_private_key(f.read(), password=None)
+
+
+def load_public_key(path: str) -> Any:
+    """Parse a PEM public key file"""
+    with open(path, "rb") as f:
+        return serialization.load_pem_public_key(f.read())
+
+
+_PEM_PUBLIC_KEY = re.compile(r"-----BEGIN PUBLIC KEY-----.*?-----END PUBLIC KEY-----", re.S)
+
+
+def load_edge_public_key(path: str) -> Any:
+    """Parse the public key the edge proxy verifies with
+
+    ``path`` is a PEM file or a config file with the PEM inlined, such as
+    Traefik's dynamic configuration (indentation is stripped).
+    """
+    with open(path) as f:
+        match = _PEM_PUBLIC_KEY.search(f.read())
+    if match is None:
+        raise RuntimeError(f"No PEM public key found in {path}")
+    pem = "\n".join(line.strip() for line in match.group(0).splitlines())
+    return serialization.load_pem_public_key(pem.encode())
+
+
+def check_edge_key(keys: "KeyCache", edge_key: Any, algorithm: str = "RS256") -> None:
+    """Raise ``RuntimeError`` unless the edge accepts tokens signed with the active key
+
+    The edge proxy checks signatures with one fixed key, so signing with any
+    other key or algorithm would get every token rejected there.
+    """
+    signing = keys.signing_keys()
+    if signing.algorithm != algorithm:
+        raise RuntimeError(
+            f"Tokens are signed with {signing.algorithm}, but the edge verifies {algorithm}"
+        )
+    if key_id(signing.public_key) != key_id(edge_key):
+        raise RuntimeError(
+            f"The active signing key {signing.kid} is not the public key deployed at the edge"
+            f" ({key_id(edge_key)}); update the edge configuration"
+        )
+
+
+def key_algorithm(key: Any) -> str:
+    """Infer the JWS algorithm for a parsed public or private key"""
+    if isinstance(key, (rsa.RSAPublicKey, rsa.RSAPrivateKey)):
+        return "RS256"
+    if isinstance(key, (ec.EllipticCurvePublicKey, ec.EllipticCurvePrivateKey)):
+        if not isinstance(key.curve, ec.SECP256R1):
+            raise ValueError(f"Unsupported elliptic curve {key.curve.name}, expected P-256")
+        return "ES256"
+    if isinstance(key, (ed25519.Ed25519PublicKey, ed25519.Ed25519PrivateKey)):
+        return "EdDSA"
+    raise ValueError(f"Unsupported key type {type(key).__name__}")
+
+
+def public_jwk(public_key: Any) -> Dict[str, str]:
+    """Public JWK for a key, stamped with its ``kid``, ``alg`` and ``use``"""
+    algorithm = key_algorithm(public_key)
+    jwk = _JWK_CONVERTERS[algorithm].to_jwk(public_key, as_dict=True)
+    members = {name: jwk[name] for name in _THUMBPRINT_MEMBERS[jwk["kty"]]}
+    canonical = json.dumps(members, separators=(",", ":"), sort_keys=True).encode()
+    digest = hashlib.sha256(canonical).digest()
+    kid = base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+    return {**jwk, "kid": kid, "alg": algorithm, "use": "sig"}
+
+
+def key_id(public_key: Any) -> str:
+    """RFC 7638 thumbprint of a public key, used as its ``kid``"""
+    return public_jwk(public_key)["kid"]
+
+
+def _env_list(name: str) -> List[str]:
+    return [item.strip() for item in os.getenv(name, "").split(",") if item.strip()]
+
+
+@lru_cache(maxsize=None)
+def get_signing_keys() -> SigningKeys:
+    """Load the configured signing key pair once per process
+
+    ``JWT_ALG`` selects the algorithm (RS256, ES256 or EdDSA) and must match
+    the key files at ``SECRET_PRIVATE_KEY_PATH``/``SECRET_PUBLIC_KEY_PATH``.
+    """
+    private_path = os.getenv("SECRET_PRIVATE_KEY_PATH")
+    public_path = os.getenv("SECRET_PUBLIC_KEY_PATH") or os.getenv("JWT_PUBLIC_KEY_PATH")
+    if not public_path:
+        raise RuntimeError("SECRET_PUBLIC_KEY_PATH or JWT_PUBLIC_KEY_PATH must be set")
+
+    private_key = load_private_key(private_path) if private_path else None
+    public_key = load_public_key(public_path)
+    algorithm = os.getenv("JWT_ALG") or key_algorithm(public_key)
+    if algorithm not in SUPPORTED_ALGORITHMS:
+        raise RuntimeError(f"JWT_ALG must be one of {', '.join(SUPPORTED_ALGORITHMS)}")
+    if key_algorithm(public_key) != algorithm:
+        raise RuntimeError(f"Key at {public_path} cannot be used with JWT_ALG={algorithm}")
+    return SigningKeys(algorithm, private_key, public_key, key_id(public_key))
+
+
+class KeyCache:
+    """Public keys indexed by ``kid`` with optional hot reload from a directory
+
+    The key directory holds PEM files: ``*.pub`` public keys and ``*.key``
+    private keys. To rotate, drop the new pair in; every worker starts
+    accepting the new public key on its next reload, and signing switches to
+    the newest private key only once it is ``activation_delay`` seconds old,
+    so no worker sees a token for a key it has not loaded yet. Remove the old
+    public key after the token lifetime has passed.
+
+    With ``edge_key_path`` (see ``load_edge_public_key``), only a key the edge
+    proxy verifies with is ever used for signing; the file is re-read on every
+    reload, so a rotated key activates once the edge has been updated too.
+    """
+
+    def __init__(
+        self,
+        static_keys: Iterable[Any] = (),
+        signing_keys: Optional[SigningKeys] = None,
+        key_dir: Optional[str] = None,
+        activation_delay: float = 60.0,
+        edge_key_path: Optional[str] = None,
+        edge_algorithm: str = "RS256",
+    ):
+        self.key_dir = key_dir
+        self.activation_delay = activation_delay
+        self.edge_key_path = edge_key_path
+        self.edge_algorithm = edge_algorithm
+        self.edge_key: Optional[Any] = None
+        # The signing key goes first so kid-less tokens of its algorithm are checked against it
+        self._static: Dict[str, Any] = {}
+        if signing_keys is not None:
+            self._static[key_id(signing_keys.public_key)] = signing_keys.public_key
+        for key in static_keys:
+            self._static.setdefault(key_id(key), key)
+        self._static_signing = signing_keys
+        self._dir_public: Dict[str, Any] = {}
+        # Private keys from the directory, as (mtime, SigningKeys) newest first
+        self._dir_signing: List[Tuple[float, SigningKeys]] = []
+        self._mtimes: Dict[str, float] = {}
+        self._publish()
+        if key_dir or edge_key_path:
+            self.reload()
+
+    def _publish(self) -> None:
+        """Rebuild the lookup tables; readers always see a complete snapshot"""
+        keys = {**self._static, **self._dir_public}
+        by_kid = {kid: (key_algorithm(key), key) for kid, key in keys.items()}
+        by_algorithm: Dict[str, Any] = {}
+        for algorithm, key in by_kid.values():
+            by_algorithm.setdefault(algorithm, key)
+        self.by_kid = by_kid
+        self.by_algorithm = by_algorithm
+        self.jwks = {"keys": [public_jwk(key) for key in keys.values()]}
+        self.jwks_json = json.dumps(self.jwks, separators=(",", ":")).encode()
+
+    def get(self, kid: str) -> Optional[Tuple[str, Any]]:
+        """Return ``(algorithm, public_key)`` for a ``kid``"""
+        return self.by_kid.get(kid)
+
+    def reload(self) -> bool:
+        """Rescan the key directory and edge key, returning True when either changed"""
+        if not self.key_dir and not self.edge_key_path:
+            return False
+        try:
+            names = sorted(os.listdir(self.key_dir)) if self.key_dir else []
+        except FileNotFoundError:
+            names = []
+        mtimes = {}
+        for name in names:
+            if name.endswith((".pub", ".key")):
+                path = os.path.join(self.key_dir, name)
+                try:
+                    mtimes[path] = os.stat(path).st_mtime
+                except FileNotFoundError:
+                    continue
+        if self.edge_key_path:
+            mtimes[self.edge_key_path] = os.stat(self.edge_key_path).st_mtime
+        if mtimes == self._mtimes:
+            return False
+
+        edge_key = self.edge_key
+        public: Dict[str, Any] = {}
+        signing: List[Tuple[float, SigningKeys]] = []
+        for path, mtime in mtimes.items():
+            if path == self.edge_key_path:
+                edge_key = load_edge_public_key(path)
+            elif path.endswith(".pub"):
+                key = load_public_key(path)
+                public[key_id(key)] = key
+            else:
+                private_key = load_private_key(path)
+                public_key = private_key.public_key()
+                kid = key_id(public_key)
+                public[kid] = public_key
+                signing.append(
+                    (mtime, SigningKeys(key_algorithm(public_key), private_key, public_key, kid))
+                )
+        signing.sort(key=lambda item: item[0], reverse=True)
+
+        self.edge_key = edge_key
+        for _, keys in signing:
+            if not self._edge_accepts(keys):
+                logger.error(
+                    "JWT key %s is not the key deployed at the edge; it will not sign tokens",
+                    keys.kid,
+                )
+        self._dir_public = public
+        self._dir_signing = signing
+        self._mtimes = mtimes
+        self._publish()
+        return True
+
+    def _edge_accepts(self, keys: SigningKeys) -> bool:
+        if self.edge_key is None:
+            return True
+        return keys.algorithm == self.edge_algorithm and keys.kid == key_id(self.edge_key)
+
+    def signing_keys(self) -> SigningKeys:
+        """The key pair new tokens should be signed with"""
+        now = time.time()
+        candidates = [item for item in self._dir_signing if self._edge_accepts(item[1])]
+        for mtime, keys in candidates:
+            if now - mtime >= self.activation_delay:
+                return keys
+        if self._static_signing is not None and self._edge_accepts(self._static_signing):
+            return self._static_signing
+        if candidates:
+            # Nothing has passed its activation delay yet and there is no fallback
+            return candidates[-1][1]
+        if self.edge_key is not None:
+            raise RuntimeError(
+                f"No private key matches the public key deployed at the edge"
+                f" ({key_id(self.edge_key)}, {self.edge_algorithm}); update the edge configuration"
+            )
+        raise RuntimeError("No private key available for signing tokens")
+
+    async def run_reloader(self, interval: float) -> None:
+        """Reload the key directory every ``interval`` seconds until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.reload)
+            except (OSError, ValueError, RuntimeError) as e:
+                # Keep serving the last good key set if a half-written file is picked up
+                logger.warning("JWT key reload failed: %s", e)
+
+    @classmethod
+    def from_keys(cls, public_keys: Iterable[Any]) -> "KeyCache":
+        return cls(static_keys=public_keys)
+
+
+class TokenVerifier:
+    """Verify tokens against the public keys in a ``KeyCache``
+
+    Tokens carrying a ``kid`` are checked against exactly that key; tokens
+    issued before kids were stamped fall back to the first key registered for
+    their algorithm.
+    """
+
+    def __init__(self, keys: KeyCache, audience: Sequence[str] = DEFAULT_AUDIENCE):
+        self.keys = keys
+        self.audience = list(audience)
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Return the verified claims, raising ``jwt.PyJWTError`` on any failure"""
+        header = jwt.get_unverified_header(token)
+        algorithm = header.get("alg")
+        kid = header.get("kid")
+        if kid is not None:
+            entry = self.keys.by_kid.get(kid)
+            if entry is None:
+                raise jwt.InvalidKeyError(f"Unknown key id {kid!r}")
+            if entry[0] != algorithm:
+                raise jwt.InvalidAlgorithmError(f"Key {kid!r} does not sign {algorithm!r}")
+            key = entry[1]
+        else:
+            key = self.keys.by_algorithm.get(algorithm)
+            if key is None:
+                raise jwt.InvalidAlgorithmError(f"Algorithm {algorithm!r} is not accepted")
+        return jwt.decode(token, key, algorithms=[algorithm], audience=self.audience)
+
+
+@lru_cache(maxsize=None)
+def get_key_cache() -> KeyCache:
+    """Process-wide key cache for the configured keys
+
+    Includes the ``SECRET_*_KEY_PATH`` pair, any ``JWT_VERIFY_KEY_PATHS`` and,
+    when ``JWT_KEY_DIR`` is set, every key in that directory. Signing is limited
+    to the key at ``EDGE_JWT_PUBLIC_KEY_PATH`` when that is set.
+    """
+    key_dir = os.getenv("JWT_KEY_DIR")
+    has_static_pair = bool(os.getenv("SECRET_PUBLIC_KEY_PATH") or os.getenv("JWT_PUBLIC_KEY_PATH"))
+    return KeyCache(
+        static_keys=[load_public_key(path) for path in _env_list("JWT_VERIFY_KEY_PATHS")],
+        signing_keys=get_signing_keys() if has_static_pair or not key_dir else None,
+        key_dir=key_dir,
+        activation_delay=float(os.getenv("JWT_KEY_ACTIVATION_DELAY", 60)),
+        edge_key_path=os.getenv("EDGE_JWT_PUBLIC_KEY_PATH"),
+        edge_algorithm=os.getenv("EDGE_JWT_ALG", "RS256"),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_token_verifier() -> TokenVerifier:
+    """Verifier backed by the process-wide key cache"""
+    return TokenVerifier(get_key_cache(), audience=_env_list("JWT_AUDIENCE") or DEFAULT_AUDIENCE)
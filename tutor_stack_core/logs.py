@@ -0,0 +1,149 @@
+"""Structured JSON logging that never blocks the event loop
+
+Records are put on a bounded in-memory queue by the calling thread and
+formatted and written by a ``QueueListener`` on a background thread. When
+the queue is full (stdout is slow or blocked), records are dropped and
+counted instead of stalling request handling. Each record carries the
+request ID of the request that produced it, and access logs can be sampled.
+"""
+
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+import orjson
+
+ACCESS_LOGGER = "tutor_stack.access"
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed through ``extra=``
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with ``extra=`` fields as top-level keys"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return orjson.dumps(entry, default=str).decode()
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the current request's ID, in the thread that logged them"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of routine records; warnings and errors always pass"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """``QueueHandler`` over a bounded queue that drops and counts instead of blocking"""
+
+    def __init__(self, maxsize: int = 10_000):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message and traceback now, while args are still valid, but leave
+        # JSON formatting to the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class LogPipeline:
+    """The installed queue handler and its background writer"""
+
+    def __init__(self, handler: DroppingQueueHandler, listener: logging.handlers.QueueListener):
+        self.handler = handler
+        self.listener = listener
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.handler.queue.qsize(),
+            "capacity": self.handler.queue.maxsize,
+            "dropped": self.handler.dropped,
+        }
+
+    def stop(self) -> None:
+        """Flush what is queued and stop the writer thread"""
+        logging.getLogger().removeHandler(self.handler)
+        self.listener.stop()
+
+
+def configure_logging(
+    level: str = "INFO",
+    access_sample_rate: float = 1.0,
+    queue_size: int = 10_000,
+    stream=None,
+) -> LogPipeline:
+    """Route the root logger through a bounded queue to a JSON writer thread"""
+    writer = logging.StreamHandler(stream or sys.stdout)
+    writer.setFormatter(JSONFormatter())
+
+    handler = DroppingQueueHandler(queue_size)
+    handler.addFilter(RequestIdFilter())
+    listener = logging.handlers.QueueListener(handler.queue, writer, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    access = logging.getLogger(ACCESS_LOGGER)
+    for existing in list(access.filters):
+        access.removeFilter(existing)
+    if access_sample_rate < 1.0:
+        access.addFilter(SamplingFilter(access_sample_rate))
+
+    # uvicorn configures its own stream handlers; send its records through the queue instead
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logger = logging.getLogger(name)
+        logger.handlers.clear()
+        logger.propagate = True
+
+    listener.start()
+    return LogPipeline(handler, listener)
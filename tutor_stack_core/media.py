@@ -0,0 +1,326 @@
+"""Streaming storage and Range serving for lesson attachments (videos, PDFs)
+
+Uploads are never held in memory: the request body is written to a temp
+file under ``<root>/incoming`` as it arrives, hashed with SHA-256 on the
+way, and cut off with ``413`` as soon as it passes ``max_bytes``. The
+finished file is linked to ``<root>/objects/<ab>/<digest>``, so the store
+is content-addressed: a second upload of the same bytes finds the object
+already there, drops its temp file and gets the same ID back. Only an
+explicit list of media types that browsers cannot run script from is
+accepted (no SVG, HTML or XML), and each uploader's stored bytes are capped
+by ``quota_bytes``. Usage is tracked per store instance (per worker), from
+the objects on disk at startup plus what the instance stored since.
+
+Downloads go through ``FileResponse``, which answers ``Range`` requests
+(``206``, multipart for several ranges) and honours ``If-Range``. The ETag
+is the digest itself, so it is strong and identical on every worker, and
+objects can be cached as immutable. Every download is sent with
+``nosniff``, and anything other than video, audio or PDF as an attachment,
+so an object is never rendered as a page of the gateway's origin.
+Whole-file responses are handed to the server with the ASGI path-send
+extension where the server supports it, so the file is sent without
+copying it through Python; otherwise, and for ranges, the file is read in
+1 MiB chunks.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+from dataclasses import dataclass
+from email.utils import formatdate
+from typing import AsyncIterator, Callable, Dict, Optional, Sequence, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse
+from starlette.responses import FileResponse, Response
+
+from tutor_stack_core.static import IMMUTABLE
+
+logger = logging.getLogger(__name__)
+
+DIGEST = re.compile(r"[0-9a-f]{64}")
+DEFAULT_TYPES = (
+    "video/mp4",
+    "video/webm",
+    "video/ogg",
+    "video/quicktime",
+    "audio/mpeg",
+    "audio/mp4",
+    "audio/ogg",
+    "audio/wav",
+    "audio/webm",
+    "image/png",
+    "image/jpeg",
+    "image/gif",
+    "image/webp",
+    "application/pdf",
+)
+# Played or shown in place by the browser; every other type is served as a download
+INLINE_TYPES = ("video/", "audio/", "application/pdf")
+
+# Chunks are gathered to this size before each write, to keep thread hand-offs few
+WRITE_BUFFER = 1024 * 1024
+
+
+class MediaTooLarge(Exception):
+    """The upload passed the store's ``max_bytes``"""
+
+
+class MediaQuotaExceeded(MediaTooLarge):
+    """The upload would take its owner past ``quota_bytes``"""
+
+
+@dataclass
+class MediaObject:
+    digest: str
+    path: str
+    size: int
+    media_type: str
+
+
+class MediaStore:
+    """Content-addressed attachment files under ``root``"""
+
+    def __init__(
+        self,
+        root: str,
+        max_bytes: int = 2 * 1024 * 1024 * 1024,
+        allowed_types: Sequence[str] = DEFAULT_TYPES,
+        quota_bytes: Optional[int] = None,
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.allowed_types = frozenset(allowed_types)
+        self.quota_bytes = quota_bytes
+        self.incoming = os.path.join(root, "incoming")
+        self.objects = os.path.join(root, "objects")
+        os.makedirs(self.incoming, exist_ok=True)
+        os.makedirs(self.objects, exist_ok=True)
+        self.stats = {"uploads": 0, "deduplicated": 0, "rejected": 0, "bytes_stored": 0}
+        # owner -> bytes of the objects they created, plus bytes of their uploads in flight
+        self.usage: Dict[str, int] = self._load_usage()
+        self._inflight: Dict[str, int] = {}
+
+    def allows(self, media_type: str) -> bool:
+        return media_type in self.allowed_types
+
+    def _load_usage(self) -> Dict[str, int]:
+        usage: Dict[str, int] = {}
+        for directory, _, names in os.walk(self.objects):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                with open(os.path.join(directory, name)) as meta:
+                    info = json.load(meta)
+                if info.get("owner") is not None:
+                    usage[info["owner"]] = usage.get(info["owner"], 0) + info["size"]
+        return usage
+
+    def remaining(self, owner: Optional[str]) -> int:
+        """Bytes ``owner`` may still upload, counting their uploads in flight"""
+        if owner is None or self.quota_bytes is None:
+            return self.max_bytes
+        used = self.usage.get(owner, 0) + self._inflight.get(owner, 0)
+        return min(self.max_bytes, self.quota_bytes - used)
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.objects, digest[:2], digest)
+
+    async def save(
+        self, chunks: AsyncIterator[bytes], media_type: str, owner: Optional[str] = None
+    ) -> Tuple[MediaObject, bool]:
+        """Store a stream; returns the object and whether it was new (False for a duplicate)
+
+        The upload counts against ``owner``'s quota while it streams, since
+        whether it duplicates an existing object is only known at the end.
+        """
+        if self.remaining(owner) <= 0:
+            raise MediaQuotaExceeded(f"Upload quota of {self.quota_bytes} bytes used up")
+        fd, temp_path = tempfile.mkstemp(dir=self.incoming, suffix=".part")
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as temp:
+                pending = bytearray()
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if owner is not None:
+                        self._inflight[owner] = self._inflight.get(owner, 0) + len(chunk)
+                    if size > self.max_bytes:
+                        raise MediaTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+                    if self.remaining(owner) < 0:
+                        raise MediaQuotaExceeded(
+                            f"Upload would exceed the quota of {self.quota_bytes} bytes"
+                        )
+                    pending += chunk
+                    if len(pending) >= WRITE_BUFFER:
+                        # hashlib releases the GIL for large buffers, so both happen off the loop
+                        await asyncio.to_thread(_write, temp, hasher, bytes(pending))
+                        pending.clear()
+                if pending:
+                    await asyncio.to_thread(_write, temp, hasher, bytes(pending))
+            digest = hasher.hexdigest()
+            created = await asyncio.to_thread(
+                self._commit, temp_path, digest, media_type, size, owner
+            )
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        finally:
+            if owner is not None:
+                self._inflight[owner] -= size
+                if not self._inflight[owner]:
+                    del self._inflight[owner]
+
+        self.stats["uploads"] += 1
+        if created:
+            self.stats["bytes_stored"] += size
+            if owner is not None:
+                self.usage[owner] = self.usage.get(owner, 0) + size
+        else:
+            self.stats["deduplicated"] += 1
+        # A duplicate can finish before the creator has written the metadata
+        stored = self.get(digest) or MediaObject(digest, self.object_path(digest), size, media_type)
+        return stored, created
+
+    def _commit(
+        self, temp_path: str, digest: str, media_type: str, size: int, owner: Optional[str]
+    ) -> bool:
+        """Move the upload into place; False when the object already existed
+
+        ``os.link`` fails if the name is taken, so of several identical
+        uploads (in any worker) exactly one creates the object.
+        """
+        path = self.object_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.link(temp_path, path)
+            created = True
+        except FileExistsError:
+            created = False
+        finally:
+            os.unlink(temp_path)
+        # Also written by a duplicate, in case the creator died before writing it
+        _link_new(
+            path + ".json",
+            json.dumps({"media_type": media_type, "size": size, "owner": owner}),
+            suffix=os.path.basename(temp_path),
+        )
+        return created
+
+    def get(self, digest: str) -> Optional[MediaObject]:
+        if not DIGEST.fullmatch(digest):
+            return None
+        path = self.object_path(digest)
+        try:
+            with open(path + ".json") as meta:
+                info = json.load(meta)
+        except FileNotFoundError:
+            return None
+        return MediaObject(digest, path, info["size"], info["media_type"])
+
+
+def _write(temp, hasher, data: bytes) -> None:
+    hasher.update(data)
+    temp.write(data)
+
+
+def _link_new(path: str, content: str, suffix: str) -> None:
+    """Create ``path`` with ``content`` unless it exists, never exposing a partial file"""
+    if os.path.exists(path):
+        return
+    part = f"{path}.{suffix}"
+    with open(part, "w") as f:
+        f.write(content)
+    try:
+        os.link(part, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(part)
+
+
+class MediaFileResponse(FileResponse):
+    """``FileResponse`` with the digest as its ETag, sent in 1 MiB chunks"""
+
+    chunk_size = 1024 * 1024
+
+    def __init__(self, media: MediaObject, stat_result: os.stat_result):
+        headers = {
+            "etag": f'"{media.digest}"',
+            "cache-control": IMMUTABLE,
+            "x-content-type-options": "nosniff",
+        }
+        if not media.media_type.startswith(INLINE_TYPES):
+            headers["content-disposition"] = "attachment"
+        super().__init__(
+            media.path, media_type=media.media_type, stat_result=stat_result, headers=headers
+        )
+
+    def set_stat_headers(self, stat_result: os.stat_result) -> None:
+        self.headers.setdefault("content-length", str(stat_result.st_size))
+        self.headers.setdefault("last-modified", formatdate(stat_result.st_mtime, usegmt=True))
+
+
+def create_media_router(
+    store: MediaStore, uploader: Callable, reader: Optional[Callable] = None
+) -> APIRouter:
+    """Router with ``POST /media`` (streamed upload) and ``GET /media/{digest}``
+
+    ``uploader`` and ``reader`` are the user dependencies guarding each side;
+    with no ``reader``, anyone holding an object's digest can download it.
+    Uploads count against the uploader's ``id`` in the store's quota.
+    """
+    router = APIRouter()
+    reader_dependencies = [Depends(reader)] if reader is not None else []
+
+    @router.post("/media", status_code=201)
+    async def upload_media(request: Request, user=Depends(uploader)):
+        """Store the raw request body; identical content is stored once"""
+        media_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        if not store.allows(media_type):
+            store.stats["rejected"] += 1
+            raise HTTPException(status_code=415, detail=f"Unsupported media type {media_type!r}")
+        length = request.headers.get("content-length", "")
+        owner = str(getattr(user, "id", user))
+        try:
+            # Refuse a declared oversize body before reading any of it
+            if length.isdigit() and int(length) > store.max_bytes:
+                raise MediaTooLarge(f"Upload exceeds {store.max_bytes} bytes")
+            if length.isdigit() and int(length) > store.remaining(owner):
+                raise MediaQuotaExceeded(
+                    f"Upload would exceed the quota of {store.quota_bytes} bytes"
+                )
+            media, created = await store.save(request.stream(), media_type, owner=owner)
+        except MediaTooLarge as exc:
+            store.stats["rejected"] += 1
+            raise HTTPException(status_code=413, detail=str(exc))
+        body = {
+            "id": media.digest,
+            "size": media.size,
+            "media_type": media.media_type,
+            "url": str(request.url_for("download_media", digest=media.digest).path),
+            "deduplicated": not created,
+        }
+        return JSONResponse(body, status_code=201 if created else 200)
+
+    @router.api_route(
+        "/media/{digest}", methods=["GET", "HEAD"], dependencies=reader_dependencies
+    )
+    async def download_media(digest: str, request: Request):
+        """Serve an object, honouring Range, If-Range and If-None-Match"""
+        media = store.get(digest)
+        if media is None:
+            raise HTTPException(status_code=404, detail="Unknown media")
+        if f'"{digest}"' in request.headers.get("if-none-match", ""):
+            return Response(
+                status_code=304, headers={"etag": f'"{digest}"', "cache-control": IMMUTABLE}
+            )
+        return MediaFileResponse(media, await asyncio.to_thread(os.stat, media.path))
+
+    return router
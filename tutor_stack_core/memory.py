@@ -0,0 +1,216 @@
+"""Opt-in memory instrumentation: per-prefix allocation deltas and growth reports
+
+With tracemalloc running, a sampled fraction of requests records how much
+traced memory the worker holds after the response compared to before it,
+attributed to the request's mount prefix. Concurrent requests overlap, so a
+single delta is noisy; averaged over many samples, a prefix that leaks
+stands out. Separately, periodic snapshots are diffed against the previous
+one and against the first, giving the allocation sites that keep growing.
+
+tracemalloc itself adds a fixed cost to every allocation while it runs, so
+the whole mode is off unless enabled; the sampling rate bounds the
+per-request bookkeeping on top of that. ``process_stats`` (RSS and GC
+counters) is cheap and always available.
+"""
+
+import asyncio
+import gc
+import logging
+import random
+import resource
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+
+logger = logging.getLogger(__name__)
+
+_IGNORED = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def _kib(size: int) -> float:
+    return round(size / 1024, 1)
+
+
+def process_stats() -> Dict[str, Any]:
+    """Resident set size and garbage collector counters for this worker"""
+    stats: Dict[str, Any] = {}
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    name, value = line.split(":", 1)
+                    key = "rss_kib" if name == "VmRSS" else "peak_rss_kib"
+                    stats[key] = int(value.split()[0])
+    except OSError:
+        # No procfs (macOS); ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        stats["peak_rss_kib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+    stats["gc"] = {
+        "enabled": gc.isenabled(),
+        "counts": gc.get_count(),
+        "thresholds": gc.get_threshold(),
+        "generations": gc.get_stats(),
+        "garbage": len(gc.garbage),
+    }
+    return stats
+
+
+@dataclass
+class PrefixAllocations:
+    samples: int = 0
+    total_delta: int = 0
+    max_delta: int = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "samples": self.samples,
+            "mean_delta_kib": _kib(self.total_delta // self.samples) if self.samples else 0,
+            "max_delta_kib": _kib(self.max_delta),
+            "total_delta_kib": _kib(self.total_delta),
+        }
+
+
+class MemoryTracker:
+    """Owns tracemalloc for the worker and keeps the per-prefix and growth reports"""
+
+    def __init__(self, sample_rate: float = 0.01, frames: int = 1, top: int = 15):
+        self.sample_rate = sample_rate
+        self.frames = frames
+        self.top = top
+        self.prefixes: Dict[str, PrefixAllocations] = {}
+        self.growth: Dict[str, Any] = {}
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._previous: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self._baseline = self._previous = self._take()
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self._baseline = self._previous = None
+
+    def record(self, prefix: str, delta: int) -> None:
+        allocations = self.prefixes.get(prefix)
+        if allocations is None:
+            allocations = self.prefixes[prefix] = PrefixAllocations()
+        allocations.samples += 1
+        allocations.total_delta += delta
+        allocations.max_delta = max(allocations.max_delta, delta)
+
+    def diff(self) -> Dict[str, Any]:
+        """Snapshot now and report the top growing sites since the last and first snapshot"""
+        if not self.tracing or self._baseline is None:
+            raise RuntimeError("Memory tracing is not running")
+        snapshot = self._take()
+        # With deeper traces, group by the whole call path rather than just the allocating line
+        key_type = "traceback" if self.frames > 1 else "lineno"
+        self.growth = {
+            "since_last": self._top(snapshot.compare_to(self._previous, key_type)),
+            "since_start": self._top(snapshot.compare_to(self._baseline, key_type)),
+        }
+        self._previous = snapshot
+        return self.growth
+
+    async def run_snapshots(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # Snapshotting walks every traced block, far too long to hold the loop for
+                await asyncio.to_thread(self.diff)
+            except Exception:
+                logger.exception("Memory snapshot failed")
+
+    def report(self) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": self.tracing,
+            "sample_rate": self.sample_rate,
+            "traced_kib": _kib(current),
+            "traced_peak_kib": _kib(peak),
+            "prefixes": {prefix: a.snapshot() for prefix, a in sorted(self.prefixes.items())},
+            "growth": self.growth,
+        }
+
+    def _take(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(_IGNORED)
+
+    def _top(self, stats: List[tracemalloc.StatisticDiff]) -> List[Dict[str, Any]]:
+        return [
+            {
+                # Frames run oldest to most recent; lead with the allocating line
+                "site": " <- ".join(
+                    f"{frame.filename}:{frame.lineno}" for frame in reversed(stat.traceback)
+                ),
+                "size_diff_kib": _kib(stat.size_diff),
+                "count_diff": stat.count_diff,
+                "size_kib": _kib(stat.size),
+            }
+            for stat in stats[: self.top]
+            if stat.size_diff > 0
+        ]
+
+
+class MemoryMiddleware:
+    """ASGI middleware recording sampled allocation deltas per path prefix"""
+
+    def __init__(self, app, tracker: MemoryTracker, prefixes: Iterable[str]):
+        self.app = app
+        self.tracker = tracker
+        # Longest prefix first so nested mounts win over their parents
+        self.prefixes = sorted(prefixes, key=len, reverse=True)
+
+    def _prefix_for(self, path: str) -> str:
+        for prefix in self.prefixes:
+            if path == prefix or path.startswith(prefix + "/"):
+                return prefix
+        return "other"
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or random.random() >= self.tracker.sample_rate
+            or not tracemalloc.is_tracing()
+        ):
+            return await self.app(scope, receive, send)
+        before = tracemalloc.get_traced_memory()[0]
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            delta = tracemalloc.get_traced_memory()[0] - before
+            self.tracker.record(self._prefix_for(scope["path"]), delta)
+
+
+def create_memory_router(
+    current_superuser: Callable, tracker: Optional[MemoryTracker] = None
+) -> APIRouter:
+    """Router for superusers to inspect this worker's memory"""
+    router = APIRouter()
+
+    @router.get("/memory")
+    async def memory_stats(user=Depends(current_superuser)):
+        """RSS and GC counters, plus allocation reports when instrumentation is on"""
+        stats = {"process": process_stats()}
+        if tracker is not None:
+            stats.update(tracker.report())
+        return stats
+
+    @router.post("/memory/snapshot")
+    async def memory_snapshot(user=Depends(current_superuser)):
+        """Take a tracemalloc snapshot now and return the top growing allocation sites"""
+        if tracker is None or not tracker.tracing:
+            raise HTTPException(status_code=409, detail="Memory instrumentation is off")
+        return await asyncio.to_thread(tracker.diff)
+
+    return router
@@ -0,0 +1,133 @@
+"""OpenAPI schema built once, serialized once and served from memory
+
+FastAPI generates ``/openapi.json`` on the first request to each worker by
+walking every route, then re-serializes the (large) dict on every request.
+``serve_cached_openapi`` replaces that route with one that returns
+pre-serialized bytes, a strong ETag and precompressed variants. The schema
+can also be generated ahead of time, e.g. while building the image::
+
+    python -m tutor_stack_core.openapi main:app /app/openapi.json
+
+and loaded from that file at startup, so workers never generate it at all.
+"""
+
+import gzip
+import hashlib
+import importlib
+import os
+import sys
+from typing import Dict, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+from tutor_stack_core.responses import dumps, negotiate_encoding
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+# Most compact first, so the best encoding the client accepts wins
+ENCODINGS = ("br", "gzip")
+
+
+class OpenAPIDocument:
+    """A serialized schema with its ETag and compressed variants"""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.variants: Dict[str, bytes] = {"identity": body}
+        self.variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body, quality=11)
+        # Each encoding is a different representation, so each gets its own strong ETag
+        self.etags = {
+            encoding: f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+            for encoding in self.variants
+        }
+
+    @classmethod
+    def from_schema(cls, schema: dict) -> "OpenAPIDocument":
+        return cls(dumps(schema))
+
+    @classmethod
+    def from_file(cls, path: str) -> "OpenAPIDocument":
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+    def write(self, path: str) -> None:
+        with open(path, "wb") as f:
+            f.write(self.body)
+
+    def negotiate(self, accept_encoding: str) -> str:
+        """Pick the most compact variant the client accepts"""
+        return negotiate_encoding(accept_encoding, self.variants, ENCODINGS)
+
+    def response(self, request: Request, max_age: int = 300) -> Response:
+        encoding = self.negotiate(request.headers.get("accept-encoding", ""))
+        headers = {
+            "ETag": self.etags[encoding],
+            "Cache-Control": f"public, max-age={max_age}",
+            "Vary": "Accept-Encoding",
+        }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if_none_match = request.headers.get("if-none-match", "")
+        if if_none_match.strip() == "*" or self.etags[encoding] in _etag_list(if_none_match):
+            return Response(status_code=304, headers=headers)
+        return Response(self.variants[encoding], media_type="application/json", headers=headers)
+
+
+def _etag_list(header: str):
+    # Weak comparison, as If-None-Match requires (RFC 9110 13.1.2)
+    return {tag.strip().removeprefix("W/") for tag in header.split(",")}
+
+
+class OpenAPICache:
+    """Builds the schema document on first use, from a file when one is given"""
+
+    def __init__(self, app, path: Optional[str] = None, max_age: int = 300):
+        self.app = app
+        self.path = path
+        self.max_age = max_age
+        self._document: Optional[OpenAPIDocument] = None
+
+    def document(self) -> OpenAPIDocument:
+        if self._document is None:
+            if self.path and os.path.exists(self.path):
+                self._document = OpenAPIDocument.from_file(self.path)
+            else:
+                self._document = OpenAPIDocument.from_schema(self.app.openapi())
+        return self._document
+
+    async def endpoint(self, request: Request) -> Response:
+        return self.document().response(request, self.max_age)
+
+
+def serve_cached_openapi(app, path: Optional[str] = None, max_age: int = 300) -> OpenAPICache:
+    """Replace ``app``'s OpenAPI route with the cached one; call after all routes are added"""
+    cache = OpenAPICache(app, path, max_age)
+    app.router.routes[:] = [
+        route
+        for route in app.router.routes
+        if not (isinstance(route, Route) and route.path == app.openapi_url)
+    ]
+    app.add_route(app.openapi_url, cache.endpoint, include_in_schema=False)
+    return cache
+
+
+def build(target: str, path: str) -> None:
+    """Generate the schema of ``module:attribute`` and write it to ``path``"""
+    module_name, _, attribute = target.partition(":")
+    app = getattr(importlib.import_module(module_name), attribute or "app")
+    OpenAPIDocument.from_schema(app.openapi()).write(path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python -m tutor_stack_core.openapi <module:app> <output.json>")
+    sys.path.insert(0, os.getcwd())
+    build(sys.argv[1], sys.argv[2])
@@ -0,0 +1,259 @@
+"""On-demand sampling profiler for a live worker
+
+Nothing runs until a profile is requested: a background thread then samples
+the event loop thread's stack every few milliseconds for the requested
+duration (``sys._current_frames``, no tracing hooks, so the code being
+profiled runs at full speed), while a probe task measures event-loop lag.
+Optionally, asyncio debug mode is switched on for the same window to report
+callbacks that blocked the loop longer than a threshold; it has a cost of its
+own, so pass a threshold of 0 to skip it.
+Stacks are aggregated and returned as collapsed stacks (for flamegraph.pl or
+speedscope) or as a speedscope JSON document.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+
+MAX_SECONDS = 60.0
+MAX_STACK_DEPTH = 128
+
+_SLOW_CALLBACK = re.compile(r"Executing (?P<callback>.*) took (?P<seconds>[\d.]+) seconds")
+
+Frame = Tuple[str, str, int]  # (function, file, first line)
+
+
+@dataclass
+class LoopLag:
+    """How late the loop woke a task that asked to sleep for ``interval``"""
+
+    interval_ms: float
+    samples: List[float] = field(default_factory=list)
+
+    def summary(self) -> Dict[str, float]:
+        if not self.samples:
+            return {"samples": 0}
+        ordered = sorted(self.samples)
+        return {
+            "samples": len(ordered),
+            "mean_ms": round(sum(ordered) / len(ordered), 3),
+            "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+            "max_ms": round(ordered[-1], 3),
+        }
+
+
+@dataclass
+class Profile:
+    duration: float
+    interval: float
+    stacks: Counter
+    lag: LoopLag
+    slow_callbacks: List[Dict[str, Any]]
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def collapsed(self) -> str:
+        """One ``root;caller;leaf count`` line per distinct stack, most frequent first"""
+        lines = [
+            ";".join(_label(frame) for frame in stack) + f" {count}"
+            for stack, count in self.stacks.most_common()
+        ]
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str = "gateway") -> Dict[str, Any]:
+        frames: List[Dict[str, Any]] = []
+        index: Dict[Frame, int] = {}
+        samples, weights = [], []
+        for stack, count in self.stacks.items():
+            ids = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                ids.append(index[frame])
+            samples.append(ids)
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": self.duration,
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+            "name": name,
+            "exporter": "tutor_stack_core.profiling",
+        }
+
+    def summary(self, top: int = 10) -> Dict[str, Any]:
+        return {
+            "duration_s": round(self.duration, 3),
+            "samples": self.samples,
+            "distinct_stacks": len(self.stacks),
+            "top_stacks": [
+                {"samples": count, "leaf": [_label(frame) for frame in stack[-5:]]}
+                for stack, count in self.stacks.most_common(top)
+            ],
+            "loop_lag": self.lag.summary(),
+            "slow_callbacks": self.slow_callbacks,
+        }
+
+
+def _label(frame: Frame) -> str:
+    function, filename, line = frame
+    return f"{function} ({os.path.basename(filename)}:{line})"
+
+
+def _walk(frame, limit: int = MAX_STACK_DEPTH) -> Tuple[Frame, ...]:
+    stack = []
+    while frame is not None and len(stack) < limit:
+        code = frame.f_code
+        name = getattr(code, "co_qualname", code.co_name)
+        stack.append((name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+class _SlowCallbackHandler(logging.Handler):
+    """Collects asyncio debug mode's "Executing <callback> took N seconds" warnings"""
+
+    def __init__(self, limit: int = 100):
+        super().__init__(logging.WARNING)
+        self.limit = limit
+        self.callbacks: List[Dict[str, Any]] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        match = _SLOW_CALLBACK.search(record.getMessage())
+        if match and len(self.callbacks) < self.limit:
+            self.callbacks.append(
+                {
+                    "callback": match["callback"][:300],
+                    "duration_ms": round(float(match["seconds"]) * 1000, 1),
+                }
+            )
+
+
+class SamplingProfiler:
+    """Samples the current event loop's thread; one profile at a time per worker"""
+
+    def __init__(self, max_seconds: float = MAX_SECONDS):
+        self.max_seconds = max_seconds
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def profile(
+        self,
+        seconds: float,
+        interval: float = 0.005,
+        slow_callback_threshold: float = 0.1,
+        all_threads: bool = False,
+    ) -> Profile:
+        if self.running:
+            raise RuntimeError("A profile is already running on this worker")
+        seconds = min(seconds, self.max_seconds)
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            target = None if all_threads else threading.get_ident()
+            stacks: Counter = Counter()
+            stop = threading.Event()
+            sampler = threading.Thread(
+                target=_sample, args=(stacks, stop, interval, target), daemon=True
+            )
+            lag = LoopLag(interval * 1000)
+            lag_probe = asyncio.create_task(_measure_lag(lag, interval))
+
+            asyncio_logger = logging.getLogger("asyncio")
+            slow = _SlowCallbackHandler()
+            was_debug, threshold = loop.get_debug(), loop.slow_callback_duration
+            if slow_callback_threshold > 0:
+                asyncio_logger.addHandler(slow)
+                loop.slow_callback_duration = slow_callback_threshold
+                loop.set_debug(True)
+
+            start = time.perf_counter()
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                lag_probe.cancel()
+                loop.set_debug(was_debug)
+                loop.slow_callback_duration = threshold
+                asyncio_logger.removeHandler(slow)
+                await asyncio.to_thread(sampler.join)
+            duration = time.perf_counter() - start
+            return Profile(duration, interval, stacks, lag, slow.callbacks)
+
+
+def _sample(stacks: Counter, stop: threading.Event, interval: float, target: Optional[int]):
+    me = threading.get_ident()
+    while not stop.wait(interval):
+        for ident, frame in sys._current_frames().items():
+            if ident == me or (target is not None and ident != target):
+                continue
+            stacks[_walk(frame)] += 1
+
+
+async def _measure_lag(lag: LoopLag, interval: float) -> None:
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag.samples.append(max(0.0, (time.perf_counter() - start - interval) * 1000))
+
+
+def create_profiling_router(
+    current_superuser: Callable, profiler: Optional[SamplingProfiler] = None
+) -> APIRouter:
+    """Router for superusers to profile the worker that serves the request"""
+    profiler = profiler or SamplingProfiler()
+    router = APIRouter()
+
+    @router.post("/profile")
+    async def run_profile(
+        seconds: float = 10.0,
+        format: str = "summary",
+        interval_ms: float = 5.0,
+        slow_callback_ms: float = 100.0,
+        all_threads: bool = False,
+        user=Depends(current_superuser),
+    ):
+        """Sample this worker for ``seconds``; ``summary``, ``collapsed`` or ``speedscope``"""
+        if format not in ("summary", "collapsed", "speedscope"):
+            raise HTTPException(status_code=400, detail="Unknown format")
+        if not 0 < seconds <= profiler.max_seconds or not 1 <= interval_ms <= 1000:
+            raise HTTPException(status_code=400, detail="seconds or interval_ms out of range")
+        try:
+            profile = await profiler.profile(
+                seconds, interval_ms / 1000, slow_callback_ms / 1000, all_threads
+            )
+        except RuntimeError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        if format == "collapsed":
+            return PlainTextResponse(profile.collapsed())
+        if format == "speedscope":
+            return profile.speedscope(f"worker {os.getpid()}")
+        return {**profile.summary(), "pid": os.getpid()}
+
+    return router
@@ -0,0 +1,160 @@
+"""Reverse proxy for running a service out of process behind the gateway
+
+``ServiceProxy`` is an ASGI app that can be mounted in place of a service's
+in-process app. It forwards each request to the service's own uvicorn
+worker pool, on a Unix socket or a localhost port, over a pooled keep-alive
+``httpx`` client. Request and response bodies are streamed rather than
+buffered.
+"""
+
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+# Headers that describe a single connection and must not be forwarded (RFC 9110 7.6.1)
+HOP_BY_HOP_HEADERS = {
+    b"connection",
+    b"keep-alive",
+    b"proxy-authenticate",
+    b"proxy-authorization",
+    b"te",
+    b"trailer",
+    b"transfer-encoding",
+    b"upgrade",
+}
+
+
+def build_client(
+    url: str,
+    max_connections: int = 100,
+    max_keepalive: int = 20,
+    connect_timeout: float = 2.0,
+    read_timeout: float = 60.0,
+) -> httpx.AsyncClient:
+    """Pooled keep-alive client for ``unix:/path/to.sock`` or ``http://host:port`` upstreams"""
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+    timeout = httpx.Timeout(read_timeout, connect=connect_timeout, pool=connect_timeout)
+    if url.startswith("unix:"):
+        transport = httpx.AsyncHTTPTransport(uds=url[len("unix:"):], limits=limits)
+        return httpx.AsyncClient(transport=transport, base_url="http://service", timeout=timeout)
+    parts = urlsplit(url)
+    return httpx.AsyncClient(
+        base_url=f"{parts.scheme}://{parts.netloc}", limits=limits, timeout=timeout
+    )
+
+
+class ServiceProxy:
+    """ASGI app forwarding HTTP requests to an out-of-process service"""
+
+    def __init__(self, url: str, client: Optional[httpx.AsyncClient] = None, **client_options):
+        self.url = url
+        self.client = client or build_client(url, **client_options)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            # The upstream pool manages its own lifespan
+            message = await receive()
+            while message["type"] != "lifespan.shutdown":
+                await send({"type": message["type"] + ".complete"})
+                message = await receive()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+        if scope["type"] != "http":
+            # WebSocket upgrades are not proxied; clients must connect to the service directly
+            await send({"type": "websocket.close", "code": 1011})
+            return
+
+        request = self.client.build_request(
+            scope["method"],
+            _upstream_path(scope),
+            headers=_forward_headers(scope),
+            content=_request_body(receive) if _has_body(scope) else None,
+        )
+        try:
+            response = await self.client.send(request, stream=True)
+        except httpx.TimeoutException:
+            return await _error(send, 504, b"Upstream service timed out")
+        except httpx.TransportError:
+            return await _error(send, 502, b"Upstream service unavailable")
+
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": response.status_code,
+                    "headers": [
+                        (name, value)
+                        for name, value in response.headers.raw
+                        if name.lower() not in HOP_BY_HOP_HEADERS
+                    ],
+                }
+            )
+            async for chunk in response.aiter_raw():
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await response.aclose()
+
+
+def _upstream_path(scope) -> str:
+    """Path relative to the mount point, plus the query string"""
+    path = scope.get("raw_path") or scope["path"].encode()
+    path = path.decode("latin-1") if isinstance(path, bytes) else path
+    root_path = scope.get("root_path", "")
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):] or "/"
+    query = scope.get("query_string", b"")
+    return f"{path}?{query.decode('latin-1')}" if query else path
+
+
+def _forward_headers(scope):
+    headers = [
+        (name, value) for name, value in scope["headers"] if name.lower() not in HOP_BY_HOP_HEADERS
+    ]
+    client = scope.get("client")
+    if client:
+        headers.append((b"x-forwarded-for", client[0].encode()))
+    headers.append((b"x-forwarded-proto", scope.get("scheme", "http").encode()))
+    headers.append((b"x-forwarded-prefix", scope.get("root_path", "").encode()))
+    return headers
+
+
+def _has_body(scope) -> bool:
+    for name, value in scope["headers"]:
+        name = name.lower()
+        if name == b"content-length":
+            return value != b"0"
+        if name == b"transfer-encoding":
+            return True
+    return False
+
+
+async def _request_body(receive):
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+        more_body = message.get("more_body", False)
+        if message.get("body"):
+            yield message["body"]
+
+
+async def _error(send, status: int, detail: bytes) -> None:
+    body = b'{"detail":"' + detail + b'"}'
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
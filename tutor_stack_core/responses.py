@@ -0,0 +1,64 @@
+"""orjson-backed JSON responses and content negotiation helpers
+
+``FastJSONResponse`` renders with orjson and produces the same bytes as
+Starlette's ``JSONResponse`` (compact separators, UTF-8 rather than ASCII
+escapes), with ``jsonable_encoder`` semantics for anything orjson does not
+handle natively (Pydantic models, ``Decimal``, sets, ...). Use it as an
+app's default response class::
+
+    app = FastAPI(default_response_class=FastJSONResponse)
+
+Routers included into that app inherit it unless they set their own.
+"""
+
+import json
+from typing import Any, Collection
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize like ``JSONResponse`` would after ``jsonable_encoder``, but with orjson"""
+    try:
+        return orjson.dumps(content, default=jsonable_encoder, option=OPTIONS)
+    except orjson.JSONEncodeError:
+        # Integers beyond 64 bits and other edge cases: fall back to the stdlib so the
+        # output, or the error, is exactly what JSONResponse would have produced
+        return json.dumps(
+            jsonable_encoder(content),
+            ensure_ascii=False,
+            allow_nan=False,
+            indent=None,
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """``JSONResponse`` rendered with orjson"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def negotiate_encoding(
+    accept_encoding: str, available: Collection[str], preference=("br", "gzip")
+) -> str:
+    """Pick the first ``preference`` the client accepts and we have, else ``identity``"""
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        params = params.replace(" ", "")
+        try:
+            quality = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            quality = 0.0
+        if quality > 0:
+            accepted.add(coding.strip().lower())
+    for encoding in preference:
+        if encoding in available and (encoding in accepted or "*" in accepted):
+            return encoding
+    return "identity"
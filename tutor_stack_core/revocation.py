@@ -0,0 +1,344 @@
+"""Token and account revocation checked through an in-memory Bloom filter
+
+Revoked token ids (``jti``) and user ids are written to a table in the auth
+database. Every worker keeps a Bloom filter of those entries, refreshed
+incrementally by polling for rows newer than the last one it has seen. A
+negative answer from the filter needs no I/O; only positives are confirmed
+against the table, so the false-positive rate bounds the extra queries.
+
+A revocation made on another worker takes effect here after at most one
+refresh interval. Entries are kept until the tokens they cover have expired
+(a token's ``exp``; for an account, the longest token lifetime) and are then
+purged by ``run_purger``, which also rebuilds the filter without them.
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import (
+    Column,
+    Float,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    delete,
+    insert,
+    select,
+    update,
+)
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+token_revocations = Table(
+    "token_revocations",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("kind", String(8), nullable=False),
+    Column("value", String(64), nullable=False),
+    Column("revoked_at", Float, nullable=False),
+    Column("expires_at", Float, nullable=True),
+    Index("ix_token_revocations_kind_value", "kind", "value"),
+)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings
+
+    Sized from the expected number of entries and the target false-positive
+    rate; positions come from one 128-bit BLAKE2b digest split into two
+    hashes (Kirsch-Mitzenmacher double hashing).
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hash_count)]
+
+    def add(self, item: str) -> None:
+        bits = self.bits
+        for position in self._positions(item):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class RevocationStore:
+    """Revocation entries in the auth database"""
+
+    def __init__(self, session_maker):
+        self.session_maker = session_maker
+
+    async def create_table(self, engine) -> None:
+        async with engine.begin() as conn:
+            await conn.run_sync(metadata.create_all)
+
+    async def add(
+        self, kind: str, value: str, expires_at: Optional[float] = None, deactivate=None
+    ) -> Optional[int]:
+        """Record a revocation and return its row id
+
+        With ``deactivate`` (a user model or table in the same database), the
+        account ``value`` is set inactive in the same transaction; returns
+        None, recording nothing, when there is no such user.
+        """
+        async with self.session_maker() as session:
+            if deactivate is not None:
+                table = getattr(deactivate, "__table__", deactivate)
+                user_id = parse_user_id(table, value)
+                deactivated = None
+                if user_id is not None:
+                    deactivated = await session.execute(
+                        update(table).where(table.c.id == user_id).values(is_active=False)
+                    )
+                if deactivated is None or not deactivated.rowcount:
+                    await session.rollback()
+                    return None
+            result = await session.execute(
+                insert(token_revocations).values(
+                    kind=kind, value=value, revoked_at=time.time(), expires_at=expires_at
+                )
+            )
+            await session.commit()
+            return result.inserted_primary_key[0]
+
+    async def lookup(self, kind: str, value: str) -> Optional[float]:
+        """Latest revocation time for an entry, or None when it is not revoked"""
+        async with self.session_maker() as session:
+            result = await session.execute(
+                select(token_revocations.c.revoked_at)
+                .where(token_revocations.c.kind == kind, token_revocations.c.value == value)
+                .order_by(token_revocations.c.revoked_at.desc())
+                .limit(1)
+            )
+            return result.scalar()
+
+    async def since(self, last_id: int, limit: int = 10000):
+        """Entries with an id greater than ``last_id``, oldest first"""
+        async with self.session_maker() as session:
+            result = await session.execute(
+                select(
+                    token_revocations.c.id, token_revocations.c.kind, token_revocations.c.value
+                )
+                .where(token_revocations.c.id > last_id)
+                .order_by(token_revocations.c.id)
+                .limit(limit)
+            )
+            return result.all()
+
+    async def purge_expired(self, now: Optional[float] = None) -> int:
+        """Drop token revocations whose token has expired anyway"""
+        async with self.session_maker() as session:
+            result = await session.execute(
+                delete(token_revocations).where(
+                    token_revocations.c.expires_at.is_not(None),
+                    token_revocations.c.expires_at < (now or time.time()),
+                )
+            )
+            await session.commit()
+            return result.rowcount
+
+
+def parse_user_id(table, value: str) -> Any:
+    """``value`` as the user table's ID type, or None if it is not a valid ID"""
+    try:
+        python_type = table.c.id.type.python_type
+    except NotImplementedError:
+        return value
+    try:
+        return python_type(value)
+    except ValueError:
+        return None
+
+
+class RevocationChecker:
+    """Per-worker revocation check: Bloom filter first, store only on positives"""
+
+    def __init__(
+        self,
+        store: RevocationStore,
+        capacity: int = 100_000,
+        error_rate: float = 0.001,
+        token_lifetime: Optional[float] = None,
+    ):
+        self.store = store
+        self.token_lifetime = token_lifetime
+        self.error_rate = error_rate
+        self.filter = BloomFilter(capacity, error_rate)
+        self.last_id = 0
+        self.stats: Dict[str, int] = {"checks": 0, "positives": 0, "revoked": 0}
+        # The refresher and the purger both move last_id and swap the filter
+        self._lock = asyncio.Lock()
+        # Filter items revoked by this worker while a rebuild is loading, if one is
+        self._pending: Optional[List[str]] = None
+
+    async def refresh(self) -> int:
+        """Fold new store entries into the filter, returning how many were added"""
+        async with self._lock:
+            if len(self.filter) > self.filter.capacity:
+                # Past capacity the false-positive rate climbs, so rebuild at double the size
+                return await self._rebuild(self.filter.capacity * 2)
+            return await self._load_into(self.filter)
+
+    async def rebuild(self, capacity: int) -> int:
+        """Build a fresh filter from the whole store and swap it in"""
+        async with self._lock:
+            return await self._rebuild(capacity)
+
+    async def _rebuild(self, capacity: int) -> int:
+        fresh = BloomFilter(capacity, self.error_rate)
+        previous_id, self.last_id = self.last_id, 0
+        self._pending = []
+        try:
+            added = await self._load_into(fresh)
+        except Exception:
+            self.last_id = previous_id
+            raise
+        finally:
+            pending, self._pending = self._pending, None
+        # Revocations made here during the load may have been committed after it read past them
+        for item in pending:
+            fresh.add(item)
+        self.filter = fresh
+        return added
+
+    async def _load_into(self, bloom: BloomFilter, batch: int = 10000) -> int:
+        added = 0
+        while True:
+            rows = await self.store.since(self.last_id, limit=batch)
+            for row_id, kind, value in rows:
+                bloom.add(f"{kind}:{value}")
+                self.last_id = row_id
+            added += len(rows)
+            if len(rows) < batch:
+                return added
+
+    async def run_refresher(self, interval: float) -> None:
+        """Refresh every ``interval`` seconds until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                # A database blip must not kill the refresher; the filter just goes stale
+                logger.warning("Revocation refresh failed: %s", e)
+
+    async def run_purger(self, interval: float) -> None:
+        """Every ``interval`` seconds, drop expired entries and rebuild the filter without them"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await self.store.purge_expired():
+                    await self.rebuild(self.filter.capacity)
+            except Exception as e:
+                logger.warning("Revocation purge failed: %s", e)
+
+    async def revoke_token(self, jti: str, expires_at: Optional[float] = None) -> None:
+        await self.store.add("jti", jti, expires_at)
+        self._add_local(f"jti:{jti}")
+
+    async def revoke_user(self, user_id: str, deactivate=None) -> bool:
+        """Invalidate every token issued to a user up to now
+
+        The entry expires with the last of those tokens. With ``deactivate``
+        (the user model), the account is also set inactive in the same
+        transaction; returns False when there is no such user.
+        """
+        expires_at = None
+        if self.token_lifetime is not None:
+            expires_at = time.time() + self.token_lifetime
+        if await self.store.add("user", str(user_id), expires_at, deactivate) is None:
+            return False
+        self._add_local(f"user:{user_id}")
+        return True
+
+    def _add_local(self, item: str) -> None:
+        self.filter.add(item)
+        if self._pending is not None:
+            self._pending.append(item)
+
+    async def is_revoked(self, claims: Dict[str, Any]) -> bool:
+        """Whether verified claims belong to a revoked token or account"""
+        self.stats["checks"] += 1
+        jti = claims.get("jti")
+        if jti and f"jti:{jti}" in self.filter:
+            self.stats["positives"] += 1
+            if await self.store.lookup("jti", jti) is not None:
+                self.stats["revoked"] += 1
+                return True
+        sub = claims.get("sub")
+        if sub and f"user:{sub}" in self.filter:
+            self.stats["positives"] += 1
+            revoked_at = await self.store.lookup("user", str(sub))
+            # iat has whole seconds, so a token from the revocation's own second counts as newer
+            if revoked_at is not None and claims.get("iat", 0) < math.floor(revoked_at):
+                self.stats["revoked"] += 1
+                return True
+        return False
+
+
+def create_revocation_router(
+    revocations: RevocationChecker,
+    current_superuser: Callable,
+    user_model,
+    get_user_db: Optional[Callable] = None,
+) -> APIRouter:
+    """Router for superusers to cut off an account immediately
+
+    The account is deactivated as well: in the revocation's own transaction,
+    or, when users live in other databases (``get_user_db`` given, e.g. with
+    sharding), through the user database right after the revocation.
+    """
+    router = APIRouter()
+
+    async def no_user_db():
+        return None
+
+    @router.post("/users/{user_id}/revoke", status_code=204)
+    async def revoke_user(
+        user_id: str,
+        user=Depends(current_superuser),
+        user_db=Depends(get_user_db or no_user_db),
+    ):
+        """Invalidate every token issued to a user so far and deactivate the account"""
+        if user_db is None:
+            if not await revocations.revoke_user(user_id, deactivate=user_model):
+                raise HTTPException(status_code=404, detail="Unknown user")
+            return
+        parsed = parse_user_id(getattr(user_model, "__table__", user_model), user_id)
+        target = await user_db.get(parsed) if parsed is not None else None
+        if target is None:
+            raise HTTPException(status_code=404, detail="Unknown user")
+        await revocations.revoke_user(user_id)
+        await user_db.update(target, {"is_active": False})
+
+    return router
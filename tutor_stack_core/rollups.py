@@ -0,0 +1,420 @@
+"""Precomputed progress rollups for teacher dashboards
+
+Dashboards read one row per student or per class from materialized tables,
+so a read costs the same in week one and week fifteen of the term. The
+tables are maintained incrementally from ``activity_events``: each refresh
+aggregates only the events past a stored watermark (the last event id
+folded in) and adds them to the per-student rows, then recomputes the rows
+of the classes those students are in from the per-student ones, which
+scales with class sizes rather than history. Assessment scores are kept as
+a count and a sum, so averages fold in the same way. A periodic full rebuild, also used whenever the
+watermark looks inconsistent, recomputes everything from the raw events and
+repairs anything an incremental pass missed (such as events that concurrent
+writers committed out of id order).
+
+Advancing the watermark is a compare-and-set at the start of the refresh
+transaction, so when several workers refresh at once only one of them
+folds a given range of events in.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import APIRouter, Body, Depends, HTTPException
+from sqlalchemy import (
+    Column,
+    Float,
+    Index,
+    Integer,
+    String,
+    Table,
+    case,
+    delete,
+    func,
+    insert,
+    select,
+    update,
+)
+from sqlalchemy.exc import IntegrityError
+
+from tutor_stack_core.activity import activity_events, metadata
+
+logger = logging.getLogger(__name__)
+
+# Event kind -> per-student counter column
+COUNTERS = {
+    "content.view": "content_views",
+    "chat.turn": "chat_turns",
+    "assessment.submit": "assessment_submissions",
+}
+
+student_progress = Table(
+    "student_progress",
+    metadata,
+    Column("user_id", String(64), primary_key=True),
+    Column("content_views", Integer, nullable=False, default=0),
+    Column("chat_turns", Integer, nullable=False, default=0),
+    Column("assessment_submissions", Integer, nullable=False, default=0),
+    Column("failed_requests", Integer, nullable=False, default=0),
+    Column("active_ms", Float, nullable=False, default=0.0),
+    Column("scored_submissions", Integer, nullable=False, default=0),
+    Column("score_total", Float, nullable=False, default=0.0),
+    Column("first_seen", Float, nullable=False),
+    Column("last_seen", Float, nullable=False),
+)
+
+class_members = Table(
+    "class_members",
+    metadata,
+    Column("class_id", String(64), primary_key=True),
+    Column("user_id", String(64), primary_key=True),
+    Index("ix_class_members_user_id", "user_id"),
+)
+
+class_progress = Table(
+    "class_progress",
+    metadata,
+    Column("class_id", String(64), primary_key=True),
+    Column("students", Integer, nullable=False),
+    Column("content_views", Integer, nullable=False),
+    Column("chat_turns", Integer, nullable=False),
+    Column("assessment_submissions", Integer, nullable=False),
+    Column("active_ms", Float, nullable=False),
+    Column("scored_submissions", Integer, nullable=False),
+    Column("score_total", Float, nullable=False),
+    Column("last_seen", Float, nullable=True),
+)
+
+rollup_state = Table(
+    "rollup_state",
+    metadata,
+    Column("name", String(32), primary_key=True),
+    Column("watermark", Integer, nullable=False),
+    Column("refreshed_at", Float, nullable=False),
+    Column("rebuilt_at", Float, nullable=False),
+)
+
+_SUMMED = (
+    "content_views",
+    "chat_turns",
+    "assessment_submissions",
+    "failed_requests",
+    "active_ms",
+    "scored_submissions",
+    "score_total",
+)
+
+
+def _with_average(row) -> Dict[str, Any]:
+    """A rollup row as a dict, plus the ``average_score`` of its scored submissions"""
+    result = dict(row)
+    scored = result["scored_submissions"]
+    result["average_score"] = result["score_total"] / scored if scored else None
+    return result
+
+
+class RollupEngine:
+    """Maintains and serves the ``student_progress`` and ``class_progress`` tables"""
+
+    def __init__(self, session_maker, name: str = "progress", batch_size: int = 500):
+        self.session_maker = session_maker
+        self.name = name
+        self.batch_size = batch_size
+        self.stats = {"refreshes": 0, "rebuilds": 0, "events_folded": 0, "conflicts": 0}
+
+    async def create_tables(self, engine) -> None:
+        async with engine.begin() as conn:
+            await conn.run_sync(metadata.create_all)
+
+    async def refresh(self, rebuild: bool = False) -> int:
+        """Fold new events into the rollups; returns how many events were folded in"""
+        async with self.session_maker() as session:
+            state = (
+                await session.execute(select(rollup_state).where(rollup_state.c.name == self.name))
+            ).first()
+            newest = await session.scalar(select(func.max(activity_events.c.id))) or 0
+            watermark = state.watermark if state is not None else 0
+            if newest < watermark:
+                # Events were truncated or restored from a backup: the rollups no longer match
+                logger.warning("Rollup watermark %d is past the newest event %d", watermark, newest)
+                rebuild = True
+            start = 0 if rebuild else watermark
+            now = time.time()
+
+            if state is None:
+                try:
+                    await session.execute(
+                        insert(rollup_state).values(
+                            name=self.name, watermark=newest, refreshed_at=now, rebuilt_at=now
+                        )
+                    )
+                except IntegrityError:
+                    # Another worker created the state row, and builds the rollups, first
+                    await session.rollback()
+                    self.stats["conflicts"] += 1
+                    return 0
+                rebuild = True
+                start = 0
+            else:
+                values = {"watermark": newest, "refreshed_at": now}
+                if rebuild:
+                    values["rebuilt_at"] = now
+                claimed = await session.execute(
+                    update(rollup_state)
+                    .where(rollup_state.c.name == self.name)
+                    .where(rollup_state.c.watermark == state.watermark)
+                    .values(**values)
+                )
+                if claimed.rowcount != 1:
+                    # Another worker refreshed this range first
+                    await session.rollback()
+                    self.stats["conflicts"] += 1
+                    return 0
+
+            if rebuild:
+                await session.execute(delete(student_progress))
+            folded, students = await self._fold_events(session, start, newest)
+            if rebuild:
+                await self._refresh_classes(session)
+            else:
+                await self._refresh_classes(session, await self._classes_of(session, students))
+            await session.commit()
+
+        self.stats["refreshes"] += 1
+        self.stats["rebuilds"] += int(rebuild)
+        self.stats["events_folded"] += folded
+        return folded
+
+    async def _fold_events(self, session, after: int, through: int) -> Tuple[int, Set[str]]:
+        """Add the events in ``(after, through]`` to the student rows
+
+        Returns how many events were folded in and the students they touched.
+        """
+        if through <= after:
+            return 0, set()
+        events = activity_events.c
+        columns = [
+            events.user_id,
+            func.min(events.ts).label("first_seen"),
+            func.max(events.ts).label("last_seen"),
+            func.coalesce(func.sum(events.duration_ms), 0.0).label("active_ms"),
+            func.sum(case((events.status >= 400, 1), else_=0)).label("failed_requests"),
+            func.count(events.score).label("scored_submissions"),
+            func.coalesce(func.sum(events.score), 0.0).label("score_total"),
+            func.count().label("events"),
+        ]
+        for kind, column in COUNTERS.items():
+            columns.append(func.sum(case((events.kind == kind, 1), else_=0)).label(column))
+        rows = (
+            await session.execute(
+                select(*columns)
+                .where(events.id > after, events.id <= through)
+                .group_by(events.user_id)
+            )
+        ).mappings().all()
+
+        folded = 0
+        for offset in range(0, len(rows), self.batch_size):
+            batch = {row["user_id"]: row for row in rows[offset:offset + self.batch_size]}
+            existing = {
+                row.user_id: row
+                for row in await session.execute(
+                    select(student_progress).where(student_progress.c.user_id.in_(batch))
+                )
+            }
+            new_rows = []
+            for user_id, delta in batch.items():
+                folded += delta["events"]
+                current = existing.get(user_id)
+                if current is None:
+                    new_rows.append(
+                        {
+                            "user_id": user_id,
+                            "first_seen": delta["first_seen"],
+                            "last_seen": delta["last_seen"],
+                            **{name: delta[name] for name in _SUMMED},
+                        }
+                    )
+                    continue
+                await session.execute(
+                    update(student_progress)
+                    .where(student_progress.c.user_id == user_id)
+                    .values(
+                        first_seen=min(current.first_seen, delta["first_seen"]),
+                        last_seen=max(current.last_seen, delta["last_seen"]),
+                        **{name: getattr(current, name) + delta[name] for name in _SUMMED},
+                    )
+                )
+            if new_rows:
+                await session.execute(insert(student_progress), new_rows)
+        return folded, {row["user_id"] for row in rows}
+
+    async def _classes_of(self, session, user_ids: Iterable[str]) -> Set[str]:
+        user_ids = list(user_ids)
+        classes: Set[str] = set()
+        for offset in range(0, len(user_ids), self.batch_size):
+            batch = user_ids[offset:offset + self.batch_size]
+            classes.update(
+                await session.scalars(
+                    select(class_members.c.class_id)
+                    .where(class_members.c.user_id.in_(batch))
+                    .distinct()
+                )
+            )
+        return classes
+
+    async def _refresh_classes(self, session, class_ids: Optional[Iterable[str]] = None) -> None:
+        """Recompute the rows of ``class_ids`` (every class when None) from the student rows"""
+        if class_ids is None:
+            await session.execute(delete(class_progress))
+            await session.execute(self._class_rows())
+            return
+        class_ids = sorted(class_ids)
+        for offset in range(0, len(class_ids), self.batch_size):
+            batch = class_ids[offset:offset + self.batch_size]
+            await session.execute(
+                delete(class_progress).where(class_progress.c.class_id.in_(batch))
+            )
+            await session.execute(self._class_rows(batch))
+
+    def _class_rows(self, class_ids: Optional[List[str]] = None):
+        members, students = class_members.c, student_progress.c
+        query = (
+            select(
+                members.class_id,
+                func.count(members.user_id),
+                func.coalesce(func.sum(students.content_views), 0),
+                func.coalesce(func.sum(students.chat_turns), 0),
+                func.coalesce(func.sum(students.assessment_submissions), 0),
+                func.coalesce(func.sum(students.active_ms), 0.0),
+                func.coalesce(func.sum(students.scored_submissions), 0),
+                func.coalesce(func.sum(students.score_total), 0.0),
+                func.max(students.last_seen),
+            )
+            .select_from(
+                class_members.outerjoin(student_progress, members.user_id == students.user_id)
+            )
+            .group_by(members.class_id)
+        )
+        if class_ids is not None:
+            query = query.where(members.class_id.in_(class_ids))
+        return insert(class_progress).from_select(
+            [
+                "class_id",
+                "students",
+                "content_views",
+                "chat_turns",
+                "assessment_submissions",
+                "active_ms",
+                "scored_submissions",
+                "score_total",
+                "last_seen",
+            ],
+            query,
+        )
+
+    async def run(self, interval: float, rebuild_interval: float) -> None:
+        """Refresh every ``interval`` seconds and rebuild every ``rebuild_interval``"""
+        last_rebuild = time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            rebuild = time.monotonic() - last_rebuild >= rebuild_interval
+            try:
+                await self.refresh(rebuild=rebuild)
+            except Exception:
+                logger.exception("Rollup refresh failed, rebuilding")
+                try:
+                    await self.refresh(rebuild=True)
+                    rebuild = True
+                except Exception:
+                    logger.exception("Rollup rebuild failed")
+            if rebuild:
+                last_rebuild = time.monotonic()
+
+    async def set_members(self, class_id: str, user_ids: List[str]) -> None:
+        """Replace a class's membership and recompute its rollup from the student rows"""
+        async with self.session_maker() as session:
+            await session.execute(delete(class_members).where(class_members.c.class_id == class_id))
+            if user_ids:
+                rows = [{"class_id": class_id, "user_id": user_id} for user_id in set(user_ids)]
+                await session.execute(insert(class_members), rows)
+            # Refreshes only recompute classes with new activity, so this one is updated here
+            await self._refresh_classes(session, [class_id])
+            await session.commit()
+
+    async def student(self, user_id: str) -> Optional[Dict[str, Any]]:
+        async with self.session_maker() as session:
+            row = (
+                await session.execute(
+                    select(student_progress).where(student_progress.c.user_id == user_id)
+                )
+            ).mappings().first()
+        return _with_average(row) if row is not None else None
+
+    async def class_summary(self, class_id: str) -> Optional[Dict[str, Any]]:
+        async with self.session_maker() as session:
+            row = (
+                await session.execute(
+                    select(class_progress).where(class_progress.c.class_id == class_id)
+                )
+            ).mappings().first()
+            state = (
+                await session.execute(
+                    select(rollup_state.c.refreshed_at).where(rollup_state.c.name == self.name)
+                )
+            ).scalar()
+        if row is None:
+            return None
+        return {**_with_average(row), "refreshed_at": state}
+
+    async def class_students(self, class_id: str) -> List[Dict[str, Any]]:
+        async with self.session_maker() as session:
+            rows = await session.execute(
+                select(student_progress)
+                .join(class_members, class_members.c.user_id == student_progress.c.user_id)
+                .where(class_members.c.class_id == class_id)
+                .order_by(student_progress.c.user_id)
+            )
+            return [_with_average(row) for row in rows.mappings()]
+
+
+def create_progress_router(engine: RollupEngine, current_superuser: Callable) -> APIRouter:
+    """Router serving the precomputed progress rollups"""
+    router = APIRouter()
+
+    @router.get("/progress/students/{user_id}")
+    async def student_progress_view(user_id: str, user=Depends(current_superuser)):
+        """Totals for one student"""
+        row = await engine.student(user_id)
+        if row is None:
+            raise HTTPException(status_code=404, detail="No activity recorded for this student")
+        return row
+
+    @router.get("/progress/classes/{class_id}")
+    async def class_progress_view(
+        class_id: str, students: bool = False, user=Depends(current_superuser)
+    ):
+        """Totals for one class, optionally with each member's row"""
+        summary = await engine.class_summary(class_id)
+        if summary is None:
+            raise HTTPException(status_code=404, detail="Unknown class")
+        if students:
+            summary["members"] = await engine.class_students(class_id)
+        return summary
+
+    @router.put("/progress/classes/{class_id}/members", status_code=204)
+    async def set_class_members(
+        class_id: str, user_ids: List[str] = Body(..., embed=True), user=Depends(current_superuser)
+    ):
+        """Replace the list of students in a class"""
+        await engine.set_members(class_id, user_ids)
+
+    @router.post("/progress/refresh")
+    async def refresh_progress(rebuild: bool = False, user=Depends(current_superuser)):
+        """Fold new events in now, or rebuild from scratch"""
+        folded = await engine.refresh(rebuild=rebuild)
+        return {"events_folded": folded, **engine.stats}
+
+    return router
@@ -0,0 +1,263 @@
+"""Bulk roster provisioning for onboarding whole schools at once"""
+
+import asyncio
+import csv
+import json
+import os
+import tempfile
+import uuid
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+
+ROSTER_FORMATS = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+# Bodies up to this size stay in memory while spooling, larger ones go to disk
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+
+def roster_format(content_type: Optional[str]) -> Optional[str]:
+    """Map a request Content-Type to a roster format name"""
+    if not content_type:
+        return None
+    return ROSTER_FORMATS.get(content_type.split(";")[0].strip().lower())
+
+
+def _iter_lines(stream) -> Iterator[str]:
+    """Yield decoded, newline-stripped lines from a binary file object"""
+    first = True
+    for raw in stream:
+        line = raw.decode("utf-8").rstrip("\r\n")
+        if first:
+            # Spreadsheet exports often start with a byte-order mark
+            line = line.lstrip("\ufeff")
+            first = False
+        yield line
+
+
+def parse_roster(stream, fmt: str) -> Iterator[Optional[Dict[str, Any]]]:
+    """Parse a CSV (with header) or NDJSON roster into row dicts
+
+    Rows that cannot be parsed are yielded as ``None`` so the caller can still
+    report them against the right row number.
+    """
+    if fmt == "csv":
+        header: Optional[List[str]] = None
+        for line in _iter_lines(stream):
+            if not line.strip():
+                continue
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip().lower() for name in values]
+                continue
+            yield dict(zip(header, (value.strip() for value in values)))
+    else:
+        for line in _iter_lines(stream):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+def _validate(row: Any) -> Optional[str]:
+    """Return an error message for an unusable roster row, or None"""
+    if not isinstance(row, dict):
+        return "malformed row"
+    email = row.get("email")
+    if not isinstance(email, str) or "@" not in email.strip():
+        return "invalid email"
+    password = row.get("password")
+    if not isinstance(password, str) or not password:
+        return "missing password"
+    return None
+
+
+class RosterImporter:
+    """Provision users from a roster in batched transactions
+
+    Passwords are hashed in parallel on an executor (bcrypt and argon2 release
+    the GIL), duplicate emails are detected against the database once per
+    batch, and each batch is written with a single multi-row INSERT.
+    """
+
+    def __init__(
+        self,
+        session_maker,
+        user_table,
+        hash_password: Callable[[str], str],
+        batch_size: int = 500,
+        executor: Optional[Union[Executor, Callable[[], Executor]]] = None,
+    ):
+        self.session_maker = session_maker
+        self.user_table = user_table
+        self.hash_password = hash_password
+        self.batch_size = batch_size
+        self._executor = executor
+
+    @property
+    def executor(self) -> Executor:
+        if callable(self._executor):
+            # A factory, for pools that are replaced over the process's lifetime
+            return self._executor()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=os.cpu_count() or 4, thread_name_prefix="roster-hash"
+            )
+        return self._executor
+
+    def build_record(self, row: Dict[str, Any], hashed_password: str) -> Dict[str, Any]:
+        """Build the column values for one new user"""
+        return {
+            "id": uuid.uuid4(),
+            "email": row["email"].strip(),
+            "hashed_password": hashed_password,
+            "is_active": _as_bool(row.get("is_active"), True),
+            "is_superuser": False,
+            "is_verified": _as_bool(row.get("is_verified"), False),
+        }
+
+    async def import_rows(
+        self, rows: Iterator[Optional[Dict[str, Any]]]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Import rows in batches, yielding one result per input row"""
+        batch: List[Tuple[int, Any]] = []
+        seen: Set[str] = set()
+        for index, row in enumerate(rows, start=1):
+            batch.append((index, row))
+            if len(batch) >= self.batch_size:
+                for result in await self._import_batch(batch, seen):
+                    yield result
+                batch = []
+        if batch:
+            for result in await self._import_batch(batch, seen):
+                yield result
+
+    async def _import_batch(self, batch: List[Tuple[int, Any]], seen: Set[str]) -> List[Dict]:
+        results: Dict[int, Dict[str, Any]] = {}
+        pending: List[Tuple[int, Dict[str, Any]]] = []
+        for index, row in batch:
+            error = _validate(row)
+            if error:
+                results[index] = {"row": index, "status": "invalid", "error": error}
+                continue
+            key = row["email"].strip().lower()
+            if key in seen:
+                results[index] = _duplicate(index, row["email"])
+                continue
+            seen.add(key)
+            pending.append((index, row))
+
+        if pending:
+            async with self.session_maker() as session:
+                existing = await self._existing_emails(
+                    session, [row["email"].strip().lower() for _, row in pending]
+                )
+                to_create = []
+                for index, row in pending:
+                    if row["email"].strip().lower() in existing:
+                        results[index] = _duplicate(index, row["email"])
+                    else:
+                        to_create.append((index, row))
+
+                loop = asyncio.get_running_loop()
+                hashes = await asyncio.gather(
+                    *(
+                        loop.run_in_executor(self.executor, self.hash_password, row["password"])
+                        for _, row in to_create
+                    )
+                )
+                records = [
+                    (index, self.build_record(row, hashed))
+                    for (index, row), hashed in zip(to_create, hashes)
+                ]
+                if records:
+                    results.update(await self._insert(session, records))
+
+        return [results[index] for index, _ in batch]
+
+    async def _existing_emails(self, session, emails: List[str]) -> Set[str]:
+        email = func.lower(self.user_table.email)
+        rows = await session.execute(select(email).where(email.in_(emails)))
+        return set(rows.scalars())
+
+    async def _insert(self, session, records: List[Tuple[int, Dict[str, Any]]]) -> Dict[int, Dict]:
+        """Insert a batch in one statement, falling back to per-row inserts on conflict"""
+        try:
+            await session.execute(insert(self.user_table), [record for _, record in records])
+            await session.commit()
+            return {index: _created(index, record) for index, record in records}
+        except IntegrityError:
+            # Another writer (e.g. /register) raced us; find the offending rows one by one
+            await session.rollback()
+
+        results = {}
+        for index, record in records:
+            try:
+                await session.execute(insert(self.user_table), [record])
+                await session.commit()
+                results[index] = _created(index, record)
+            except IntegrityError:
+                await session.rollback()
+                results[index] = _duplicate(index, record["email"])
+        return results
+
+
+def _created(index: int, record: Dict[str, Any]) -> Dict[str, Any]:
+    return {"row": index, "email": record["email"], "status": "created", "id": str(record["id"])}
+
+
+def _duplicate(index: int, email: str) -> Dict[str, Any]:
+    return {"row": index, "email": email, "status": "duplicate"}
+
+
+def _as_bool(value: Any, default: bool) -> bool:
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "y")
+
+
+async def spool_body(request: Request):
+    """Copy the request body to a spooled temp file so it can be parsed while streaming"""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+def create_roster_router(importer: RosterImporter, current_superuser: Callable) -> APIRouter:
+    """Router exposing ``POST /roster`` for superuser bulk provisioning"""
+    router = APIRouter()
+
+    @router.post("/roster")
+    async def import_roster(request: Request, user=Depends(current_superuser)):
+        """Import a CSV or NDJSON roster and stream per-row results as NDJSON"""
+        fmt = roster_format(request.headers.get("content-type"))
+        if fmt is None:
+            raise HTTPException(
+                status_code=415, detail="Roster must be text/csv or application/x-ndjson"
+            )
+        spool = await spool_body(request)
+
+        async def results():
+            try:
+                async for result in importer.import_rows(parse_roster(spool, fmt)):
+                    yield json.dumps(result) + "\n"
+            finally:
+                spool.close()
+
+        return StreamingResponse(results(), media_type="application/x-ndjson")
+
+    return router
@@ -0,0 +1,814 @@
+"""Tenant-sharded storage for the auth user table
+
+Users are partitioned by tenant (a school or district): every row of a
+tenant lives on one of several databases, so logins and lookups for one
+district never contend with another's. A tenant's shard comes from the
+``tenant_shards`` map in the directory database (the existing auth database).
+A tenant is pinned there by its first user, to the shard a consistent-hash
+ring over the shard names picks at that moment; the ring only places tenants
+that have no pin yet, so adding a shard moves nobody until the rebalancer
+does. Lookups are cached per worker for ``cache_ttl`` seconds.
+
+``ShardedUserDatabase`` implements the fastapi-users user database interface
+on top of this. Authenticated requests carry their tenant in the verified
+JWT (``tenant`` claim); only an unauthenticated registration may name one,
+in an ``X-Tenant-ID`` header or its payload (``tenant_id``). Email addresses
+stay unique across all shards: the directory keeps a ``user_emails`` index
+from each address to its tenant, so a login by email alone goes straight to
+one shard. Lookups by ID without a tenant query every shard concurrently.
+
+``ShardRebalancer`` moves tenants placed by the ring to where the current
+ring puts them (tenants pinned by an admin stay on their pin): the tenant is
+marked as migrating (its writes get
+``TenantMigrating`` until the move finishes), its rows are copied in
+batches, counted on both sides, the tenant is pinned to its new shard and,
+once every worker's cached entry has expired and points there too, the old
+rows are deleted. Run it as::
+
+    python -m tutor_stack_core.sharding --directory <url> --shard a=<url> --shard b=<url> \\
+        --user-model tutor_stack_auth.models:User [--oauth-model ...] \\
+        [plan|apply|move T SHARD|pin-existing|index-emails]
+
+``pin-existing`` and ``index-emails`` are for users created before pins and
+the email index existed: the first pins every unpinned tenant to the shard
+holding its rows, the second fills the index and lists addresses used by
+more than one tenant.
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import importlib
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import (
+    Column,
+    Float,
+    MetaData,
+    String,
+    Table,
+    delete,
+    func,
+    insert,
+    inspect,
+    select,
+)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import mapped_column, object_session
+from sqlalchemy.schema import CreateColumn
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+tenant_shards = Table(
+    "tenant_shards",
+    metadata,
+    Column("tenant_id", String(64), primary_key=True),
+    Column("shard", String(64), nullable=False),
+    Column("state", String(16), nullable=False),
+    Column("updated_at", Float, nullable=False),
+    # "ring" for automatic placements the rebalancer may change, "admin" for deliberate ones
+    Column("placed_by", String(8), nullable=False, server_default="admin"),
+)
+
+user_emails = Table(
+    "user_emails",
+    metadata,
+    Column("email", String(320), primary_key=True),
+    Column("tenant_id", String(64), nullable=False),
+)
+
+ACTIVE = "active"
+MIGRATING = "migrating"
+
+RING = "ring"
+ADMIN = "admin"
+
+
+class TenantMigrating(Exception):
+    """The tenant's rows are being moved between shards; retry the write shortly"""
+
+    def __init__(self, tenant: str, retry_after: int):
+        super().__init__(f"Tenant {tenant} is being moved to another shard")
+        self.tenant = tenant
+        self.retry_after = retry_after
+
+
+class EmailInUse(Exception):
+    """The email address already belongs to a user, possibly on another shard"""
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent-hash ring with ``vnodes`` points per shard"""
+
+    def __init__(self, shards: Iterable[str], vnodes: int = 128):
+        self.shards = sorted(set(shards))
+        if not self.shards:
+            raise ValueError("A hash ring needs at least one shard")
+        points = sorted(
+            (_hash(f"{shard}#{i}"), shard) for shard in self.shards for i in range(vnodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard_for(self, key: str) -> str:
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class ShardSet:
+    """One async engine and session factory per named shard"""
+
+    def __init__(self, urls: Dict[str, str], **engine_options):
+        if not urls:
+            raise ValueError("No shards configured")
+        self.urls = dict(urls)
+        self.engines = {
+            name: create_async_engine(url, **engine_options) for name, url in urls.items()
+        }
+        self.session_makers = {
+            name: async_sessionmaker(engine, expire_on_commit=False)
+            for name, engine in self.engines.items()
+        }
+
+    @classmethod
+    def from_spec(cls, spec: str, **engine_options) -> "ShardSet":
+        """Parse ``name=url,name=url`` (as in ``USER_SHARDS``)"""
+        urls = {}
+        for item in spec.split(","):
+            name, sep, url = item.strip().partition("=")
+            if not sep or not name or not url:
+                raise ValueError(f"Invalid shard entry {item!r}, expected name=url")
+            urls[name.strip()] = url.strip()
+        return cls(urls, **engine_options)
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.engines)
+
+    async def create_all(self, schema: MetaData) -> None:
+        for engine in self.engines.values():
+            async with engine.begin() as conn:
+                await conn.run_sync(schema.create_all)
+
+    async def add_missing_columns(self, table) -> None:
+        """Add columns (and their indexes) that ``table`` has and a shard's copy lacks"""
+        for engine in self.engines.values():
+            async with engine.begin() as conn:
+                await conn.run_sync(_add_missing_columns, _table(table))
+
+    async def dispose(self) -> None:
+        for engine in self.engines.values():
+            await engine.dispose()
+
+
+def _add_missing_columns(conn, table: Table) -> None:
+    present = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    table_name = conn.dialect.identifier_preparer.format_table(table)
+    for column in table.columns:
+        if column.name in present:
+            continue
+        spec = CreateColumn(column).compile(dialect=conn.dialect)
+        conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {spec}")
+        logger.info("Added column %s to %s", column.name, table.name)
+        for index in table.indexes:
+            if column.name in index.columns:
+                index.create(conn, checkfirst=True)
+
+
+def add_tenant_column(model, name: str = "tenant_id", default: str = "default") -> None:
+    """Map a tenant column onto a user model that was declared without one
+
+    Existing rows get ``default``; call ``ShardSet.add_missing_columns`` to
+    add the column to tables created before it.
+    """
+    if not hasattr(model, name):
+        setattr(
+            model,
+            name,
+            mapped_column(
+                String(64), nullable=False, default=default, server_default=default, index=True
+            ),
+        )
+
+
+class ShardMap:
+    """Tenant -> shard: pins from ``tenant_shards``, else the ring, cached per worker
+
+    The directory also holds the global email -> tenant index (``user_emails``).
+    """
+
+    def __init__(
+        self,
+        session_maker,
+        ring: HashRing,
+        cache_ttl: float = 30.0,
+        max_entries: int = 100_000,
+    ):
+        self.session_maker = session_maker
+        self.ring = ring
+        self.cache_ttl = cache_ttl
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Tuple[float, str, str]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    async def create_table(self, engine) -> None:
+        async with engine.begin() as conn:
+            await conn.run_sync(metadata.create_all)
+            await conn.run_sync(_add_missing_columns, tenant_shards)
+
+    async def resolve(self, tenant: str) -> Tuple[str, str]:
+        """The tenant's shard and state (``active`` or ``migrating``)"""
+        shard, state, _ = await self._resolve(tenant)
+        return shard, state
+
+    async def _resolve(self, tenant: str) -> Tuple[str, str, bool]:
+        now = time.monotonic()
+        cached = self._cache.get(tenant)
+        if cached is not None and cached[0] > now:
+            self._cache.move_to_end(tenant)
+            self.stats["hits"] += 1
+            return cached[1:]
+        self.stats["misses"] += 1
+        async with self.session_maker() as session:
+            row = (
+                await session.execute(
+                    select(tenant_shards.c.shard, tenant_shards.c.state).where(
+                        tenant_shards.c.tenant_id == tenant
+                    )
+                )
+            ).first()
+        # Unpinned tenants are cached too, so the directory is only asked once per TTL
+        if row is not None:
+            shard, state, pinned = row.shard, row.state, True
+        else:
+            shard, state, pinned = self.ring.shard_for(tenant), ACTIVE, False
+        self._cache[tenant] = (now + self.cache_ttl, shard, state, pinned)
+        self._cache.move_to_end(tenant)
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return shard, state, pinned
+
+    async def shard_for(self, tenant: str, write: bool = False) -> str:
+        """The shard to use; writes to a migrating tenant raise ``TenantMigrating``"""
+        shard, state = await self.resolve(tenant)
+        if write and state == MIGRATING:
+            raise TenantMigrating(tenant, retry_after=max(1, int(self.cache_ttl)))
+        return shard
+
+    async def place(self, tenant: str) -> str:
+        """The shard for a new user of ``tenant``, pinning the tenant if this is its first
+
+        The pin keeps the tenant's users where they are when shards are added
+        later; ``TenantMigrating`` as in ``shard_for(write=True)``.
+        """
+        shard, state, pinned = await self._resolve(tenant)
+        if not pinned:
+            async with self.session_maker() as session:
+                try:
+                    await session.execute(
+                        insert(tenant_shards).values(
+                            tenant_id=tenant,
+                            shard=shard,
+                            state=ACTIVE,
+                            updated_at=time.time(),
+                            placed_by=RING,
+                        )
+                    )
+                    await session.commit()
+                except IntegrityError:
+                    pass  # Another worker placed it first; use its pin
+            self._cache.pop(tenant, None)
+            shard, state, _ = await self._resolve(tenant)
+        if state == MIGRATING:
+            raise TenantMigrating(tenant, retry_after=max(1, int(self.cache_ttl)))
+        return shard
+
+    async def pin(
+        self, tenant: str, shard: str, state: str = ACTIVE, placed_by: Optional[str] = None
+    ) -> None:
+        """Record the tenant's shard; other workers pick it up within ``cache_ttl``
+
+        ``placed_by`` defaults to the existing pin's, or ``admin`` for a new one.
+        """
+        async with self.session_maker() as session:
+            if placed_by is None:
+                placed_by = await session.scalar(
+                    select(tenant_shards.c.placed_by).where(tenant_shards.c.tenant_id == tenant)
+                ) or ADMIN
+            await session.execute(delete(tenant_shards).where(tenant_shards.c.tenant_id == tenant))
+            await session.execute(
+                insert(tenant_shards).values(
+                    tenant_id=tenant,
+                    shard=shard,
+                    state=state,
+                    updated_at=time.time(),
+                    placed_by=placed_by,
+                )
+            )
+            await session.commit()
+        self._cache.pop(tenant, None)
+
+    async def pins(self) -> Dict[str, Tuple[str, str]]:
+        placements = await self.placements()
+        return {tenant: (shard, state) for tenant, (shard, state, _) in placements.items()}
+
+    async def placements(self) -> Dict[str, Tuple[str, str, str]]:
+        """Tenant -> ``(shard, state, placed_by)`` for every pinned tenant"""
+        async with self.session_maker() as session:
+            rows = await session.execute(select(tenant_shards))
+            return {row.tenant_id: (row.shard, row.state, row.placed_by) for row in rows}
+
+    async def tenant_of(self, email: str) -> Optional[str]:
+        """The tenant of the user with this email address, if there is one"""
+        async with self.session_maker() as session:
+            return await session.scalar(
+                select(user_emails.c.tenant_id).where(user_emails.c.email == email.lower())
+            )
+
+    async def claim_email(self, email: str, tenant: str) -> None:
+        """Reserve an address for ``tenant``; ``EmailInUse`` if another user has it"""
+        async with self.session_maker() as session:
+            try:
+                await session.execute(
+                    insert(user_emails).values(email=email.lower(), tenant_id=tenant)
+                )
+                await session.commit()
+            except IntegrityError:
+                raise EmailInUse(email) from None
+
+    async def release_email(self, email: str) -> None:
+        async with self.session_maker() as session:
+            await session.execute(delete(user_emails).where(user_emails.c.email == email.lower()))
+            await session.commit()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"shards": self.ring.shards, "cached": len(self._cache), **self.stats}
+
+
+def _table(model) -> Table:
+    return getattr(model, "__table__", model)
+
+
+class ShardedUserDatabase:
+    """fastapi-users user database whose rows live on the tenant's shard
+
+    One instance serves one request: ``tenant`` is the tenant the request
+    carried, if any, and sessions are opened per shard on first use. Call
+    ``close()`` when the request is done.
+    """
+
+    def __init__(
+        self,
+        shards: ShardSet,
+        shard_map: ShardMap,
+        user_table,
+        oauth_account_table=None,
+        tenant: Optional[str] = None,
+        default_tenant: str = "default",
+        tenant_column: str = "tenant_id",
+    ):
+        self.shards = shards
+        self.shard_map = shard_map
+        self.user_table = user_table
+        self.oauth_account_table = oauth_account_table
+        self.tenant = tenant
+        self.default_tenant = default_tenant
+        self.tenant_column = tenant_column
+        self._sessions: Dict[str, Any] = {}
+
+    def _session(self, shard: str):
+        session = self._sessions.get(shard)
+        if session is None:
+            session = self._sessions[shard] = self.shards.session_makers[shard]()
+        return session
+
+    async def _tenant_session(self, tenant: str, write: bool = False):
+        return self._session(await self.shard_map.shard_for(tenant, write=write))
+
+    async def _first(self, statement):
+        """Run a user query on the request's shard, or on every shard if it has no tenant"""
+        if self.tenant is not None:
+            session = await self._tenant_session(self.tenant)
+            return (await session.execute(statement)).unique().scalar_one_or_none()
+        return await self._any(statement)
+
+    async def _any(self, statement):
+        results = await asyncio.gather(
+            *(self._session(shard).execute(statement) for shard in self.shards.names)
+        )
+        for result in results:
+            user = result.unique().scalar_one_or_none()
+            if user is not None:
+                return user
+        return None
+
+    async def _writable(self, user):
+        """The session holding ``user`` (loaded through this instance), after the write check"""
+        tenant = getattr(user, self.tenant_column)
+        session = await self._tenant_session(tenant, write=True)
+        loaded_by = object_session(user)
+        for candidate in self._sessions.values():
+            if candidate.sync_session is loaded_by:
+                return candidate, user
+        return session, await session.merge(user)
+
+    async def get(self, id):
+        statement = select(self.user_table).where(self.user_table.id == id)
+        user = await self._first(statement)
+        if user is None and self.tenant is not None:
+            # A superuser looking up a user of another tenant
+            user = await self._any(statement)
+        return user
+
+    async def get_by_email(self, email: str):
+        """The user with this address, whatever the request's tenant (addresses are global)"""
+        tenant = await self.shard_map.tenant_of(email)
+        if tenant is None:
+            return None
+        session = await self._tenant_session(tenant)
+        result = await session.execute(
+            select(self.user_table)
+            .where(func.lower(self.user_table.email) == func.lower(email))
+            .where(getattr(self.user_table, self.tenant_column) == tenant)
+        )
+        return result.unique().scalar_one_or_none()
+
+    async def get_by_oauth_account(self, oauth: str, account_id: str):
+        if self.oauth_account_table is None:
+            raise NotImplementedError()
+        return await self._first(
+            select(self.user_table)
+            .join(self.oauth_account_table)
+            .where(self.oauth_account_table.oauth_name == oauth)
+            .where(self.oauth_account_table.account_id == account_id)
+        )
+
+    async def create(self, create_dict: Dict[str, Any]):
+        tenant = create_dict.get(self.tenant_column) or self.tenant or self.default_tenant
+        session = self._session(await self.shard_map.place(tenant))
+        await self.shard_map.claim_email(create_dict["email"], tenant)
+        try:
+            user = self.user_table(**{**create_dict, self.tenant_column: tenant})
+            session.add(user)
+            await session.commit()
+        except BaseException:
+            await self.shard_map.release_email(create_dict["email"])
+            raise
+        await session.refresh(user)
+        return user
+
+    async def update(self, user, update_dict: Dict[str, Any]):
+        session, user = await self._writable(user)
+        old_email, new_email = user.email, update_dict.get("email", user.email)
+        changed = new_email.lower() != old_email.lower()
+        if changed:
+            await self.shard_map.claim_email(new_email, getattr(user, self.tenant_column))
+        try:
+            for key, value in update_dict.items():
+                setattr(user, key, value)
+            session.add(user)
+            await session.commit()
+        except BaseException:
+            if changed:
+                await self.shard_map.release_email(new_email)
+            raise
+        if changed:
+            await self.shard_map.release_email(old_email)
+        await session.refresh(user)
+        return user
+
+    async def delete(self, user) -> None:
+        session, user = await self._writable(user)
+        await session.delete(user)
+        await session.commit()
+        await self.shard_map.release_email(user.email)
+
+    async def add_oauth_account(self, user, create_dict: Dict[str, Any]):
+        if self.oauth_account_table is None:
+            raise NotImplementedError()
+        session, user = await self._writable(user)
+        await session.refresh(user)
+        oauth_account = self.oauth_account_table(**create_dict)
+        session.add(oauth_account)
+        user.oauth_accounts.append(oauth_account)
+        session.add(user)
+        await session.commit()
+        await session.refresh(user)
+        return user
+
+    async def update_oauth_account(self, user, oauth_account, update_dict: Dict[str, Any]):
+        if self.oauth_account_table is None:
+            raise NotImplementedError()
+        session, user = await self._writable(user)
+        for key, value in update_dict.items():
+            setattr(oauth_account, key, value)
+        session.add(oauth_account)
+        await session.commit()
+        await session.refresh(user)
+        return user
+
+    async def close(self) -> None:
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
+
+
+async def tenant_from_request(request, registration_path: str = "/register") -> Optional[str]:
+    """The tenant a request carries
+
+    With a token, only its verified ``tenant`` claim counts. Without one,
+    only a registration may name its tenant, in an ``X-Tenant-ID`` header or
+    a JSON body's ``tenant_id``.
+    """
+    claims = getattr(request.state, "claims", None)
+    if claims is not None:
+        return claims.get("tenant")
+    if request.headers.get("authorization"):
+        # A token the guard did not verify; never let a header stand in for it
+        return None
+    if request.method != "POST" or request.url.path != registration_path:
+        return None
+    tenant = request.headers.get("x-tenant-id")
+    if tenant:
+        return tenant
+    if request.headers.get("content-type", "").startswith("application/json"):
+        # The route has already read the body, so this is the cached copy
+        try:
+            body = await request.json()
+        except ValueError:
+            return None
+        if isinstance(body, dict) and isinstance(body.get("tenant_id"), str):
+            return body["tenant_id"]
+    return None
+
+
+class ShardRebalancer:
+    """Moves tenants' user (and OAuth account) rows to the shard the map assigns them"""
+
+    def __init__(
+        self,
+        shards: ShardSet,
+        shard_map: ShardMap,
+        user_table,
+        oauth_account_table=None,
+        tenant_column: str = "tenant_id",
+        batch_size: int = 500,
+        settle: Optional[float] = None,
+    ):
+        self.shards = shards
+        self.shard_map = shard_map
+        self.users = _table(user_table)
+        self.oauth_accounts = None
+        if oauth_account_table is not None:
+            self.oauth_accounts = _table(oauth_account_table)
+        self.tenant_column = tenant_column
+        self.batch_size = batch_size
+        # Long enough for every worker's cached entry to expire and see the migrating state
+        self.settle = shard_map.cache_ttl if settle is None else settle
+
+    async def locations(self) -> Dict[str, List[str]]:
+        """Tenant -> shards currently holding its rows"""
+        found: Dict[str, List[str]] = {}
+        column = self.users.c[self.tenant_column]
+        for shard, session_maker in self.shards.session_makers.items():
+            async with session_maker() as session:
+                for tenant in (await session.execute(select(column).distinct())).scalars():
+                    found.setdefault(tenant, []).append(shard)
+        return found
+
+    async def plan(self) -> List[Tuple[str, str, str]]:
+        """``(tenant, source, target)`` for every tenant stored away from its assigned shard
+
+        Tenants pinned by an admin belong on their pin, all others where the
+        ring puts them now.
+        """
+        placements = await self.shard_map.placements()
+        moves = []
+        for tenant, holders in sorted((await self.locations()).items()):
+            placement = placements.get(tenant)
+            if placement is not None and placement[2] == ADMIN:
+                target = placement[0]
+            else:
+                target = self.shard_map.ring.shard_for(tenant)
+            moves.extend((tenant, source, target) for source in holders if source != target)
+        return moves
+
+    async def pin_existing(self) -> Dict[str, str]:
+        """Pin every unpinned tenant to the shard holding its rows, before the ring changes"""
+        placements = await self.shard_map.placements()
+        pinned = {}
+        for tenant, holders in sorted((await self.locations()).items()):
+            if tenant in placements:
+                continue
+            if len(holders) > 1:
+                logger.warning("Tenant %s has rows on %s; left for the rebalancer", tenant, holders)
+                continue
+            await self.shard_map.pin(tenant, holders[0], placed_by=RING)
+            pinned[tenant] = holders[0]
+        return pinned
+
+    async def rebalance(self) -> List[Tuple[str, str, str]]:
+        moves = await self.plan()
+        for tenant, source, target in moves:
+            await self.move(tenant, source, target)
+        return moves
+
+    async def move(self, tenant: str, source: str, target: str) -> int:
+        """Copy one tenant from ``source`` to ``target``, switch it over, then clean up"""
+        if source == target:
+            return 0
+        await self.shard_map.pin(tenant, source, MIGRATING)
+        try:
+            await asyncio.sleep(self.settle)
+            # Merged by ID into whatever the tenant already has on the target (say, the copy
+            # of an interrupted earlier attempt), which is never deleted
+            copied = await self._copy(tenant, source, target)
+            expected = await self._count(source, tenant)
+            if copied != expected or await self._count(target, tenant) < expected:
+                raise RuntimeError(f"Copy of tenant {tenant} to {target} is incomplete")
+        except BaseException:
+            await self.shard_map.pin(tenant, source, ACTIVE)
+            raise
+        await self.shard_map.pin(tenant, target, ACTIVE)
+        # Workers still holding the old entry keep reading from the source until it expires
+        await asyncio.sleep(self.settle)
+        async with self.shards.session_makers[source]() as session:
+            await self._delete_tenant(session, tenant)
+            await session.commit()
+        logger.info("Moved %d users of tenant %s from %s to %s", copied, tenant, source, target)
+        return copied
+
+    async def index_emails(self) -> List[Tuple[str, str, str]]:
+        """Add every shard's addresses to ``user_emails``, for users created before the index
+
+        Returns ``(email, indexed tenant, other tenant)`` for addresses held by
+        two tenants; those stay pointing at the first and need resolving by hand.
+        """
+        users, column = self.users, self.users.c[self.tenant_column]
+        conflicts = []
+        for session_maker in self.shards.session_makers.values():
+            after = None
+            async with session_maker() as session:
+                while True:
+                    query = select(users.c.id, users.c.email, column)
+                    if after is not None:
+                        query = query.where(users.c.id > after)
+                    rows = (
+                        await session.execute(query.order_by(users.c.id).limit(self.batch_size))
+                    ).all()
+                    if not rows:
+                        break
+                    conflicts += await self._index_batch(
+                        [(row.email.lower(), row[2]) for row in rows]
+                    )
+                    after = rows[-1].id
+        return conflicts
+
+    async def _index_batch(self, pairs: List[Tuple[str, str]]) -> List[Tuple[str, str, str]]:
+        async with self.shard_map.session_maker() as directory:
+            indexed = dict(
+                (
+                    await directory.execute(
+                        select(user_emails.c.email, user_emails.c.tenant_id).where(
+                            user_emails.c.email.in_([email for email, _ in pairs])
+                        )
+                    )
+                ).all()
+            )
+            missing, conflicts = [], []
+            for email, tenant in pairs:
+                if email not in indexed:
+                    indexed[email] = tenant
+                    missing.append({"email": email, "tenant_id": tenant})
+                elif indexed[email] != tenant:
+                    conflicts.append((email, indexed[email], tenant))
+            if missing:
+                await directory.execute(insert(user_emails), missing)
+                await directory.commit()
+        return conflicts
+
+    async def _copy(self, tenant: str, source: str, target: str) -> int:
+        users, accounts = self.users, self.oauth_accounts
+        copied, after = 0, None
+        reader = self.shards.session_makers[source]()
+        writer = self.shards.session_makers[target]()
+        async with reader, writer:
+            while True:
+                query = select(users).where(users.c[self.tenant_column] == tenant)
+                if after is not None:
+                    query = query.where(users.c.id > after)
+                rows = (
+                    await reader.execute(query.order_by(users.c.id).limit(self.batch_size))
+                ).mappings().all()
+                if not rows:
+                    break
+                ids = [row["id"] for row in rows]
+                # Rows copied by an earlier attempt are replaced with the current ones
+                if accounts is not None:
+                    await writer.execute(delete(accounts).where(accounts.c.user_id.in_(ids)))
+                await writer.execute(delete(users).where(users.c.id.in_(ids)))
+                await writer.execute(insert(users), [dict(row) for row in rows])
+                if accounts is not None:
+                    linked = (
+                        await reader.execute(select(accounts).where(accounts.c.user_id.in_(ids)))
+                    ).mappings().all()
+                    if linked:
+                        await writer.execute(insert(accounts), [dict(row) for row in linked])
+                await writer.commit()
+                copied += len(rows)
+                after = rows[-1]["id"]
+        return copied
+
+    async def _count(self, shard: str, tenant: str) -> int:
+        async with self.shards.session_makers[shard]() as session:
+            return await session.scalar(
+                select(func.count()).select_from(self.users).where(
+                    self.users.c[self.tenant_column] == tenant
+                )
+            )
+
+    async def _delete_tenant(self, session, tenant: str) -> None:
+        tenant_ids = select(self.users.c.id).where(self.users.c[self.tenant_column] == tenant)
+        if self.oauth_accounts is not None:
+            await session.execute(
+                delete(self.oauth_accounts).where(self.oauth_accounts.c.user_id.in_(tenant_ids))
+            )
+        await session.execute(delete(self.users).where(self.users.c[self.tenant_column] == tenant))
+
+
+def _load(target: str):
+    module_name, _, attribute = target.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+async def _main(args) -> None:
+    shards = ShardSet.from_spec(",".join(args.shard))
+    directory = create_async_engine(args.directory)
+    shard_map = ShardMap(
+        async_sessionmaker(directory, expire_on_commit=False), HashRing(shards.names)
+    )
+    await shard_map.create_table(directory)
+    rebalancer = ShardRebalancer(
+        shards,
+        shard_map,
+        _load(args.user_model),
+        _load(args.oauth_model) if args.oauth_model else None,
+        batch_size=args.batch_size,
+        settle=args.settle,
+    )
+    # A newly added shard starts out empty
+    await shards.create_all(rebalancer.users.metadata)
+    try:
+        if args.command == "move":
+            tenant, target = args.arguments
+            for source in (await rebalancer.locations()).get(tenant, []):
+                await rebalancer.move(tenant, source, target)
+            await shard_map.pin(tenant, target)
+        elif args.command == "pin-existing":
+            for tenant, shard in (await rebalancer.pin_existing()).items():
+                print(f"{tenant}\t{shard}")
+        elif args.command == "index-emails":
+            for email, indexed, other in await rebalancer.index_emails():
+                print(f"{email}\tindexed for {indexed}, also used by {other}")
+        else:
+            moves = await (rebalancer.rebalance() if args.command == "apply" else rebalancer.plan())
+            for tenant, source, target in moves:
+                print(f"{tenant}\t{source} -> {target}")
+    finally:
+        await shards.dispose()
+        await directory.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plan or apply tenant moves between user shards")
+    parser.add_argument("--directory", required=True, help="database holding tenant_shards")
+    parser.add_argument("--shard", action="append", required=True, help="name=url, repeatable")
+    parser.add_argument("--user-model", required=True, help="module:Class of the user table")
+    parser.add_argument("--oauth-model", help="module:Class of the OAuth account table")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--settle", type=float, default=30.0, help="seconds for caches to expire")
+    parser.add_argument(
+        "command",
+        choices=["plan", "apply", "move", "pin-existing", "index-emails"],
+        nargs="?",
+        default="plan",
+    )
+    parser.add_argument("arguments", nargs="*", help="for move: TENANT SHARD")
+    args = parser.parse_args()
+    if args.command == "move" and len(args.arguments) != 2:
+        parser.error("move takes a tenant and a target shard")
+    sys.path.insert(0, os.getcwd())
+    asyncio.run(_main(args))
@@ -0,0 +1,152 @@
+"""Serve a built single-page frontend (Vite ``dist``) from the gateway
+
+The directory is indexed once at startup: each file's stat result, media
+type, ETag and cache policy, plus any ``.br``/``.gz`` siblings produced at
+build time. Requests are then answered from that index without touching
+the filesystem until the file itself is sent. Content-hashed files under
+``assets/`` get a year-long ``immutable`` cache policy; everything else
+revalidates. Paths
+that look like client-side routes fall back to ``index.html``.
+"""
+
+import mimetypes
+import os
+import re
+from dataclasses import dataclass, field
+from email.utils import formatdate
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, PlainTextResponse, Response
+
+from tutor_stack_core.responses import negotiate_encoding
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Vite emits bundles into assets/ with a content hash appended, e.g. assets/index-4f1b2c3d.js.
+# The hash must contain a digit, so names like og-image-large.png are not taken for one.
+ASSETS_DIR = "assets"
+HASHED_NAME = re.compile(r"-(?=[A-Za-z_]*[0-9])[A-Za-z0-9_]{8,}\.[A-Za-z0-9]+$")
+PRECOMPRESSED = {".br": "br", ".gz": "gzip"}
+
+
+@dataclass
+class StaticFile:
+    """One servable file with its precomputed headers and compressed variants"""
+
+    path: str
+    stat: os.stat_result
+    media_type: str
+    cache_control: str
+    variants: Dict[str, "StaticFile"] = field(default_factory=dict)
+    base_headers: Dict[str, str] = field(init=False)
+
+    def __post_init__(self):
+        self.base_headers = {
+            "content-length": str(self.stat.st_size),
+            "last-modified": formatdate(self.stat.st_mtime, usegmt=True),
+            "etag": f'"{self.stat.st_mtime_ns:x}-{self.stat.st_size:x}"',
+            "cache-control": self.cache_control,
+        }
+
+
+def is_immutable(url: str) -> bool:
+    """Whether ``url`` names a content-hashed bundler output, safe to cache forever"""
+    return url.startswith(f"/{ASSETS_DIR}/") and HASHED_NAME.search(url) is not None
+
+
+def build_index(directory: str) -> Dict[str, StaticFile]:
+    """Map URL paths to files under ``directory``, attaching precompressed siblings"""
+    files: Dict[str, StaticFile] = {}
+    compressed = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            url = "/" + os.path.relpath(path, directory).replace(os.sep, "/")
+            base, extension = os.path.splitext(url)
+            if extension in PRECOMPRESSED:
+                compressed.append((base, PRECOMPRESSED[extension], path))
+                continue
+            files[url] = StaticFile(
+                path=path,
+                stat=os.stat(path),
+                media_type=mimetypes.guess_type(name)[0] or "application/octet-stream",
+                cache_control=IMMUTABLE if is_immutable(url) else REVALIDATE,
+            )
+    for url, encoding, path in compressed:
+        original = files.get(url)
+        if original is not None:
+            original.variants[encoding] = StaticFile(
+                path, os.stat(path), original.media_type, original.cache_control
+            )
+    return files
+
+
+class _IndexedFileResponse(FileResponse):
+    """``FileResponse`` trusting precomputed headers, sent in large chunks
+
+    Servers that implement the ASGI path-send extension get the path instead
+    and can send the file without copying it through Python.
+    """
+
+    chunk_size = 1024 * 1024
+
+    def set_stat_headers(self, stat_result: os.stat_result) -> None:
+        pass
+
+
+class StaticFrontend:
+    """ASGI app serving an indexed ``dist`` directory with an SPA fallback"""
+
+    def __init__(self, directory: str, index: str = "index.html"):
+        self.directory = directory
+        self.files = build_index(directory)
+        self.index = self.files.get("/" + index)
+
+    def resolve(self, path: str, accept: str = "") -> Optional[StaticFile]:
+        """File for ``path``, or ``index.html`` for paths that look like client routes"""
+        if path.endswith("/"):
+            path += "index.html"
+        found = self.files.get(path)
+        if found is not None:
+            return found
+        last_segment = path.rsplit("/", 1)[-1]
+        if "." not in last_segment and (not accept or "text/html" in accept or "*/*" in accept):
+            return self.index
+        return None
+
+    def response(self, file: StaticFile, headers: Headers) -> Response:
+        encoding = negotiate_encoding(headers.get("accept-encoding", ""), file.variants)
+        served = file.variants[encoding] if encoding != "identity" else file
+        response_headers = dict(served.base_headers)
+        if file.variants:
+            response_headers["vary"] = "Accept-Encoding"
+        if encoding != "identity":
+            response_headers["content-encoding"] = encoding
+        if response_headers["etag"] in headers.get("if-none-match", ""):
+            del response_headers["content-length"]
+            return Response(status_code=304, headers=response_headers)
+        return _IndexedFileResponse(
+            served.path,
+            headers=response_headers,
+            media_type=file.media_type,
+            stat_result=served.stat,
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "websocket":
+            return await send({"type": "websocket.close", "code": 1000})
+        if scope["method"] not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", 405, {"allow": "GET, HEAD"})
+            return await response(scope, receive, send)
+
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):] or "/"
+        headers = Headers(scope=scope)
+        file = self.resolve(path, headers.get("accept", ""))
+        if file is None:
+            return await PlainTextResponse("Not Found", 404)(scope, receive, send)
+        await self.response(file, headers)(scope, receive, send)
@@ -0,0 +1,113 @@
+"""fastapi-users JWT strategy backed by pre-parsed keys"""
+
+import os
+import time
+import uuid
+from typing import Optional
+
+import jwt
+from fastapi_users import exceptions
+from fastapi_users.authentication import JWTStrategy
+from fastapi_users.authentication.strategy import StrategyDestroyNotSupportedError
+
+from tutor_stack_core.jwt_keys import (
+    DEFAULT_AUDIENCE,
+    KeyCache,
+    TokenVerifier,
+    get_key_cache,
+    get_token_verifier,
+)
+from tutor_stack_core.revocation import RevocationChecker
+
+
+class PreparsedJWTStrategy(JWTStrategy):
+    """JWT strategy that signs and verifies with parsed key objects
+
+    Tokens are signed with the key cache's current signing key and stamped
+    with its ``kid``. Verification goes through a ``TokenVerifier`` so tokens
+    signed with any key still in the cache stay valid across rotations and
+    algorithm migrations. With a ``RevocationChecker`` attached, tokens carry a
+    ``jti`` that logout revokes.
+    """
+
+    def __init__(
+        self,
+        keys: KeyCache,
+        verifier: TokenVerifier,
+        lifetime_seconds: Optional[int],
+        token_audience=DEFAULT_AUDIENCE,
+    ):
+        signing = keys.signing_keys()
+        super().__init__(
+            secret=signing.private_key,
+            lifetime_seconds=lifetime_seconds,
+            token_audience=token_audience,
+            algorithm=signing.algorithm,
+            public_key=signing.public_key,
+        )
+        self.keys = keys
+        self.verifier = verifier
+        self.revocations: Optional[RevocationChecker] = None
+
+    async def write_token(self, user) -> str:
+        signing = self.keys.signing_keys()
+        now = int(time.time())
+        data = {
+            "sub": str(user.id),
+            "aud": self.token_audience,
+            "iat": now,
+            "jti": uuid.uuid4().hex,
+        }
+        if self.lifetime_seconds:
+            data["exp"] = now + self.lifetime_seconds
+        # Routes the holder's user lookups to their tenant's shard (see tutor_stack_core.sharding)
+        tenant = getattr(user, "tenant_id", None)
+        if tenant:
+            data["tenant"] = tenant
+        return jwt.encode(
+            data, signing.private_key, algorithm=signing.algorithm, headers={"kid": signing.kid}
+        )
+
+    async def read_token(self, token: Optional[str], user_manager):
+        if token is None:
+            return None
+        try:
+            claims = self.verifier.verify(token)
+        except jwt.PyJWTError:
+            return None
+        user_id = claims.get("sub")
+        if user_id is None:
+            return None
+        if self.revocations is not None and await self.revocations.is_revoked(claims):
+            return None
+        try:
+            return await user_manager.get(user_manager.parse_id(user_id))
+        except (exceptions.UserNotExists, exceptions.InvalidID):
+            return None
+
+    async def destroy_token(self, token: str, user) -> None:
+        """Revoke the token's ``jti`` so logout takes effect on every worker"""
+        if self.revocations is None:
+            raise StrategyDestroyNotSupportedError("No revocation store is configured")
+        try:
+            claims = self.verifier.verify(token)
+        except jwt.PyJWTError:
+            return
+        # Tokens issued before jti was stamped can only be cut off per account by an admin
+        if claims.get("jti"):
+            await self.revocations.revoke_token(claims["jti"], claims.get("exp"))
+
+
+_strategy: Optional[PreparsedJWTStrategy] = None
+
+
+def get_preparsed_jwt_strategy() -> PreparsedJWTStrategy:
+    """Process-wide strategy instance, usable as an ``AuthenticationBackend`` factory"""
+    global _strategy
+    if _strategy is None:
+        _strategy = PreparsedJWTStrategy(
+            get_key_cache(),
+            get_token_verifier(),
+            lifetime_seconds=int(os.getenv("JWT_LIFETIME_SECONDS", 3600)),
+        )
+    return _strategy
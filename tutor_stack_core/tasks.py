@@ -0,0 +1,330 @@
+"""Shared, prioritized background-task scheduler for the gateway process
+
+Every mounted service submits its background work (notification sends,
+grading, content indexing, chat summaries) to the one scheduler returned by
+``get_task_scheduler()`` instead of starting its own tasks or threads, so
+their total is bounded and request handling keeps the loop. Jobs wait in
+per-priority, per-service queues and are started highest priority first,
+round-robin across services, by at most ``max_running`` at a time:
+
+- each service runs at most its quota at once, so one busy service cannot
+  take every slot;
+- ``LOW`` priority jobs together get at most ``low_priority_limit`` slots;
+- a service with ``max_queued`` jobs waiting has new ones rejected with
+  ``TaskQueueFull`` instead of queueing without bound.
+
+Jobs run on the event loop (``mode="async"``), on a bounded thread pool for
+blocking calls (``"thread"``) or on a bounded process pool for CPU-bound
+work (``"process"``). On shutdown, queued jobs are cancelled, running ones
+get ``grace`` seconds to finish and async ones are then cancelled. Blocking
+functions can poll ``scheduler.stopping`` to return early.
+"""
+
+import asyncio
+import enum
+import functools
+import logging
+import os
+import statistics
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+MODES = ("async", "thread", "process")
+
+
+class Priority(enum.IntEnum):
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+class TaskQueueFull(Exception):
+    """The service already has ``max_queued`` jobs waiting"""
+
+
+class _Job:
+    __slots__ = ("service", "priority", "func", "args", "kwargs", "mode", "future", "queued_at")
+
+    def __init__(self, service, priority, func, args, kwargs, mode, future):
+        self.service = service
+        self.priority = priority
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.mode = mode
+        self.future = future
+        self.queued_at = time.perf_counter()
+
+
+class _Timings:
+    """Recent samples of one measurement, summarized as percentiles in milliseconds"""
+
+    def __init__(self, size: int = 1024):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds * 1000)
+
+    def summary(self) -> Dict[str, float]:
+        if not self.samples:
+            return {"p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+        ordered = sorted(self.samples)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return {
+            "p50_ms": round(statistics.median(ordered), 3),
+            "p95_ms": round(p95, 3),
+            "max_ms": round(ordered[-1], 3),
+        }
+
+
+class TaskScheduler:
+    """Bounded executor shared by all services; ``start()`` and ``stop()`` from the lifespan"""
+
+    def __init__(
+        self,
+        max_running: int = 16,
+        default_quota: int = 4,
+        quotas: Optional[Dict[str, int]] = None,
+        max_queued: int = 1000,
+        low_priority_limit: Optional[int] = None,
+        threads: int = 8,
+        processes: int = 2,
+    ):
+        self.max_running = max_running
+        self.default_quota = default_quota
+        self.quotas = dict(quotas or {})
+        self.max_queued = max_queued
+        if low_priority_limit is None:
+            low_priority_limit = max(1, max_running // 2)
+        self.low_priority_limit = low_priority_limit
+        self._thread_workers = threads
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._process_workers = processes
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self.stopping = threading.Event()
+        # priority -> service -> jobs waiting; services rotate to the end when served
+        self._queues: Dict[Priority, "OrderedDict[str, Deque[_Job]]"] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self._queued: Dict[str, int] = {}
+        self._running: Dict[str, int] = {}
+        self._running_low = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.counters: Dict[str, Dict[str, int]] = {}
+        self.wait_times = {priority: _Timings() for priority in Priority}
+        self.run_times = {priority: _Timings() for priority in Priority}
+
+    # The pools are created on first use and dropped by stop(), so a scheduler started again
+    # (the instance is process-wide, and may see more than one lifespan) gets fresh ones
+    @property
+    def threads(self) -> ThreadPoolExecutor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(
+                max_workers=self._thread_workers, thread_name_prefix="tasks"
+            )
+        return self._threads
+
+    @property
+    def processes(self) -> ProcessPoolExecutor:
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(max_workers=self._process_workers)
+        return self._processes
+
+    def quota(self, service: str) -> int:
+        return self.quotas.get(service, self.default_quota)
+
+    def _count(self, service: str, counter: str) -> None:
+        counters = self.counters.setdefault(
+            service, {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+        )
+        counters[counter] += 1
+
+    def submit(
+        self,
+        service: str,
+        func: Callable[..., Any],
+        *args,
+        priority: Priority = Priority.NORMAL,
+        mode: str = "async",
+        **kwargs,
+    ) -> asyncio.Future:
+        """Queue ``func(*args, **kwargs)``; the returned future resolves with its result
+
+        ``func`` is a coroutine function for ``mode="async"`` and a plain
+        (for ``"process"``, picklable) function otherwise. Awaiting the future
+        is optional: failures are logged either way.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode {mode!r}, expected one of {MODES}")
+        if self.stopping.is_set() or self._dispatcher is None:
+            raise RuntimeError("The task scheduler is not running")
+        if self._queued.get(service, 0) >= self.max_queued:
+            self._count(service, "rejected")
+            raise TaskQueueFull(f"{service} already has {self.max_queued} background jobs queued")
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(service, Priority(priority), func, args, kwargs, mode, future)
+        self._queues[job.priority].setdefault(service, deque()).append(job)
+        self._queued[service] = self._queued.get(service, 0) + 1
+        self._count(service, "submitted")
+        self._wakeup.set()
+        return future
+
+    def _next_job(self) -> Optional[_Job]:
+        for priority, services in self._queues.items():
+            if priority == Priority.LOW and self._running_low >= self.low_priority_limit:
+                break
+            for service in list(services):
+                if self._running.get(service, 0) >= self.quota(service):
+                    continue
+                jobs = services[service]
+                # Skip jobs whose futures were cancelled while they waited
+                while jobs:
+                    job = jobs.popleft()
+                    self._queued[service] -= 1
+                    if not job.future.cancelled():
+                        break
+                    self._count(service, "cancelled")
+                else:
+                    del services[service]
+                    continue
+                if jobs:
+                    services.move_to_end(service)
+                else:
+                    del services[service]
+                return job
+        return None
+
+    def start(self) -> None:
+        self.stopping.clear()
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                while len(self._tasks) < self.max_running:
+                    job = self._next_job()
+                    if job is None:
+                        break
+                    self._running[job.service] = self._running.get(job.service, 0) + 1
+                    self._running_low += job.priority == Priority.LOW
+                    self.wait_times[job.priority].add(time.perf_counter() - job.queued_at)
+                    task = asyncio.create_task(self._run(job))
+                    self._tasks.add(task)
+            except Exception:
+                # The dispatcher must outlive any one bad pass, or every later job would hang
+                logger.exception("Background task dispatch failed")
+
+    async def _run(self, job: _Job) -> None:
+        start = time.perf_counter()
+        try:
+            if job.mode == "async":
+                result = await job.func(*job.args, **job.kwargs)
+            else:
+                pool = self.threads if job.mode == "thread" else self.processes
+                call = functools.partial(job.func, *job.args, **job.kwargs)
+                result = await asyncio.get_running_loop().run_in_executor(pool, call)
+        except asyncio.CancelledError:
+            self._count(job.service, "cancelled")
+            job.future.cancel()
+            raise
+        except Exception as exc:
+            self._count(job.service, "failed")
+            logger.exception("Background job of %s failed", job.service)
+            if not job.future.done():
+                job.future.set_exception(exc)
+                # Nobody may be awaiting it; the failure is already logged
+                job.future.exception()
+        else:
+            self._count(job.service, "completed")
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self.run_times[job.priority].add(time.perf_counter() - start)
+            self._running[job.service] -= 1
+            self._running_low -= job.priority == Priority.LOW
+            self._tasks.discard(asyncio.current_task())
+            self._wakeup.set()
+
+    async def stop(self, grace: float = 10.0) -> None:
+        """Reject new jobs, cancel queued ones, and give running ones ``grace`` seconds"""
+        self.stopping.set()
+        for services in self._queues.values():
+            for jobs in services.values():
+                for job in jobs:
+                    job.future.cancel()
+                    self._count(job.service, "cancelled")
+            services.clear()
+        self._queued.clear()
+        if self._tasks:
+            _, pending = await asyncio.wait(set(self._tasks), timeout=grace)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning("Cancelled %d background jobs still running", len(pending))
+                await asyncio.wait(pending, timeout=1)
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        # Threads cannot be interrupted; ones still running finish in the background
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Queue depth, running jobs, counters and latencies, for the admin endpoint"""
+        depth: Dict[str, Dict[str, int]] = {}
+        for priority, services in self._queues.items():
+            for service, jobs in services.items():
+                depth.setdefault(service, {})[priority.name.lower()] = len(jobs)
+        return {
+            "running": len(self._tasks),
+            "max_running": self.max_running,
+            "queued": sum(self._queued.values()),
+            "services": {
+                service: {
+                    "running": self._running.get(service, 0),
+                    "quota": self.quota(service),
+                    "queued": depth.get(service, {}),
+                    **counters,
+                }
+                for service, counters in self.counters.items()
+            },
+            "wait": {p.name.lower(): timings.summary() for p, timings in self.wait_times.items()},
+            "run": {p.name.lower(): timings.summary() for p, timings in self.run_times.items()},
+        }
+
+
+def _env_quotas(value: str) -> Dict[str, int]:
+    """Parse ``TASK_QUOTAS`` (``notifier=8,chat=2``)"""
+    quotas = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        service, _, quota = item.partition("=")
+        quotas[service.strip()] = int(quota)
+    return quotas
+
+
+@lru_cache(maxsize=None)
+def get_task_scheduler() -> TaskScheduler:
+    """Process-wide scheduler that every service submits its background work to"""
+    return TaskScheduler(
+        max_running=int(os.getenv("TASK_MAX_RUNNING", 16)),
+        default_quota=int(os.getenv("TASK_DEFAULT_QUOTA", 4)),
+        quotas=_env_quotas(os.getenv("TASK_QUOTAS", "")),
+        max_queued=int(os.getenv("TASK_MAX_QUEUED", 1000)),
+        threads=int(os.getenv("TASK_THREADS", 8)),
+        processes=int(os.getenv("TASK_PROCESSES", 2)),
+    )